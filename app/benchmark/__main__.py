@@ -0,0 +1,84 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  __main__.py
+
+import argparse
+import json
+
+from app.benchmark.fixtures import RpcFixture
+from app.benchmark.runner import run_benchmark, is_harvester_database
+from app.benchmark.server import StandInRpcServer
+from app.utils.metadata_cache import MetadataCache
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m app.benchmark', description='Offline replay benchmark')
+    subparsers = parser.add_subparsers(dest='command')
+
+    record_parser = subparsers.add_parser('record', help='Run the benchmark against a node and record all responses')
+    record_parser.add_argument('--node', required=True, help='JSON-RPC HTTP url of the node')
+    record_parser.add_argument('--block-start', type=int, required=True)
+    record_parser.add_argument('--block-end', type=int, required=True)
+
+    replay_parser = subparsers.add_parser('replay', help='Run the benchmark with recorded responses')
+
+    for subparser in (record_parser, replay_parser):
+        subparser.add_argument('--fixture', required=True, help='Path of the (gzipped JSON) fixture file')
+        subparser.add_argument('--db', required=True,
+                               help='Connection string of a dedicated MySQL database, its tables are recreated')
+        subparser.add_argument('--no-sequencer', action='store_true', help='Only benchmark accumulation')
+
+    args = parser.parse_args()
+
+    if args.command and is_harvester_database(args.db):
+        parser.error('--db must not be the harvester database (DB_CONNECTION), all its tables are dropped')
+
+    if args.command == 'record':
+        fixture = RpcFixture(args.fixture)
+        fixture.block_start, fixture.block_end = args.block_start, args.block_end
+        server = StandInRpcServer(fixture, upstream_url=args.node)
+
+    elif args.command == 'replay':
+        fixture = RpcFixture.load(args.fixture)
+        server = StandInRpcServer(fixture)
+
+    else:
+        parser.print_help()
+        return
+
+    # Runtime metadata is requested in every run (once per process), so it is recorded and RPC counts are comparable
+    MetadataCache().clear()
+
+    server.start()
+
+    try:
+        report = run_benchmark(
+            server, args.db, fixture.block_start, fixture.block_end, sequence=not args.no_sequencer
+        )
+    finally:
+        server.stop()
+
+    if args.command == 'record':
+        fixture.save()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  fixtures.py
+
+import gzip
+import json
+
+
+class RpcFixture(object):
+    """
+    Recorded JSON-RPC responses keyed by method and params
+    """
+
+    def __init__(self, path, responses=None):
+        self.path = path
+        self.responses = responses or {}
+        self.block_start = None
+        self.block_end = None
+
+    @staticmethod
+    def get_key(method, params):
+        return json.dumps([method, params], sort_keys=True)
+
+    def get(self, method, params):
+        return self.responses.get(self.get_key(method, params))
+
+    def put(self, method, params, response):
+        self.responses[self.get_key(method, params)] = {
+            key: value for key, value in response.items() if key not in ('id', 'jsonrpc')
+        }
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt') as fixture_file:
+            data = json.load(fixture_file)
+
+        fixture = cls(path, data['responses'])
+        fixture.block_start = data['block_start']
+        fixture.block_end = data['block_end']
+
+        return fixture
+
+    def save(self):
+        with gzip.open(self.path, 'wt') as fixture_file:
+            json.dump({
+                'block_start': self.block_start,
+                'block_end': self.block_end,
+                'responses': self.responses
+            }, fixture_file)
@@ -0,0 +1,140 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  runner.py
+
+import resource
+import time
+
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+from app import settings
+from app.models.base import BaseModel
+from app.models.data import BlockTotal
+from app.processors.converters import PolkascanHarvesterService, BlockCommitBatch
+
+
+class StatementCounter(object):
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+class BenchmarkPhase(object):
+
+    def __init__(self, name, server, statement_counter):
+        self.name = name
+        self.server = server
+        self.statement_counter = statement_counter
+        self.block_count = 0
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        self.start_call_count = self.server.call_count
+        self.start_statement_count = self.statement_counter.count
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.duration = time.perf_counter() - self.start_time
+        self.call_count = self.server.call_count - self.start_call_count
+        self.statement_count = self.statement_counter.count - self.start_statement_count
+
+    def report(self):
+        blocks = max(self.block_count, 1)
+
+        return {
+            'phase': self.name,
+            'blocks': self.block_count,
+            'seconds': round(self.duration, 3),
+            'blocksPerSecond': round(self.block_count / self.duration, 2) if self.duration else None,
+            'rpcCallsPerBlock': round(self.call_count / blocks, 2),
+            'sqlStatementsPerBlock': round(self.statement_count / blocks, 2)
+        }
+
+
+def is_harvester_database(db_connection):
+    url, harvester_url = make_url(db_connection), make_url(settings.DB_CONNECTION)
+
+    return (url.host, url.port, url.database) == (harvester_url.host, harvester_url.port, harvester_url.database)
+
+
+def run_benchmark(server, db_connection, block_start, block_end, sequence=True, reset_db=True):
+    """
+    Adds the blocks of given range (from `block_end` down, like the harvester) and sequences them, with all RPC
+    calls served by `server`
+    :param server: started StandInRpcServer
+    :param db_connection: connection string of a dedicated database, all tables are dropped when `reset_db` is set
+    :param block_start:
+    :param block_end:
+    :param sequence: run the sequencer as well, only possible when the range starts at genesis
+    :param reset_db:
+    :return: dict with report per phase, missing RPC calls and peak memory
+    """
+    if is_harvester_database(db_connection):
+        raise ValueError('Benchmark database is the harvester database (DB_CONNECTION), use a dedicated database')
+
+    settings.SUBSTRATE_RPC_URL = server.url
+
+    engine = create_engine(db_connection, isolation_level="READ_UNCOMMITTED")
+
+    if reset_db:
+        BaseModel.metadata.drop_all(engine)
+        BaseModel.metadata.create_all(engine)
+
+    statement_counter = StatementCounter(engine)
+    session = scoped_session(sessionmaker(bind=engine, autoflush=False, autocommit=False))
+
+    harvester = PolkascanHarvesterService(session, type_registry=settings.TYPE_REGISTRY)
+    phases = []
+
+    with BenchmarkPhase('accumulation', server, statement_counter) as phase:
+        batch = BlockCommitBatch(harvester, settings.ACCUMULATE_COMMIT_BATCH_SIZE)
+
+        for block_id in range(block_end, block_start - 1, -1):
+            batch.add_block(harvester.substrate.get_block_hash(block_id))
+            batch.checkpoint()
+            phase.block_count += 1
+
+        batch.commit()
+
+    phases.append(phase.report())
+
+    if sequence and block_start <= 1:
+        with BenchmarkPhase('sequencing', server, statement_counter) as phase:
+            harvester.start_sequencer()
+            phase.block_count = (session.query(func.max(BlockTotal.id)).one()[0] or -1) + 1
+
+        phases.append(phase.report())
+
+    session.remove()
+    engine.dispose()
+
+    return {
+        'blockStart': block_start,
+        'blockEnd': block_end,
+        'phases': phases,
+        'missingRpcCalls': len(server.missing_calls),
+        # Kilobytes on Linux
+        'peakMemory': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
@@ -0,0 +1,106 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  server.py
+
+import json
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import requests
+
+
+class RpcRequestHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+
+        if type(payload) is list:
+            response = [self.server.process_call(call) for call in payload]
+        else:
+            response = self.server.process_call(payload)
+
+        body = json.dumps(response).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInRpcServer(ThreadingMixIn, HTTPServer):
+    """
+    JSON-RPC over HTTP server that answers from a fixture. When `upstream_url` is set, calls are forwarded to that
+    node instead and the responses are recorded in the fixture.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, fixture, upstream_url=None, port=0):
+        super().__init__(('127.0.0.1', port), RpcRequestHandler)
+        self.fixture = fixture
+        self.upstream_url = upstream_url
+        self.upstream_session = requests.Session() if upstream_url else None
+        self.call_count = 0
+        self.missing_calls = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def process_call(self, call):
+        method, params = call.get('method'), call.get('params', [])
+
+        with self.lock:
+            self.call_count += 1
+
+        if self.upstream_url:
+            response = self.upstream_session.post(self.upstream_url, json=call).json()
+
+            with self.lock:
+                self.fixture.put(method, params, response)
+        else:
+            response = self.fixture.get(method, params)
+
+            if response is None:
+                with self.lock:
+                    self.missing_calls.append((method, params))
+
+                response = {'error': {'code': -32000, 'message': 'Call not recorded in fixture'}}
+
+        return dict(response, jsonrpc='2.0', id=call.get('id'))
+
+    def reset_counters(self):
+        with self.lock:
+            self.call_count = 0
+            self.missing_calls = []
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,78 @@
+"""Added market candle table
+
+Revision ID: 4d7b1e9c2a85
+Revises: 2f8a6c3e9b47
+Create Date: 2020-05-04 11:08:23.417952
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d7b1e9c2a85'
+down_revision = '2f8a6c3e9b47'
+branch_labels = None
+depends_on = None
+
+MARKET_HISTORY_INTERVALS = ('1m', '5m', '1h', '1d')
+
+
+def upgrade():
+    op.create_table('data_market_candle',
+    sa.Column('interval', sa.String(length=8), nullable=False),
+    sa.Column('base', sa.String(length=66), nullable=False),
+    sa.Column('quote', sa.String(length=66), nullable=False),
+    sa.Column('time', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('open', sa.Numeric(precision=65, scale=0), nullable=False),
+    sa.Column('high', sa.Numeric(precision=65, scale=0), nullable=False),
+    sa.Column('low', sa.Numeric(precision=65, scale=0), nullable=False),
+    sa.Column('close', sa.Numeric(precision=65, scale=0), nullable=False),
+    sa.Column('base_amount', sa.Numeric(precision=65, scale=0), nullable=False),
+    sa.Column('quote_amount', sa.Numeric(precision=65, scale=0), nullable=False),
+    sa.PrimaryKeyConstraint('interval', 'base', 'quote', 'time')
+    )
+
+    # Copy existing candles, of duplicates per bucket the first stored candle is kept
+    for interval in MARKET_HISTORY_INTERVALS:
+        op.execute("""
+            INSERT IGNORE INTO data_market_candle
+                (`interval`, base, quote, time, open, high, low, close, base_amount, quote_amount)
+            SELECT '{interval}', base, quote, time, open, high, low, close, base_amount, quote_amount
+            FROM data_market_history_{interval}
+            ORDER BY id
+        """.format(interval=interval))
+
+        op.drop_index('ix_data_market_history_{}_base_quote'.format(interval),
+                      table_name='data_market_history_{}'.format(interval))
+        op.drop_table('data_market_history_{}'.format(interval))
+
+
+def downgrade():
+    for interval in MARKET_HISTORY_INTERVALS:
+        op.create_table('data_market_history_{}'.format(interval),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('open', sa.Numeric(precision=65, scale=0), nullable=False),
+        sa.Column('high', sa.Numeric(precision=65, scale=0), nullable=False),
+        sa.Column('low', sa.Numeric(precision=65, scale=0), nullable=False),
+        sa.Column('close', sa.Numeric(precision=65, scale=0), nullable=False),
+        sa.Column('base_amount', sa.Numeric(precision=65, scale=0), nullable=False),
+        sa.Column('quote_amount', sa.Numeric(precision=65, scale=0), nullable=False),
+        sa.Column('base', sa.String(length=66), nullable=False),
+        sa.Column('quote', sa.String(length=66), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_data_market_history_{}_base_quote'.format(interval),
+                        'data_market_history_{}'.format(interval), ['base', 'quote'], unique=False)
+
+        op.execute("""
+            INSERT INTO data_market_history_{interval}
+                (time, open, high, low, close, base_amount, quote_amount, base, quote)
+            SELECT time, open, high, low, close, base_amount, quote_amount, base, quote
+            FROM data_market_candle
+            WHERE `interval` = '{interval}'
+            ORDER BY time
+        """.format(interval=interval))
+
+    op.drop_table('data_market_candle')
@@ -0,0 +1,35 @@
+"""Added composite account activity indexes to search index
+
+Revision ID: 6a3c8f1d5e27
+Revises: 4d7b1e9c2a85
+Create Date: 2020-05-06 15:42:09.803114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a3c8f1d5e27'
+down_revision = '4d7b1e9c2a85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # One statement, so the table is rebuilt only once; account_id index is a prefix of the new indexes
+    op.execute("""
+        ALTER TABLE data_account_search_index
+            ADD INDEX ix_data_account_search_index_account_type_block (account_id, index_type_id, block_id, id),
+            ADD INDEX ix_data_account_search_index_account_block (account_id, block_id, id),
+            DROP INDEX ix_data_account_search_index_account_id
+    """)
+
+
+def downgrade():
+    op.execute("""
+        ALTER TABLE data_account_search_index
+            ADD INDEX ix_data_account_search_index_account_id (account_id),
+            DROP INDEX ix_data_account_search_index_account_type_block,
+            DROP INDEX ix_data_account_search_index_account_block
+    """)
@@ -0,0 +1,151 @@
+"""Converted account id and block hash columns of high-volume tables to binary (when BINARY_ID_COLUMNS is enabled)
+
+Revision ID: 8b2e5d9f4c16
+Revises: 6a3c8f1d5e27
+Create Date: 2020-05-08 10:17:36.250841
+
+"""
+from collections import OrderedDict
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.settings import BINARY_ID_COLUMNS
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e5d9f4c16'
+down_revision = '6a3c8f1d5e27'
+branch_labels = None
+depends_on = None
+
+# Per table the column rows are converted in chunks of, and the converted columns as tuples (name, 0x prefixed,
+# nullable); all values are 32 bytes
+BINARY_COLUMNS = OrderedDict([
+    ('data_block', ('id', [('hash', True, False), ('parent_hash', True, False)])),
+    ('data_account_audit', ('block_id', [('account_id', False, True)])),
+    ('data_account_info_snapshot', ('block_id', [('account_id', False, False)])),
+    ('data_account_search_index', ('block_id', [('account_id', False, True)])),
+    ('data_trade', ('block_id', [
+        ('buyer', False, False), ('seller', False, False), ('maker', False, False), ('taker', False, False)
+    ])),
+    ('data_order', ('block_id', [('owner', False, False)])),
+])
+
+CHUNK_SIZE = 100000
+
+# Conversion is skipped for tables that are already in the requested format, so with BINARY_ID_COLUMNS disabled both
+# directions are a no-op. To convert an existing database later on: downgrade to 6a3c8f1d5e27 and upgrade again with
+# BINARY_ID_COLUMNS enabled. Stop the harvester first, rows added during the conversion are not converted.
+
+
+def get_data_type(connection, table_name, column_name):
+    return connection.execute(sa.text("""
+        SELECT DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name AND COLUMN_NAME = :column_name
+    """), table_name=table_name, column_name=column_name).scalar()
+
+
+def get_indexes(connection, table_name, column_names):
+    """
+    :return: OrderedDict of index name and tuple (unique, list of columns) of indexes containing any of given columns
+    """
+    indexes = OrderedDict()
+
+    for index_name, non_unique, column_name in connection.execute(sa.text("""
+        SELECT INDEX_NAME, NON_UNIQUE, COLUMN_NAME FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """), table_name=table_name):
+        indexes.setdefault(index_name, (not non_unique, []))[1].append(column_name)
+
+    return OrderedDict(
+        (index_name, index) for index_name, index in indexes.items() if set(index[1]) & set(column_names)
+    )
+
+
+def convert_table(connection, table_name, to_binary):
+    chunk_column, columns = BINARY_COLUMNS[table_name]
+    column_names = [column_name for column_name, prefix, nullable in columns]
+
+    if (get_data_type(connection, table_name, column_names[0]) == 'binary') == to_binary:
+        return
+
+    def get_column_type(prefix):
+        if to_binary:
+            return 'BINARY(32)'
+
+        return 'VARCHAR({})'.format(66 if prefix else 64)
+
+    def get_value_expression(column_name, prefix):
+        if to_binary:
+            return 'UNHEX(SUBSTRING(`{}`, 3))'.format(column_name) if prefix else 'UNHEX(`{}`)'.format(column_name)
+
+        if prefix:
+            return "CONCAT('0x', LOWER(HEX(`{}`)))".format(column_name)
+
+        return 'LOWER(HEX(`{}`))'.format(column_name)
+
+    # Values are converted into new columns first, in chunks so each update only holds locks on a limited range
+    op.execute('ALTER TABLE {} {}'.format(table_name, ', '.join([
+        'ADD COLUMN `{}__new` {} NULL'.format(column_name, get_column_type(prefix))
+        for column_name, prefix, nullable in columns
+    ])))
+
+    chunk_min, chunk_max = connection.execute(
+        'SELECT MIN(`{0}`), MAX(`{0}`) FROM {1}'.format(chunk_column, table_name)
+    ).first()
+
+    if chunk_min is not None:
+        for chunk_start in range(chunk_min, chunk_max + 1, CHUNK_SIZE):
+            op.execute('UPDATE {} SET {} WHERE `{}` BETWEEN {} AND {}'.format(
+                table_name,
+                ', '.join([
+                    '`{}__new` = {}'.format(column_name, get_value_expression(column_name, prefix))
+                    for column_name, prefix, nullable in columns
+                ]),
+                chunk_column,
+                chunk_start,
+                chunk_start + CHUNK_SIZE - 1
+            ))
+
+    # Replace columns and rebuild their indexes in one statement
+    indexes = get_indexes(connection, table_name, column_names)
+
+    alter_clauses = [
+        'DROP PRIMARY KEY' if index_name == 'PRIMARY' else 'DROP INDEX `{}`'.format(index_name)
+        for index_name in indexes
+    ]
+
+    for column_name, prefix, nullable in columns:
+        alter_clauses.append('DROP COLUMN `{}`'.format(column_name))
+        alter_clauses.append('CHANGE COLUMN `{0}__new` `{0}` {1} {2}'.format(
+            column_name, get_column_type(prefix), 'NULL' if nullable else 'NOT NULL'
+        ))
+
+    for index_name, (unique, index_columns) in indexes.items():
+        index_columns = ', '.join(['`{}`'.format(column_name) for column_name in index_columns])
+
+        if index_name == 'PRIMARY':
+            alter_clauses.append('ADD PRIMARY KEY ({})'.format(index_columns))
+        else:
+            alter_clauses.append('ADD {}INDEX `{}` ({})'.format('UNIQUE ' if unique else '', index_name, index_columns))
+
+    op.execute('ALTER TABLE {} {}'.format(table_name, ', '.join(alter_clauses)))
+
+
+def upgrade():
+    if not BINARY_ID_COLUMNS:
+        return
+
+    connection = op.get_bind()
+
+    for table_name in BINARY_COLUMNS:
+        convert_table(connection, table_name, to_binary=True)
+
+
+def downgrade():
+    connection = op.get_bind()
+
+    for table_name in BINARY_COLUMNS:
+        convert_table(connection, table_name, to_binary=False)
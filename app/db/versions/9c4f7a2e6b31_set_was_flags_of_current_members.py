@@ -0,0 +1,26 @@
+"""Set was flags of current members
+
+Revision ID: 9c4f7a2e6b31
+Revises: 3e9a7c5b2d14
+Create Date: 2020-05-13 10:42:18.264519
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4f7a2e6b31'
+down_revision = '3e9a7c5b2d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Account.update_flag_members only sets `was_<flag>` for new members, repair current members flagged before
+    for flag in ['validator', 'nominator', 'council_member', 'tech_comm_member', 'registrar', 'sudo']:
+        op.execute("UPDATE data_account SET was_{flag} = 1 WHERE is_{flag} = 1 AND was_{flag} = 0".format(flag=flag))
+
+
+def downgrade():
+    # Data migration, previous values are unknown
+    pass
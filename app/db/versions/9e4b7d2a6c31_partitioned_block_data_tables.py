@@ -0,0 +1,54 @@
+"""Partitioned event, extrinsic and search index tables by block range
+
+Revision ID: 9e4b7d2a6c31
+Revises: 7c2e9a4b1d58
+Create Date: 2020-04-27 11:38:05.914472
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b7d2a6c31'
+down_revision = '7c2e9a4b1d58'
+branch_labels = None
+depends_on = None
+
+# Same bucketing as Block.range100000, new partitions are added by the harvester (PARTITION_BLOCK_RANGE)
+PARTITION_SIZE = 100000
+
+PARTITIONED_TABLES = ('data_event', 'data_extrinsic', 'data_account_search_index')
+
+
+def get_partition_definitions(block_id_max):
+    # Partitions up to and including the one after the current head, MAXVALUE partition stays empty
+    partition_definitions = [
+        'PARTITION p{} VALUES LESS THAN ({})'.format(idx, (idx + 1) * PARTITION_SIZE)
+        for idx in range(0, (block_id_max or 0) // PARTITION_SIZE + 2)
+    ]
+    partition_definitions.append('PARTITION pmax VALUES LESS THAN MAXVALUE')
+
+    return ', '.join(partition_definitions)
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    # All unique keys must contain the partitioning column
+    op.execute('ALTER TABLE data_account_search_index DROP PRIMARY KEY, ADD PRIMARY KEY (id, block_id)')
+
+    # Tables are copied, this can take a long time on large databases
+    for table_name in PARTITIONED_TABLES:
+        block_id_max = connection.execute('SELECT MAX(block_id) FROM {}'.format(table_name)).scalar()
+
+        op.execute('ALTER TABLE {} PARTITION BY RANGE (block_id) ({})'.format(
+            table_name, get_partition_definitions(block_id_max)
+        ))
+
+
+def downgrade():
+    for table_name in PARTITIONED_TABLES:
+        op.execute('ALTER TABLE {} REMOVE PARTITIONING'.format(table_name))
+
+    op.execute('ALTER TABLE data_account_search_index DROP PRIMARY KEY, ADD PRIMARY KEY (id)')
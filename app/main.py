@@ -31,7 +31,8 @@ from app.middleware.sessionmanager import SQLAlchemySessionManager
 from app.resources.harvester import PolkascanStartHarvesterResource, PolkascanStopHarvesterResource, \
     PolkascanHarvesterStatusResource, PolkascanProcessBlockResource, \
     PolkaScanCheckHarvesterTaskResource, SequenceBlockResource, StartSequenceBlockResource, StartIntegrityResource, \
-    RebuildSearchIndexResource, ProcessGenesisBlockResource, PolkascanHarvesterQueueResource, RebuildAccountInfoResource, MarketHistoryResource
+    RebuildSearchIndexResource, ProcessGenesisBlockResource, PolkascanHarvesterQueueResource, RebuildAccountInfoResource, MarketHistoryResource, \
+    MarketHistoryRollupResource, BulkLoadModeResource, AccountActivityResource, MetricsResource, MetricsJSONResource
 
 from app.resources.tools import ExtractMetadataResource, ExtractExtrinsicsResource, \
     HealthCheckResource, ExtractEventsResource, CreateSnapshotResource, \
@@ -56,12 +57,17 @@ app.add_route('/queue', PolkascanHarvesterQueueResource())
 app.add_route('/process', PolkascanProcessBlockResource())
 app.add_route('/sequence', SequenceBlockResource())
 app.add_route('/market', MarketHistoryResource())
+app.add_route('/market/rollup', MarketHistoryRollupResource())
 
 app.add_route('/sequencer/start', StartSequenceBlockResource())
 app.add_route('/integrity-check', StartIntegrityResource())
 app.add_route('/process-genesis', ProcessGenesisBlockResource())
 app.add_route('/rebuild-searchindex', RebuildSearchIndexResource())
+app.add_route('/account/{account_id}/activity', AccountActivityResource())
 app.add_route('/rebuild-balances', RebuildAccountInfoResource())
+app.add_route('/bulk-load', BulkLoadModeResource())
+app.add_route('/metrics', MetricsResource())
+app.add_route('/metrics/json', MetricsJSONResource())
 app.add_route('/task/result/{task_id}', PolkaScanCheckHarvesterTaskResource())
 
 app.add_route('/tools/metadata/extract', ExtractMetadataResource())
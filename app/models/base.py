@@ -18,15 +18,123 @@
 #
 #  base.py
 
+from collections import OrderedDict
+
 from dictalchemy import DictableModel
+from sqlalchemy import inspect, String
+from sqlalchemy.dialects.mysql import BINARY
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TypeDecorator
+
+from app import settings
+
+
+class HexBinary(TypeDecorator):
+    """
+    Hex string at the ORM boundary, stored as BINARY of `length` bytes when BINARY_ID_COLUMNS is enabled and as the
+    hex string otherwise
+    """
+
+    impl = String
+
+    def __init__(self, length, prefix=False, **kwargs):
+        """
+        :param length: amount of bytes
+        :param prefix: hex strings are prefixed with 0x
+        """
+        self.byte_length = length
+        self.prefix = prefix
+        super().__init__(length * 2 + (2 if prefix else 0), **kwargs)
+
+    def load_dialect_impl(self, dialect):
+        if settings.BINARY_ID_COLUMNS:
+            return dialect.type_descriptor(BINARY(self.byte_length))
+
+        return dialect.type_descriptor(String(self.impl.length))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not settings.BINARY_ID_COLUMNS:
+            return value
+
+        if value[0:2] == '0x':
+            value = value[2:]
+
+        return bytes.fromhex(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or not settings.BINARY_ID_COLUMNS:
+            return value
+
+        return '{}{}'.format('0x' if self.prefix else '', value.hex())
+
+
+class BulkInsertBuffer(object):
+    """
+    Collects new rows of models with `bulk_insert` enabled instead of flushing them one by one, each table is written
+    with a multi-row INSERT on `flush()`. Only use for rows of which no generated key is needed before the flush.
+    Optionally `accept` decides per row if it is written at all.
+    """
+
+    session_key = 'bulk_insert_buffer'
+
+    def __init__(self, session, accept=None):
+        self.session = session
+        self.accept = accept
+        self.objects = OrderedDict()
+
+    def __enter__(self):
+        self.session.info[self.session_key] = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.session.info.pop(self.session_key, None)
+
+        if exc_type is None:
+            self.flush()
+        else:
+            self.objects.clear()
+
+    @classmethod
+    def get_active(cls, session):
+        return session.info.get(cls.session_key)
+
+    @classmethod
+    def flush_session(cls, session):
+        bulk_insert_buffer = cls.get_active(session)
+        if bulk_insert_buffer:
+            bulk_insert_buffer.flush()
+
+    def add(self, obj):
+        if self.accept and not self.accept(obj):
+            return
+
+        # Keyed by object identity, so saving the same object again does not result in a duplicate row
+        self.objects.setdefault(obj.__class__, OrderedDict())[id(obj)] = obj
+
+    def flush(self):
+        for model_class, objects in self.objects.items():
+            columns = [column.key for column in inspect(model_class).column_attrs]
+
+            # Unset attributes are omitted so column defaults apply, like in a regular flush
+            self.session.bulk_insert_mappings(model_class, [
+                {key: getattr(obj, key) for key in columns if getattr(obj, key) is not None} for obj in objects.values()
+            ])
+
+        self.objects.clear()
 
 
 class BaseModelObj(DictableModel):
 
     serialize_exclude = None
+    bulk_insert = False
 
     def save(self, session):
+        if self.bulk_insert:
+            bulk_insert_buffer = BulkInsertBuffer.get_active(session)
+            if bulk_insert_buffer and inspect(self).transient:
+                bulk_insert_buffer.add(self)
+                return
+
         session.add(self)
         session.flush()
 
@@ -19,11 +19,11 @@
 #  data.py
 
 import sqlalchemy as sa
-from sqlalchemy import text
 from sqlalchemy.dialects.mysql import LONGTEXT
 from sqlalchemy.orm import relationship
 
-from app.models.base import BaseModel
+from app.models.base import BaseModel, HexBinary
+from app.models.harvester import HarvestedBlockRange
 
 
 class Block(BaseModel):
@@ -35,8 +35,8 @@ class Block(BaseModel):
 
     id = sa.Column(sa.Integer(), primary_key=True, autoincrement=False)
     parent_id = sa.Column(sa.Integer(), nullable=False)
-    hash = sa.Column(sa.String(66), unique=True, index=True, nullable=False)
-    parent_hash = sa.Column(sa.String(66), index=True, nullable=False)
+    hash = sa.Column(HexBinary(32, prefix=True), unique=True, index=True, nullable=False)
+    parent_hash = sa.Column(HexBinary(32, prefix=True), index=True, nullable=False)
     state_root = sa.Column(sa.String(66), nullable=False)
     extrinsics_root = sa.Column(sa.String(66), nullable=False)
     count_extrinsics = sa.Column(sa.Integer(), nullable=False)
@@ -98,22 +98,7 @@ class Block(BaseModel):
 
     @classmethod
     def get_missing_block_ids(cls, session):
-        return session.execute(text("""
-                                            SELECT
-                                              z.expected as block_from, z.got-1 as block_to
-                                            FROM (
-                                             SELECT
-                                              @rownum:=@rownum+1 AS expected,
-                                              IF(@rownum=id, 0, @rownum:=id) AS got
-                                             FROM
-                                              (SELECT @rownum:=0) AS a
-                                              JOIN data_block
-                                              ORDER BY id
-                                             ) AS z
-                                            WHERE z.got!=0
-                                            ORDER BY block_from DESC
-                                            """)
-                               )
+        return HarvestedBlockRange.get_missing_ranges(session)
 
 
 class BlockTotal(BaseModel):
@@ -164,6 +149,7 @@ class BlockTotal(BaseModel):
 
 class Event(BaseModel):
     __tablename__ = 'data_event'
+    bulk_insert = True
 
     block_id = sa.Column(sa.Integer(), primary_key=True, index=True)
     block = relationship(Block, foreign_keys=[
@@ -194,6 +180,7 @@ class Event(BaseModel):
 
 class Extrinsic(BaseModel):
     __tablename__ = 'data_extrinsic'
+    bulk_insert = True
 
     block_id = sa.Column(sa.Integer(), primary_key=True, index=True)
     block = relationship(Block, foreign_keys=[
@@ -237,6 +224,7 @@ class Extrinsic(BaseModel):
 
 class Log(BaseModel):
     __tablename__ = 'data_log'
+    bulk_insert = True
 
     block_id = sa.Column(sa.Integer(), primary_key=True, autoincrement=False)
     log_idx = sa.Column(sa.Integer(), primary_key=True, autoincrement=False)
@@ -294,12 +282,43 @@ class Account(BaseModel):
     created_at_block = sa.Column(sa.Integer(), nullable=False)
     updated_at_block = sa.Column(sa.Integer(), nullable=False)
 
+    @classmethod
+    def update_flag_members(cls, session, flag, account_ids):
+        """
+        Sets `is_<flag>` for exactly given accounts and `was_<flag>` for given accounts. The current members are
+        retrieved via the index on `is_<flag>`, so only accounts of which the flag changes are updated
+        :param session:
+        :param flag: e.g. validator, nominator, council_member or registrar
+        :param account_ids: new members
+        :return: tuple of sets (added account ids, removed account ids)
+        """
+        is_column = getattr(cls, 'is_{}'.format(flag))
+        was_column = getattr(cls, 'was_{}'.format(flag))
+
+        account_ids = set(account_ids)
+        current_ids = {account_id for account_id, in session.query(cls.id).filter(is_column == True)}
+
+        added_ids = account_ids - current_ids
+        removed_ids = current_ids - account_ids
+
+        if removed_ids:
+            cls.query(session).filter(cls.id.in_(removed_ids)).update(
+                {is_column: False}, synchronize_session='fetch'
+            )
+
+        if added_ids:
+            cls.query(session).filter(cls.id.in_(added_ids)).update(
+                {is_column: True, was_column: True}, synchronize_session='fetch'
+            )
+
+        return added_ids, removed_ids
+
 
 class AccountAudit(BaseModel):
     __tablename__ = 'data_account_audit'
 
     id = sa.Column(sa.Integer(), primary_key=True, autoincrement=True)
-    account_id = sa.Column(sa.String(64))
+    account_id = sa.Column(HexBinary(32))
     block_id = sa.Column(sa.Integer(), index=True, nullable=False)
     extrinsic_idx = sa.Column(sa.Integer())
     event_idx = sa.Column(sa.Integer())
@@ -311,7 +330,7 @@ class AccountInfoSnapshot(BaseModel):
     __tablename__ = 'data_account_info_snapshot'
 
     block_id = sa.Column(sa.Integer(), primary_key=True, index=True)
-    account_id = sa.Column(sa.String(64), primary_key=True, index=True)
+    account_id = sa.Column(HexBinary(32), primary_key=True, index=True)
 
     balance_total = sa.Column(sa.Numeric(precision=65, scale=0), nullable=True, index=True)
     balance_free = sa.Column(sa.Numeric(precision=65, scale=0), nullable=True, index=True)
@@ -360,6 +379,9 @@ class SessionValidator(BaseModel):
     count_nominators = sa.Column(sa.Integer(), nullable=True)
     unstake_threshold = sa.Column(sa.Integer(), nullable=True)
     commission = sa.Column(sa.Numeric(precision=65, scale=0), nullable=True)
+    # List of [nominator_stash, bonded] in order of rank, instead of SessionNominator rows when
+    # SESSION_COMPACT_EXPOSURES is enabled
+    exposures = sa.Column(sa.JSON(), default=None, server_default=None, nullable=True)
 
 
 class SessionNominator(BaseModel):
@@ -983,10 +1005,10 @@ class Trade(BaseModel):
     event_idx = sa.Column(sa.Integer())
     base = sa.Column(sa.String(66), nullable=False)
     quote = sa.Column(sa.String(66), nullable=False)
-    buyer = sa.Column(sa.String(64), nullable=False)
-    seller = sa.Column(sa.String(64), nullable=False)
-    maker = sa.Column(sa.String(64), nullable=False)
-    taker = sa.Column(sa.String(64), nullable=False)
+    buyer = sa.Column(HexBinary(32), nullable=False)
+    seller = sa.Column(HexBinary(32), nullable=False)
+    maker = sa.Column(HexBinary(32), nullable=False)
+    taker = sa.Column(HexBinary(32), nullable=False)
     otype = sa.Column(sa.SmallInteger(), nullable=False)
     price = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
     base_amount = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
@@ -1006,7 +1028,7 @@ class Orders(BaseModel):
     event_idx = sa.Column(sa.Integer())
     base = sa.Column(sa.String(66), nullable=False)
     quote = sa.Column(sa.String(66), nullable=False)
-    owner = sa.Column(sa.String(64), nullable=False)
+    owner = sa.Column(HexBinary(32), nullable=False)
     otype = sa.Column(sa.SmallInteger(), nullable=False)
     price = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
     buy_amount = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
@@ -1016,76 +1038,23 @@ class Orders(BaseModel):
         return '{}'.format(self.order_hash)
 
 
-class MarketHistory_1m(BaseModel):
-    __tablename__ = 'data_market_history_1m'
-    __table_args__ = (
-        sa.Index('ix_data_market_history_1m_base_quote', 'base', 'quote'),)
-    serialize_exclude = ["id"]
-
-    id = sa.Column(sa.Integer(), primary_key=True)
-    time = sa.Column(sa.DateTime(timezone=True), nullable=False)
-    open = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    high = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    low = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    close = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    base_amount = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    quote_amount = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    base = sa.Column(sa.String(66), nullable=False)
-    quote = sa.Column(sa.String(66), nullable=False)
-
-
-class MarketHistory_5m(BaseModel):
-    __tablename__ = 'data_market_history_5m'
-    __table_args__ = (
-        sa.Index('ix_data_market_history_5m_base_quote', 'base', 'quote'),)
-    serialize_exclude = ["id"]
-
-    id = sa.Column(sa.Integer(), primary_key=True)
-    time = sa.Column(sa.DateTime(timezone=True), nullable=False)
-    open = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    high = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    low = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    close = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    base_amount = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    quote_amount = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    base = sa.Column(sa.String(66), nullable=False)
-    quote = sa.Column(sa.String(66), nullable=False)
-
-
-class MarketHistory_1h(BaseModel):
-    __tablename__ = 'data_market_history_1h'
-    __table_args__ = (
-        sa.Index('ix_data_market_history_1h_base_quote', 'base', 'quote'),)
-    serialize_exclude = ["id"]
+class MarketCandle(BaseModel):
+    __tablename__ = 'data_market_candle'
+    serialize_exclude = ["interval"]
 
-    id = sa.Column(sa.Integer(), primary_key=True)
-    time = sa.Column(sa.DateTime(timezone=True), nullable=False)
+    interval = sa.Column(sa.String(8), primary_key=True)
+    base = sa.Column(sa.String(66), primary_key=True)
+    quote = sa.Column(sa.String(66), primary_key=True)
+    time = sa.Column(sa.DateTime(timezone=True), primary_key=True)
     open = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
     high = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
     low = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
     close = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
     base_amount = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
     quote_amount = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    base = sa.Column(sa.String(66), nullable=False)
-    quote = sa.Column(sa.String(66), nullable=False)
-
-
-class MarketHistory_1d(BaseModel):
-    __tablename__ = 'data_market_history_1d'
-    __table_args__ = (
-        sa.Index('ix_data_market_history_1d_base_quote', 'base', 'quote'),)
-    serialize_exclude = ["id"]
 
-    id = sa.Column(sa.Integer(), primary_key=True)
-    time = sa.Column(sa.DateTime(timezone=True), nullable=False)
-    open = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    high = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    low = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    close = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    base_amount = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    quote_amount = sa.Column(sa.Numeric(precision=65, scale=0), nullable=False)
-    base = sa.Column(sa.String(66), nullable=False)
-    quote = sa.Column(sa.String(66), nullable=False)
+    def serialize_id(self):
+        return '{}-{}-{}-{}'.format(self.interval, self.base, self.quote, self.time)
 
 
 class IdentityAudit(BaseModel):
@@ -1132,12 +1101,46 @@ class SearchIndexType(BaseModel):
 
 class SearchIndex(BaseModel):
     __tablename__ = 'data_account_search_index'
+    __table_args__ = (
+        # Activity of an account (of a type) latest first, InnoDB scans these backwards for descending order
+        sa.Index('ix_data_account_search_index_account_type_block', 'account_id', 'index_type_id', 'block_id', 'id'),
+        sa.Index('ix_data_account_search_index_account_block', 'account_id', 'block_id', 'id'),
+    )
+    bulk_insert = True
 
     id = sa.Column(sa.Integer(), primary_key=True, autoincrement=True)
-    block_id = sa.Column(sa.Integer(), nullable=False, index=True)
+    # Part of primary key as the table is partitioned by block_id
+    block_id = sa.Column(sa.Integer(), primary_key=True, autoincrement=False, index=True)
     extrinsic_idx = sa.Column(sa.Integer(), nullable=True, index=True)
     event_idx = sa.Column(sa.Integer(), nullable=True, index=True)
-    account_id = sa.Column(sa.String(64), nullable=True, index=True)
+    # Indexed as leading column of the composite indexes
+    account_id = sa.Column(HexBinary(32), nullable=True)
     index_type_id = sa.Column(sa.Integer(), nullable=False, index=True)
     sorting_value = sa.Column(sa.Numeric(precision=65, scale=0), nullable=True, index=True)
 
+    @classmethod
+    def get_account_activity(cls, session, account_id, index_type_id=None, before=None, limit=25):
+        """
+        Index rows of given account latest first, paginated by the position of the last row of the previous page
+        instead of an offset, so each page only reads its own rows from the index
+        :param session:
+        :param account_id:
+        :param index_type_id: optional index type
+        :param before: tuple (block_id, id) of the last row of the previous page
+        :param limit:
+        :return: list of SearchIndex
+        """
+        query = cls.query(session).filter(cls.account_id == account_id)
+
+        if index_type_id is not None:
+            query = query.filter(cls.index_type_id == index_type_id)
+
+        if before:
+            block_id, search_index_id = before
+            query = query.filter(sa.or_(
+                cls.block_id < block_id,
+                sa.and_(cls.block_id == block_id, cls.id < search_index_id)
+            ))
+
+        return query.order_by(cls.block_id.desc(), cls.id.desc()).limit(limit).all()
+
@@ -46,3 +46,136 @@ class Setting(BaseModel):
     key = sa.Column(sa.String(64), primary_key=True)
     value = sa.Column(sa.String(255))
     notes = sa.Column(sa.String(255))
+
+
+class BackfillRange(BaseModel):
+    __tablename__ = 'harvester_backfill_range'
+    id = sa.Column(sa.Integer(), primary_key=True, autoincrement=True)
+    block_start = sa.Column(sa.Integer(), nullable=False)
+    block_end = sa.Column(sa.Integer(), nullable=False)
+    block_cursor = sa.Column(sa.Integer(), nullable=False)
+    complete = sa.Column(sa.Boolean(), default=False, nullable=False, index=True)
+    task_id = sa.Column(sa.String(64))
+    last_modified = sa.Column(sa.DateTime(timezone=True))
+
+    @classmethod
+    def create_ranges(cls, session, block_start, block_end, range_size):
+        ranges = []
+
+        for range_start in range(block_start, block_end + 1, range_size):
+            backfill_range = cls(
+                block_start=range_start,
+                block_end=min(range_start + range_size - 1, block_end),
+                block_cursor=range_start,
+                complete=False
+            )
+            backfill_range.save(session)
+            ranges.append(backfill_range)
+
+        return ranges
+
+
+class RuntimeVersionRange(BaseModel):
+    __tablename__ = 'harvester_runtime_version_range'
+    block_start = sa.Column(sa.Integer(), primary_key=True, autoincrement=False)
+    block_end = sa.Column(sa.Integer(), nullable=False)
+    spec_version = sa.Column(sa.Integer(), nullable=False)
+
+
+class HarvestedBlockRange(BaseModel):
+    __tablename__ = 'harvester_block_range'
+    block_start = sa.Column(sa.Integer(), primary_key=True, autoincrement=False)
+    block_end = sa.Column(sa.Integer(), nullable=False, index=True)
+
+    @classmethod
+    def add_block_id(cls, session, block_id):
+        """
+        Extends the range adjacent to given block number or creates a new range. Ranges on both sides are not
+        merged to keep the update a single row lock, adjacent ranges are merged by `compact`
+        :param session:
+        :param block_id:
+        :return:
+        """
+        # Blocks are mostly accumulated from child to parent, so try to extend a range downwards first
+        if session.query(cls).filter_by(block_start=block_id + 1).update(
+                {cls.block_start: block_id}, synchronize_session=False):
+            return
+
+        if session.query(cls).filter_by(block_end=block_id - 1).update(
+                {cls.block_end: block_id}, synchronize_session=False):
+            return
+
+        session.add(cls(block_start=block_id, block_end=block_id))
+        session.flush()
+
+    @classmethod
+    def remove_block_id(cls, session, block_id):
+        block_range = session.query(cls).filter(
+            cls.block_start <= block_id, cls.block_end >= block_id
+        ).with_for_update().first()
+
+        if not block_range:
+            return
+
+        if block_range.block_start == block_range.block_end:
+            session.delete(block_range)
+        elif block_range.block_start == block_id:
+            session.delete(block_range)
+            session.add(cls(block_start=block_id + 1, block_end=block_range.block_end))
+        elif block_range.block_end == block_id:
+            block_range.block_end = block_id - 1
+        else:
+            session.add(cls(block_start=block_id + 1, block_end=block_range.block_end))
+            block_range.block_end = block_id - 1
+
+        session.flush()
+
+    @classmethod
+    def compact(cls, session):
+        """
+        Merges adjacent ranges
+        :param session:
+        :return: number of merged ranges
+        """
+        merged = 0
+        previous_range = None
+
+        for block_range in session.query(cls).order_by(cls.block_start).with_for_update():
+            if previous_range and block_range.block_start <= previous_range.block_end + 1:
+                previous_range.block_end = max(previous_range.block_end, block_range.block_end)
+                session.delete(block_range)
+                merged += 1
+            else:
+                previous_range = block_range
+
+        session.flush()
+
+        return merged
+
+    @classmethod
+    def get_missing_ranges(cls, session):
+        """
+        Gaps between harvested ranges, starting from block 1
+        :param session:
+        :return: list of dicts with `block_from` and `block_to`, highest first
+        """
+        missing_ranges = []
+        block_expected = 1
+
+        for block_start, block_end in session.query(cls.block_start, cls.block_end).order_by(cls.block_start):
+            if block_start > block_expected:
+                missing_ranges.append({'block_from': block_expected, 'block_to': block_start - 1})
+
+            block_expected = max(block_expected, block_end + 1)
+
+        missing_ranges.reverse()
+
+        return missing_ranges
+
+
+class Metric(BaseModel):
+    __tablename__ = 'harvester_metric'
+    name = sa.Column(sa.String(64), primary_key=True)
+    labels = sa.Column(sa.String(255), primary_key=True)
+    le = sa.Column(sa.String(16), primary_key=True)
+    value = sa.Column(sa.Float(precision=53), nullable=False)
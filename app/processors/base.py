@@ -34,42 +34,74 @@ class Singleton(type):
 
 
 class ProcessorRegistry(metaclass=Singleton):
+    """
+    Dispatch tables of processor classes, built once. Event and extrinsic processors are keyed by tuples
+    (module_id, event_id) and (module_id, call_id); per hook only the classes that override it are listed, so hooks
+    that are not implemented are never called.
+    """
 
-    registry = {'event': {}, 'extrinsic': {}, 'block': []}
+    HOOKS = (
+        'initialization_hook', 'accumulation_hook', 'accumulation_revert', 'sequencing_hook', 'aggregation_hook',
+        'process_search_index'
+    )
 
     @classmethod
     def all_subclasses(cls, class_):
-        return set(class_.__subclasses__()).union(
-            [s for c in class_.__subclasses__() for s in cls.all_subclasses(c)])
+        # In order of definition, for a deterministic processing order
+        subclasses = []
 
-    def __init__(self):
-        for cls in self.all_subclasses(EventProcessor):
-            key = '{}-{}'.format(cls.module_id, cls.event_id)
-
-            if key not in self.registry['event']:
-                self.registry['event'][key] = []
-
-            self.registry['event']['{}-{}'.format(cls.module_id, cls.event_id)].append(cls)
-
-        for cls in self.all_subclasses(ExtrinsicProcessor):
-            key = '{}-{}'.format(cls.module_id, cls.call_id)
+        for subclass in class_.__subclasses__():
+            for c in [subclass] + cls.all_subclasses(subclass):
+                if c not in subclasses:
+                    subclasses.append(c)
 
-            if key not in self.registry['extrinsic']:
-                self.registry['extrinsic'][key] = []
+        return subclasses
 
-            self.registry['extrinsic'][key].append(cls)
+    @staticmethod
+    def overrides_hook(processor_class, base_class, hook):
+        return getattr(processor_class, hook, None) is not getattr(base_class, hook, None)
 
-        for cls in self.all_subclasses(BlockProcessor):
-            self.registry['block'].append(cls)
-
-    def get_event_processors(self, module_id, event_id):
-        return self.registry['event'].get('{}-{}'.format(module_id, event_id), [])
-
-    def get_extrinsic_processors(self, module_id, call_id):
-        return self.registry['extrinsic'].get('{}-{}'.format(module_id, call_id), [])
-
-    def get_block_processors(self):
-        return self.registry['block']
+    def __init__(self):
+        # Keyed by hook, None holds all processors
+        self.registry = {
+            'event': {hook: {} for hook in (None,) + self.HOOKS},
+            'extrinsic': {hook: {} for hook in (None,) + self.HOOKS},
+            'block': {}
+        }
+
+        for processor_class in self.all_subclasses(EventProcessor):
+            self.register(
+                'event', EventProcessor, (processor_class.module_id, processor_class.event_id), processor_class
+            )
+
+        for processor_class in self.all_subclasses(ExtrinsicProcessor):
+            self.register(
+                'extrinsic', ExtrinsicProcessor, (processor_class.module_id, processor_class.call_id), processor_class
+            )
+
+        block_processors = self.all_subclasses(BlockProcessor)
+
+        self.registry['block'][None] = tuple(block_processors)
+
+        for hook in self.HOOKS:
+            self.registry['block'][hook] = tuple(
+                [c for c in block_processors if self.overrides_hook(c, BlockProcessor, hook)]
+            )
+
+    def register(self, processor_type, base_class, key, processor_class):
+        for hook in (None,) + self.HOOKS:
+            if hook is None or self.overrides_hook(processor_class, base_class, hook):
+                dispatch_table = self.registry[processor_type][hook]
+                dispatch_table[key] = dispatch_table.get(key, ()) + (processor_class,)
+
+    def get_event_processors(self, module_id, event_id, hook=None):
+        return self.registry['event'][hook].get((module_id, event_id), ())
+
+    def get_extrinsic_processors(self, module_id, call_id, hook=None):
+        return self.registry['extrinsic'][hook].get((module_id, call_id), ())
+
+    def get_block_processors(self, hook=None):
+        return self.registry['block'][hook]
 
 
 class Processor(object):
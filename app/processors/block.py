@@ -19,26 +19,24 @@
 #  block.py
 #
 import binascii
+from collections import OrderedDict
 import dateutil
-import datetime
 
 from sqlalchemy import distinct
 
-from sqlalchemy.orm.exc import NoResultFound
 from substrateinterface.utils.hasher import blake2_256
 
 from app import settings
 from substrateinterface.utils.hasher import blake2_256
 
-from sqlalchemy.sql import func
 from app.models.data import Log, AccountAudit, Account, AccountIndexAudit, AccountIndex, \
-    SessionValidator, IdentityAudit, IdentityJudgementAudit, IdentityJudgement, SearchIndex, AccountInfoSnapshot, \
-Block, Trade, MarketHistory_1m, MarketHistory_5m, MarketHistory_1h, MarketHistory_1d
+    SessionValidator, IdentityAudit, IdentityJudgementAudit, IdentityJudgement, SearchIndex, AccountInfoSnapshot
 
 from app.utils.ss58 import ss58_encode, ss58_encode_account_index
 from scalecodec.base import ScaleBytes, RuntimeConfiguration
 
 from app.processors.base import BlockProcessor
+from app.processors.market import CandleEngine
 from scalecodec.block import LogDigest
 
 
@@ -196,10 +194,43 @@ class AccountBlockProcessor(BlockProcessor):
 
     def sequencing_hook(self, db_session, parent_block_data, parent_sequenced_block_data):
 
-        for account_audit in AccountAudit.query(db_session).filter_by(block_id=self.block.id).order_by('event_idx'):
+        account_audits = AccountAudit.query(db_session).filter_by(block_id=self.block.id).order_by('event_idx').all()
+
+        if not account_audits:
+            return
+
+        account_ids = list(OrderedDict.fromkeys([account_audit.account_id for account_audit in account_audits]))
+
+        # Retrieve all affected accounts at once
+        accounts = {
+            account.id: account for account in Account.query(db_session).filter(Account.id.in_(account_ids))
+        }
+
+        new_account_ids = [account_id for account_id in account_ids if account_id not in accounts]
+
+        account_indices = {}
+        account_infos = {}
+
+        if new_account_ids:
+            # Retrieve indices of new accounts
+            for account_index in AccountIndex.query(db_session).filter(AccountIndex.account_id.in_(new_account_ids)):
+                account_indices.setdefault(account_index.account_id, account_index)
+
+            # Retrieve initial balances of new accounts in batched requests
             try:
-                account = Account.query(db_session).filter_by(
-                    id=account_audit.account_id).one()
+                account_infos = dict(zip(new_account_ids, self.substrate.get_runtime_state_batch(
+                    [('System', 'Account', ['0x{}'.format(account_id)]) for account_id in new_account_ids],
+                    block_hash=self.block.hash
+                )))
+            except ValueError:
+                pass
+
+        new_accounts = []
+
+        for account_audit in account_audits:
+            account = accounts.get(account_audit.account_id)
+
+            if account:
 
                 if account_audit.type_id == settings.ACCOUNT_AUDIT_TYPE_REAPED:
                     account.count_reaped += 1
@@ -210,7 +241,7 @@ class AccountBlockProcessor(BlockProcessor):
 
                 account.updated_at_block = self.block.id
 
-            except NoResultFound:
+            else:
 
                 account = Account(
                     id=account_audit.account_id,
@@ -221,40 +252,35 @@ class AccountBlockProcessor(BlockProcessor):
                     was_sudo=(account_audit.data or {}).get('is_sudo', False),
                     created_at_block=self.block.id,
                     updated_at_block=self.block.id,
-                    balance=0
+                    balance=0,
+                    # Set explicitly as following audits in this block can update it before the insert
+                    count_reaped=0
                 )
 
-               # Retrieve index in corresponding account
-                account_index = AccountIndex.query(db_session).filter_by(account_id=account.id).first()
+                account_index = account_indices.get(account.id)
 
                 if account_index:
 
                     account.index_address = account_index.short_address
 
-                # Retrieve and set initial balance
-                try:
-                    account_info_data = self.substrate.get_runtime_state(
-                        module='System',
-                        storage_function='Account',
-                        params=['0x{}'.format(account.id)],
-                        block_hash=self.block.hash
-                    ).get('result')
+                # Set initial balance
+                account_info_data = account_infos.get(account.id)
+
+                if account_info_data:
 
-                    if account_info_data:
+                    account.balance_free = account_info_data["data"]["free"]
+                    account.balance_reserved = account_info_data["data"]["reserved"]
+                    account.balance_total = account_info_data["data"]["free"] + account_info_data["data"]["reserved"]
+                    account.nonce = account_info_data["nonce"]
 
-                        account.balance_free = account_info_data["data"]["free"]
-                        account.balance_reserved = account_info_data["data"]["reserved"]
-                        account.balance_total = account_info_data["data"]["free"] + account_info_data["data"]["reserved"]
-                        account.nonce = account_info_data["nonce"]
-                except ValueError:
-                    pass
+                # Following audits of this account in the block update the new account
+                accounts[account.id] = account
+                new_accounts.append(account)
 
-                # # If reaped but does not exist, create new account for now
-                # if account_audit.type_id != ACCOUNT_AUDIT_TYPE_NEW:
-                #     account.is_reaped = True
-                #     account.count_reaped = 1
+        # Insert new and update existing accounts in one flush
+        db_session.add_all(new_accounts)
+        db_session.flush()
 
-            account.save(db_session)
 
 class AccountIndexBlockProcessor(BlockProcessor):
 
@@ -514,347 +540,9 @@ class AccountInfoBlockProcessor(BlockProcessor):
                 account.save(db_session)
 
 
-class MarketHistory1mBlockProcessor(BlockProcessor):
-    def sequencing_hook(self, db_session, parent_block_data, parent_sequenced_block_data):
-        current_block_time = self.block.datetime.replace(
-            second=0, microsecond=0)
-        latest_time = current_block_time - datetime.timedelta(minutes=1)
-
-        current_base_quote_history = db_session.query(MarketHistory_1m.base, MarketHistory_1m.quote, func.max(MarketHistory_1m.time).label("time")).filter(
-            MarketHistory_1m.time == current_block_time).group_by(MarketHistory_1m.base, MarketHistory_1m.quote).all()
-        lastest_base_quote_history = db_session.query(MarketHistory_1m.base, MarketHistory_1m.quote, func.max(MarketHistory_1m.time).label("time")).filter(
-            MarketHistory_1m.time == latest_time).group_by(MarketHistory_1m.base, MarketHistory_1m.quote).all()
-
-        # curent -> next 1m all trades
-        from_time = current_block_time
-        to_time = from_time + \
-            datetime.timedelta(minutes=1)
-        block_scope = db_session.query(func.min(Block.id).label("from_id"), func.max(Block.id).label(
-        "to_id")).filter(Block.datetime >= from_time, Block.datetime < to_time).order_by(Block.id).one()
-        trades_result = db_session.query(Trade.base, Trade.quote, func.sum(Trade.base_amount).label("base_amount"), func.sum(Trade.quote_amount).label("quote_amount"), func.min(Trade.price).label("low"), func.max(Trade.price).label("high")).filter(Trade.block_id >= block_scope.from_id, Trade.block_id <= block_scope.to_id).group_by(Trade.base, Trade.quote).all()
-
-
-        for trades in trades_result:
-            open_result = db_session.query(Trade.price).filter(
-                Trade.block_id >= block_scope.from_id, Trade.block_id <= block_scope.to_id, Trade.base == trades.base, Trade.quote == trades.quote).order_by(Trade.block_id.asc(), Trade.event_idx.asc()).limit(1).one()
-
-            closed_result = db_session.query(Trade.price).filter(
-                Trade.block_id >= block_scope.from_id, Trade.block_id <= block_scope.to_id, Trade.base==trades.base, Trade.quote==trades.quote).order_by(Trade.block_id.desc(), Trade.event_idx.desc()).limit(1).one()
-
-            matched = False
-            for current_base_quote in current_base_quote_history:
-                if trades.base == current_base_quote.base and trades.quote == current_base_quote.quote:
-                    matched = True
-                    break
-
-            if matched:  # update last market record
-                record = MarketHistory_1m.query(
-                        db_session).filter_by(base=trades.base, quote=trades.quote, time=current_block_time).first()
-                record.open = open_result[0]
-                record.high = trades.high
-                record.low = trades.low
-                record.close = closed_result[0]
-                record.base_amount = trades.base_amount
-                record.quote_amount = trades.quote_amount
-                record.save(db_session)
-            else:
-                model = MarketHistory_1m(
-                    time=from_time,
-                    open=open_result[0],
-                    high=trades.high,
-                    low=trades.low,
-                    close=closed_result[0],
-                    base_amount=trades.base_amount,
-                    quote_amount=trades.quote_amount,
-                    base=trades.base,
-                    quote=trades.quote
-                )
-
-                model.save(db_session)
-
-        # prev record exist, but not exist current block, will record empty in current scope
-        for latest_base_quote in lastest_base_quote_history:
-            matched = False
-
-            for trades in trades_result: # not exist current block
-                if latest_base_quote.base == trades.base and latest_base_quote.quote == trades.quote:
-                    matched = True
-                    break
-            for base_quote_history in current_base_quote_history: # not exist current record
-                if latest_base_quote.base == base_quote_history.base and latest_base_quote.quote == base_quote_history.quote:
-                    matched = True
-                    break
-
-            if not matched:
-                record = MarketHistory_1m.query(
-                    db_session).filter_by(base=latest_base_quote.base, quote=latest_base_quote.quote, time=latest_base_quote.time).first()
-                model = MarketHistory_1m(
-                    time=from_time,
-                    open=record.close,
-                    high=record.close,
-                    low=record.close,
-                    close=record.close,
-                    base_amount=0,
-                    quote_amount=0,
-                    base=latest_base_quote.base,
-                    quote=latest_base_quote.quote
-                )
-
-                model.save(db_session)
-
-class MarketHistory5mBlockProcessor(BlockProcessor):
-    def sequencing_hook(self, db_session, parent_block_data, parent_sequenced_block_data):
-        current_block_time = self.block.datetime.replace(minute=self.block.datetime.minute - (self.block.datetime.minute % 5),
-            second=0, microsecond=0)
-        latest_time = current_block_time - datetime.timedelta(minutes=5)
-
-        current_base_quote_history = db_session.query(MarketHistory_5m.base, MarketHistory_5m.quote, func.max(MarketHistory_5m.time).label("time")).filter(
-            MarketHistory_5m.time == current_block_time).group_by(MarketHistory_5m.base, MarketHistory_5m.quote).all()
-        lastest_base_quote_history = db_session.query(MarketHistory_5m.base, MarketHistory_5m.quote, func.max(MarketHistory_5m.time).label("time")).filter(
-            MarketHistory_5m.time == latest_time).group_by(MarketHistory_5m.base, MarketHistory_5m.quote).all()
-
-        # curent -> next 5m all trades
-        from_time = current_block_time
-        to_time = from_time + \
-            datetime.timedelta(minutes=5)
-        trades_result = db_session.query(MarketHistory_1m.base, MarketHistory_1m.quote, func.sum(MarketHistory_1m.base_amount).label("base_amount"), func.sum(MarketHistory_1m.quote_amount).label("quote_amount"), func.min(
-            MarketHistory_1m.low).label("low"), func.max(MarketHistory_1m.high).label("high")).filter(MarketHistory_1m.time >= from_time, MarketHistory_1m.time < to_time).group_by(MarketHistory_1m.base, MarketHistory_1m.quote).all()
-
-        for trades in trades_result:
-            open_result = db_session.query(MarketHistory_1m.open).filter(
-                MarketHistory_1m.base == trades.base, MarketHistory_1m.quote == trades.quote, MarketHistory_1m.time >= from_time, MarketHistory_1m.time < to_time).order_by(MarketHistory_1m.id.asc()).limit(1).one()
-
-            closed_result = db_session.query(MarketHistory_1m.close).filter(
-                MarketHistory_1m.base == trades.base, MarketHistory_1m.quote == trades.quote, MarketHistory_1m.time >= from_time, MarketHistory_1m.time < to_time).order_by(MarketHistory_1m.id.desc()).limit(1).one()
-
-            matched = False
-            for current_base_quote in current_base_quote_history:
-                if trades.base == current_base_quote.base and trades.quote == current_base_quote.quote:
-                    matched = True
-                    break
-
-            if matched:  # update last market record
-                record = MarketHistory_5m.query(
-                        db_session).filter_by(base=trades.base, quote=trades.quote, time=current_block_time).first()
-                record.open = open_result[0]
-                record.high = trades.high
-                record.low = trades.low
-                record.close = closed_result[0]
-                record.base_amount = trades.base_amount
-                record.quote_amount = trades.quote_amount
-                record.save(db_session)
-            else:
-                model = MarketHistory_5m(
-                    time=from_time,
-                    open=open_result[0],
-                    high=trades.high,
-                    low=trades.low,
-                    close=closed_result[0],
-                    base_amount=trades.base_amount,
-                    quote_amount=trades.quote_amount,
-                    base=trades.base,
-                    quote=trades.quote
-                )
-
-                model.save(db_session)
-
-        # prev record exist, but not exist current block, will record empty in current scope
-        for latest_base_quote in lastest_base_quote_history:
-            matched = False
-            for trades in trades_result:
-                if latest_base_quote.base == trades.base and latest_base_quote.quote == trades.quote:
-                    matched = True
-                    break
-            for base_quote_history in current_base_quote_history: # not exist current record
-                if latest_base_quote.base == base_quote_history.base and latest_base_quote.quote == base_quote_history.quote:
-                    matched = True
-                    break
-
-            if not matched:
-                record = MarketHistory_5m.query(
-                    db_session).filter_by(base=latest_base_quote.base, quote=latest_base_quote.quote, time=latest_base_quote.time).first()
-                model = MarketHistory_5m(
-                    time=from_time,
-                    open=record.close,
-                    high=record.close,
-                    low=record.close,
-                    close=record.close,
-                    base_amount=0,
-                    quote_amount=0,
-                    base=latest_base_quote.base,
-                    quote=latest_base_quote.quote
-                )
-
-                model.save(db_session)
-
-
-class MarketHistory1hBlockProcessor(BlockProcessor):
-    def sequencing_hook(self, db_session, parent_block_data, parent_sequenced_block_data):
-        current_block_time = self.block.datetime.replace(minute=0,
-                                                         second=0, microsecond=0)
-        latest_time = current_block_time - datetime.timedelta(hours=1)
-
-        current_base_quote_history = db_session.query(MarketHistory_1h.base, MarketHistory_1h.quote, func.max(MarketHistory_1h.time).label("time")).filter(
-            MarketHistory_1h.time == current_block_time).group_by(MarketHistory_1h.base, MarketHistory_1h.quote).all()
-        lastest_base_quote_history = db_session.query(MarketHistory_1h.base, MarketHistory_1h.quote, func.max(MarketHistory_1h.time).label("time")).filter(
-            MarketHistory_1h.time == latest_time).group_by(MarketHistory_1h.base, MarketHistory_1h.quote).all()
-
-        # curent -> next 1h all trades
-        from_time = current_block_time
-        to_time = from_time + \
-            datetime.timedelta(hours=1)
-        trades_result = db_session.query(MarketHistory_5m.base, MarketHistory_5m.quote, func.sum(MarketHistory_5m.base_amount).label("base_amount"), func.sum(MarketHistory_5m.quote_amount).label("quote_amount"), func.min(
-            MarketHistory_5m.low).label("low"), func.max(MarketHistory_5m.high).label("high")).filter(MarketHistory_5m.time >= from_time, MarketHistory_5m.time < to_time).group_by(MarketHistory_5m.base, MarketHistory_5m.quote).all()
-
-        for trades in trades_result:
-            open_result = db_session.query(MarketHistory_5m.open).filter(
-                MarketHistory_5m.base == trades.base, MarketHistory_5m.quote == trades.quote, MarketHistory_5m.time >= from_time, MarketHistory_5m.time < to_time).order_by(MarketHistory_5m.id.asc()).limit(1).one()
-
-            closed_result = db_session.query(MarketHistory_5m.close).filter(
-                MarketHistory_5m.base == trades.base, MarketHistory_5m.quote == trades.quote, MarketHistory_5m.time >= from_time, MarketHistory_5m.time < to_time).order_by(MarketHistory_5m.id.desc()).limit(1).one()
-
-            matched = False
-            for current_base_quote in current_base_quote_history:
-                if trades.base == current_base_quote.base and trades.quote == current_base_quote.quote:
-                    matched = True
-                    break
-
-            if matched:  # update last market record
-                record = MarketHistory_1h.query(
-                    db_session).filter_by(base=trades.base, quote=trades.quote, time=current_block_time).first()
-                record.open = open_result[0]
-                record.high = trades.high
-                record.low = trades.low
-                record.close = closed_result[0]
-                record.base_amount = trades.base_amount
-                record.quote_amount = trades.quote_amount
-                record.save(db_session)
-            else:
-                model = MarketHistory_1h(
-                    time=from_time,
-                    open=open_result[0],
-                    high=trades.high,
-                    low=trades.low,
-                    close=closed_result[0],
-                    base_amount=trades.base_amount,
-                    quote_amount=trades.quote_amount,
-                    base=trades.base,
-                    quote=trades.quote
-                )
-
-                model.save(db_session)
-
-        # prev record exist, but not exist current block, will record empty in current scope
-        for latest_base_quote in lastest_base_quote_history:
-            matched = False
-            for trades in trades_result:
-                if latest_base_quote.base == trades.base and latest_base_quote.quote == trades.quote:
-                    matched = True
-                    break
-            for base_quote_history in current_base_quote_history:  # not exist current record
-                if latest_base_quote.base == base_quote_history.base and latest_base_quote.quote == base_quote_history.quote:
-                    matched = True
-                    break
-
-            if not matched:
-                record = MarketHistory_1h.query(
-                    db_session).filter_by(base=latest_base_quote.base, quote=latest_base_quote.quote, time=latest_base_quote.time).first()
-                model = MarketHistory_1h(
-                    time=from_time,
-                    open=record.close,
-                    high=record.close,
-                    low=record.close,
-                    close=record.close,
-                    base_amount=0,
-                    quote_amount=0,
-                    base=latest_base_quote.base,
-                    quote=latest_base_quote.quote
-                )
-
-                model.save(db_session)
-
+class MarketHistoryBlockProcessor(BlockProcessor):
 
-class MarketHistory1dBlockProcessor(BlockProcessor):
     def sequencing_hook(self, db_session, parent_block_data, parent_sequenced_block_data):
-        current_block_time = self.block.datetime.replace(hour=0,minute=0,
-                                                         second=0, microsecond=0)
-        latest_time = current_block_time - datetime.timedelta(days=1)
-
-        current_base_quote_history = db_session.query(MarketHistory_1d.base, MarketHistory_1d.quote, func.max(MarketHistory_1d.time).label("time")).filter(
-            MarketHistory_1d.time == current_block_time).group_by(MarketHistory_1d.base, MarketHistory_1d.quote).all()
-        lastest_base_quote_history = db_session.query(MarketHistory_1d.base, MarketHistory_1d.quote, func.max(MarketHistory_1d.time).label("time")).filter(
-            MarketHistory_1d.time == latest_time).group_by(MarketHistory_1d.base, MarketHistory_1d.quote).all()
-
-        # curent -> next 5m all trades
-        from_time = current_block_time
-        to_time = from_time + \
-            datetime.timedelta(days=1)
-        trades_result = db_session.query(MarketHistory_1h.base, MarketHistory_1h.quote, func.sum(MarketHistory_1h.base_amount).label("base_amount"), func.sum(MarketHistory_1h.quote_amount).label("quote_amount"), func.min(
-            MarketHistory_1h.low).label("low"), func.max(MarketHistory_1h.high).label("high")).filter(MarketHistory_1h.time >= from_time, MarketHistory_1h.time < to_time).group_by(MarketHistory_1h.base, MarketHistory_1h.quote).all()
-
-        for trades in trades_result:
-            open_result = db_session.query(MarketHistory_1h.open).filter(
-                MarketHistory_1h.base == trades.base, MarketHistory_1h.quote == trades.quote, MarketHistory_1h.time >= from_time, MarketHistory_1h.time < to_time).order_by(MarketHistory_1h.id.asc()).limit(1).one()
-
-            closed_result = db_session.query(MarketHistory_1h.close).filter(
-                MarketHistory_1h.base == trades.base, MarketHistory_1h.quote == trades.quote, MarketHistory_1h.time >= from_time, MarketHistory_1h.time < to_time).order_by(MarketHistory_1h.id.desc()).limit(1).one()
-
-            matched = False
-            for current_base_quote in current_base_quote_history:
-                if trades.base == current_base_quote.base and trades.quote == current_base_quote.quote:
-                    matched = True
-                    break
-
-            if matched:  # update last market record
-                record = MarketHistory_1d.query(
-                    db_session).filter_by(base=trades.base, quote=trades.quote, time=current_block_time).first()
-                record.open = open_result[0]
-                record.high = trades.high
-                record.low = trades.low
-                record.close = closed_result[0]
-                record.base_amount = trades.base_amount
-                record.quote_amount = trades.quote_amount
-                record.save(db_session)
-            else:
-                model = MarketHistory_1d(
-                    time=from_time,
-                    open=open_result[0],
-                    high=trades.high,
-                    low=trades.low,
-                    close=closed_result[0],
-                    base_amount=trades.base_amount,
-                    quote_amount=trades.quote_amount,
-                    base=trades.base,
-                    quote=trades.quote
-                )
-
-                model.save(db_session)
-
-        # prev record exist, but not exist current block, will record empty in current scope
-        for latest_base_quote in lastest_base_quote_history:
-            matched = False
-            for trades in trades_result:
-                if latest_base_quote.base == trades.base and latest_base_quote.quote == trades.quote:
-                    matched = True
-                    break
-            for base_quote_history in current_base_quote_history:  # not exist current record
-                if latest_base_quote.base == base_quote_history.base and latest_base_quote.quote == base_quote_history.quote:
-                    matched = True
-                    break
-
-            if not matched:
-                record = MarketHistory_1d.query(
-                    db_session).filter_by(base=latest_base_quote.base, quote=latest_base_quote.quote, time=latest_base_quote.time).first()
-                model = MarketHistory_1d(
-                    time=from_time,
-                    open=record.close,
-                    high=record.close,
-                    low=record.close,
-                    close=record.close,
-                    base_amount=0,
-                    quote_amount=0,
-                    base=latest_base_quote.base,
-                    quote=latest_base_quote.quote
-                )
-
-                model.save(db_session)
+        # Candle state is kept by the harvester between blocks
+        candle_engine = self.harvester.candle_engine if self.harvester else CandleEngine()
+        candle_engine.process_block(db_session, self.block)
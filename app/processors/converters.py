@@ -19,18 +19,31 @@
 #  converters.py
 import json
 import math
+import time
+from collections import defaultdict
+from itertools import groupby
 
 from app import settings
 
-from sqlalchemy import func, distinct
-from sqlalchemy.exc import SQLAlchemyError
-from app.models.harvester import Status
+from sqlalchemy import func, distinct, text
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from app.models.harvester import Status, HarvestedBlockRange
 from app.processors import NewSessionEventProcessor, Log, SlashEventProcessor, BalancesTransferProcessor
-from scalecodec.base import ScaleBytes, ScaleDecoder
+from scalecodec.base import ScaleBytes, ScaleDecoder, RuntimeConfiguration
 from scalecodec.exceptions import RemainingScaleBytesNotEmptyException
-from scalecodec.block import ExtrinsicsDecoder
-
+from scalecodec.block import ExtrinsicsDecoder, EventsDecoder
+from scalecodec.metadata import MetadataDecoder
+
+from app.models.base import BulkInsertBuffer
+from app.utils.metadata_cache import MetadataCache
+from app.utils.partitions import BlockRangePartitions
+from app.utils.profiler import Profiler
+from app.utils.sql_monitor import StatementMonitor
+from app.utils.substrate import HarvesterSubstrateInterface
 from app.processors.base import BaseService, ProcessorRegistry
+from app.processors.market import CandleEngine
+from app.processors.runtime_index import RuntimeVersionIndex
 from scalecodec.type_registry import load_type_registry_preset
 from substrateinterface import SubstrateInterface, SubstrateRequestException, xxh128
 
@@ -52,13 +65,101 @@ class BlockIntegrityError(Exception):
     pass
 
 
+class BlockCommitBatch(object):
+    """
+    Accumulates blocks in one transaction that is committed per ACCUMULATE_COMMIT_BATCH_SIZE blocks. When a block
+    in the batch fails, the transaction is rolled back and the other blocks of the batch are added again.
+    """
+
+    def __init__(self, harvester, batch_size=None):
+        self.harvester = harvester
+        self.batch_size = max(batch_size or settings.ACCUMULATE_COMMIT_BATCH_SIZE, 1)
+        self.block_hashes = []
+
+        self.commit_count = 0
+        self.commit_time_total = 0
+        self.commit_time_max = 0
+
+    def add_block(self, block_hash, prefetched_block=None):
+        block = self.harvester.add_block(block_hash, prefetched_block=prefetched_block)
+        self.block_hashes.append(block_hash)
+        return block
+
+    def checkpoint(self):
+        # Commit when batch is full
+        if len(self.block_hashes) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        start_time = time.time()
+
+        self.harvester.db_session.commit()
+
+        commit_time = time.time() - start_time
+
+        self.commit_count += 1
+        self.commit_time_total += commit_time
+        self.commit_time_max = max(self.commit_time_max, commit_time)
+
+        self.block_hashes = []
+
+    def rollback(self, failed_block_hash=None):
+        """
+        Rolls back the transaction and adds all blocks of the batch again except `failed_block_hash`, blocks that
+        fail during this retry are left out as well
+        :param failed_block_hash:
+        :return: list of block hashes left out
+        """
+        block_hashes = [block_hash for block_hash in self.block_hashes if block_hash != failed_block_hash]
+        skipped_block_hashes = [failed_block_hash] if failed_block_hash else []
+
+        while True:
+            self.harvester.db_session.rollback()
+            self.block_hashes = []
+
+            # Runtimes stored in the rolled back transaction need to be processed again
+            self.harvester.metadata_store = {}
+
+            try:
+                for block_hash in block_hashes:
+                    try:
+                        self.add_block(block_hash)
+                    except BlockAlreadyAdded:
+                        skipped_block_hashes.append(block_hash)
+
+                return skipped_block_hashes
+
+            except IntegrityError:
+                block_hashes.remove(block_hash)
+                skipped_block_hashes.append(block_hash)
+
+    def commit_latency(self):
+        return {
+            'commits': self.commit_count,
+            'avg': self.commit_time_total / self.commit_count if self.commit_count else 0,
+            'max': self.commit_time_max
+        }
+
+
 class PolkascanHarvesterService(BaseService):
 
     def __init__(self, db_session, type_registry='default'):
         self.db_session = db_session
-        self.substrate = SubstrateInterface(settings.SUBSTRATE_RPC_URL, type_registry_preset=type_registry)
+        self.substrate = HarvesterSubstrateInterface(settings.SUBSTRATE_RPC_URL, type_registry_preset=type_registry)
         self.type_registry = type_registry
         self.metadata_store = {}
+        self.processor_registry = ProcessorRegistry()
+        self.profiler = Profiler()
+        self.statement_monitor = StatementMonitor()
+        self.candle_engine = CandleEngine()
+
+    def process_hook(self, processor, hook, *args):
+        if not self.profiler.enabled:
+            return getattr(processor, hook)(*args)
+
+        with self.profiler.timer('harvester_processor_hook_seconds', 'processor="{}",hook="{}"'.format(
+                processor.__class__.__name__, hook)):
+            return getattr(processor, hook)(*args)
 
     def process_genesis(self, block):
 
@@ -196,14 +297,16 @@ class PolkascanHarvesterService(BaseService):
         if spec_version not in self.metadata_store:
             print('Metadata: CACHE MISS', spec_version)
 
-            runtime_version_data = self.substrate.get_block_runtime_version(block_hash)
-
             runtime = Runtime.query(self.db_session).get(spec_version)
 
             if runtime:
-                self.metadata_store[spec_version] = self.substrate.get_block_metadata(block_hash=block_hash)
+                self.metadata_store[spec_version] = self.get_metadata_decoder(spec_version, block_hash, runtime)
 
             else:
+                runtime_version_data = self.substrate.get_block_runtime_version(block_hash)
+
+                metadata_decoder = self.get_metadata_decoder(spec_version, block_hash)
+
                 self.db_session.begin(subtransactions=True)
                 try:
 
@@ -214,13 +317,13 @@ class PolkascanHarvesterService(BaseService):
                         impl_version=runtime_version_data["implVersion"],
                         spec_name=runtime_version_data["specName"],
                         spec_version=spec_version,
-                        json_metadata=str(self.substrate.metadata_decoder.data),
-                        json_metadata_decoded=self.substrate.metadata_decoder.value,
+                        json_metadata=str(metadata_decoder.data),
+                        json_metadata_decoded=metadata_decoder.value,
                         apis=runtime_version_data["apis"],
                         authoring_version=runtime_version_data["authoringVersion"],
                         count_call_functions=0,
                         count_events=0,
-                        count_modules=len(self.substrate.metadata_decoder.metadata.modules),
+                        count_modules=len(metadata_decoder.metadata.modules),
                         count_storage_functions=0,
                         count_constants=0,
                         count_errors=0
@@ -228,9 +331,11 @@ class PolkascanHarvesterService(BaseService):
 
                     runtime.save(self.db_session)
 
-                    print('store version to db', self.substrate.metadata_decoder.version)
+                    print('store version to db', metadata_decoder.version)
+
+                    MetadataCache().put(spec_version, metadata_decoder)
 
-                    for module in self.substrate.metadata_decoder.metadata.modules:
+                    for module in metadata_decoder.metadata.modules:
 
                         # Check if module exists
                         if RuntimeModule.query(self.db_session).filter_by(
@@ -419,11 +524,87 @@ class PolkascanHarvesterService(BaseService):
                     self.db_session.commit()
 
                     # Put in local store
-                    self.metadata_store[spec_version] = self.substrate.metadata_decoder
+                    self.metadata_store[spec_version] = metadata_decoder
                 except SQLAlchemyError as e:
                     self.db_session.rollback()
 
-    def add_block(self, block_hash):
+    def get_metadata_decoder(self, spec_version, block_hash, runtime=None):
+        """
+        Retrieves decoded metadata of given spec version from the shared metadata cache, the stored raw metadata of
+        given Runtime or else from the node
+        :param spec_version:
+        :param block_hash: block with runtime of spec_version
+        :param runtime: optional Runtime of spec_version
+        :return: MetadataDecoder
+        """
+        metadata_cache = MetadataCache()
+
+        metadata_decoder = metadata_cache.get(spec_version)
+
+        if not metadata_decoder:
+            if runtime and runtime.json_metadata:
+                metadata_decoder = MetadataDecoder(ScaleBytes(runtime.json_metadata))
+                metadata_decoder.decode()
+            else:
+                metadata_decoder = self.substrate.get_block_metadata(block_hash=block_hash, decode=True)
+
+            metadata_cache.put(spec_version, metadata_decoder)
+
+        return metadata_decoder
+
+    def get_indexed_runtime_version(self, block_id):
+        if settings.ACCUMULATE_RUNTIME_INDEX:
+            return RuntimeVersionIndex().get_runtime_version(block_id, self.db_session)
+
+    def init_runtime(self, block_hash, runtime_version=None):
+        """
+        Activates the runtime of given block with metadata from the shared metadata cache; when the runtime version
+        is already known (e.g. prefetched) the `chain_getRuntimeVersion` request is skipped as well
+        :param block_hash:
+        :param runtime_version: optional result of `chain_getRuntimeVersion` for block_hash
+        :return:
+        """
+        if not runtime_version:
+            runtime_version = self.substrate.get_block_runtime_version(block_hash)
+
+        spec_version = runtime_version.get('specVersion')
+
+        self.substrate.block_hash = block_hash
+        self.substrate.runtime_version = spec_version
+
+        RuntimeConfiguration().set_active_spec_version_id(spec_version)
+
+        if spec_version not in self.substrate.metadata_cache:
+            self.substrate.metadata_cache[spec_version] = self.get_metadata_decoder(spec_version, block_hash)
+
+        self.substrate.metadata_decoder = self.substrate.metadata_cache[spec_version]
+
+    def get_block_events(self, block_hash, metadata_decoder, prefetched_block=None):
+
+        if prefetched_block and prefetched_block.events_data and metadata_decoder.version.index >= 9:
+            events_decoder = EventsDecoder(
+                data=ScaleBytes(prefetched_block.events_data),
+                metadata=metadata_decoder
+            )
+            events_decoder.decode()
+
+            return events_decoder
+
+        return self.substrate.get_block_events(block_hash, metadata_decoder)
+
+    def add_block(self, block_hash, prefetched_block=None):
+
+        with self.profiler.timer('harvester_block_seconds', 'phase="accumulation"'), \
+                self.statement_monitor.scope('accumulation', block_hash):
+
+            if not settings.ACCUMULATE_BULK_INSERT:
+                return self.accumulate_block(block_hash, prefetched_block)
+
+            # Events, extrinsics, logs and search index rows are inserted per table instead of per row
+            with BulkInsertBuffer(self.db_session):
+                return self.accumulate_block(block_hash, prefetched_block)
+
+    def accumulate_block(self, block_hash, prefetched_block=None):
 
         # Check if block is already process
         if Block.query(self.db_session).filter_by(hash=block_hash).count() > 0:
@@ -432,7 +613,13 @@ class PolkascanHarvesterService(BaseService):
         if settings.SUBSTRATE_MOCK_EXTRINSICS:
             self.substrate.mock_extrinsics = settings.SUBSTRATE_MOCK_EXTRINSICS
 
-        json_block = self.substrate.get_chain_block(block_hash)
+        if prefetched_block:
+            json_block = prefetched_block.json_block
+
+            if self.substrate.mock_extrinsics:
+                json_block['block']['extrinsics'].extend(self.substrate.mock_extrinsics)
+        else:
+            json_block = self.substrate.get_chain_block(block_hash)
 
         parent_hash = json_block['block']['header'].pop('parentHash')
         block_id = json_block['block']['header'].pop('number')
@@ -446,14 +633,23 @@ class PolkascanHarvesterService(BaseService):
 
         # ==== Get block runtime from Substrate ==================
 
-        self.substrate.init_runtime(block_hash=block_hash)
+        if prefetched_block:
+            runtime_version = prefetched_block.runtime_version
+        else:
+            runtime_version = self.get_indexed_runtime_version(block_id)
+
+        self.init_runtime(block_hash, runtime_version)
 
         self.process_metadata(self.substrate.runtime_version, block_hash)
 
         # ==== Get parent block runtime ===================
 
         if block_id > 0:
-            json_parent_runtime_version = self.substrate.get_block_runtime_version(parent_hash)
+            if prefetched_block and prefetched_block.parent_runtime_version:
+                json_parent_runtime_version = prefetched_block.parent_runtime_version
+            else:
+                json_parent_runtime_version = self.get_indexed_runtime_version(block_id - 1) or \
+                                              self.substrate.get_block_runtime_version(parent_hash)
 
             parent_spec_version = json_parent_runtime_version.get('specVersion', 0)
 
@@ -504,7 +700,9 @@ class PolkascanHarvesterService(BaseService):
         events = []
 
         try:
-            events_decoder = self.substrate.get_block_events(block_hash, self.metadata_store[parent_spec_version])
+            events_decoder = self.get_block_events(
+                block_hash, self.metadata_store[parent_spec_version], prefetched_block=prefetched_block
+            )
 
             event_idx = 0
 
@@ -637,10 +835,15 @@ class PolkascanHarvesterService(BaseService):
                 block.count_extrinsics_unsigned += 1
 
             # Process extrinsic processors
-            for processor_class in ProcessorRegistry().get_extrinsic_processors(model.module_id, model.call_id):
+            for processor_class in self.processor_registry.get_extrinsic_processors(
+                    model.module_id, model.call_id, 'accumulation_hook'):
                 extrinsic_processor = processor_class(block, model, substrate=self.substrate)
-                extrinsic_processor.accumulation_hook(self.db_session)
-                extrinsic_processor.process_search_index(self.db_session)
+                self.process_hook(extrinsic_processor, 'accumulation_hook', self.db_session)
+
+            for processor_class in self.processor_registry.get_extrinsic_processors(
+                    model.module_id, model.call_id, 'process_search_index'):
+                extrinsic_processor = processor_class(block, model, substrate=self.substrate)
+                self.process_hook(extrinsic_processor, 'process_search_index', self.db_session)
 
         # Process event processors
         for event in events:
@@ -651,17 +854,27 @@ class PolkascanHarvesterService(BaseService):
                 except IndexError:
                     extrinsic = None
 
-            for processor_class in ProcessorRegistry().get_event_processors(event.module_id, event.event_id):
+            for processor_class in self.processor_registry.get_event_processors(
+                    event.module_id, event.event_id, 'accumulation_hook'):
                 event_processor = processor_class(block, event, extrinsic,
                                                   metadata=self.metadata_store.get(block.spec_version_id),
                                                   substrate=self.substrate)
-                event_processor.accumulation_hook(self.db_session)
-                event_processor.process_search_index(self.db_session)
+                self.process_hook(event_processor, 'accumulation_hook', self.db_session)
+
+            for processor_class in self.processor_registry.get_event_processors(
+                    event.module_id, event.event_id, 'process_search_index'):
+                event_processor = processor_class(block, event, extrinsic,
+                                                  metadata=self.metadata_store.get(block.spec_version_id),
+                                                  substrate=self.substrate)
+                self.process_hook(event_processor, 'process_search_index', self.db_session)
+
+        # Block processors query rows of this block, so write buffered rows first
+        BulkInsertBuffer.flush_session(self.db_session)
 
         # Process block processors
-        for processor_class in ProcessorRegistry().get_block_processors():
+        for processor_class in self.processor_registry.get_block_processors('accumulation_hook'):
             block_processor = processor_class(block, substrate=self.substrate, harvester=self)
-            block_processor.accumulation_hook(self.db_session)
+            self.process_hook(block_processor, 'accumulation_hook', self.db_session)
 
         # Debug info
         if settings.DEBUG:
@@ -671,6 +884,8 @@ class PolkascanHarvesterService(BaseService):
 
         block.save(self.db_session)
 
+        HarvestedBlockRange.add_block_id(self.db_session, block.id)
+
         return block
 
     def remove_block(self, block_hash):
@@ -679,20 +894,22 @@ class PolkascanHarvesterService(BaseService):
 
         # Revert event processors
         for event in Event.query(self.db_session).filter_by(block_id=block.id):
-            for processor_class in ProcessorRegistry().get_event_processors(event.module_id, event.event_id):
+            for processor_class in self.processor_registry.get_event_processors(
+                    event.module_id, event.event_id, 'accumulation_revert'):
                 event_processor = processor_class(block, event, None)
-                event_processor.accumulation_revert(self.db_session)
+                self.process_hook(event_processor, 'accumulation_revert', self.db_session)
 
         # Revert extrinsic processors
         for extrinsic in Extrinsic.query(self.db_session).filter_by(block_id=block.id):
-            for processor_class in ProcessorRegistry().get_extrinsic_processors(extrinsic.module_id, extrinsic.call_id):
+            for processor_class in self.processor_registry.get_extrinsic_processors(
+                    extrinsic.module_id, extrinsic.call_id, 'accumulation_revert'):
                 extrinsic_processor = processor_class(block, extrinsic)
-                extrinsic_processor.accumulation_revert(self.db_session)
+                self.process_hook(extrinsic_processor, 'accumulation_revert', self.db_session)
 
         # Revert block processors
-        for processor_class in ProcessorRegistry().get_block_processors():
+        for processor_class in self.processor_registry.get_block_processors('accumulation_revert'):
             block_processor = processor_class(block)
-            block_processor.accumulation_revert(self.db_session)
+            self.process_hook(block_processor, 'accumulation_revert', self.db_session)
 
         # Delete events
         for item in Event.query(self.db_session).filter_by(block_id=block.id):
@@ -704,34 +921,42 @@ class PolkascanHarvesterService(BaseService):
         # Delete block
         self.db_session.delete(block)
 
-    def sequence_block(self, block, parent_block_data=None, parent_sequenced_block_data=None):
+        HarvestedBlockRange.remove_block_id(self.db_session, block.id)
+
+    def sequence_block(self, block, parent_block_data=None, parent_sequenced_block_data=None, extrinsics=None,
+                       events=None):
 
         sequenced_block = BlockTotal(
             id=block.id
         )
 
         # Process block processors
-        for processor_class in ProcessorRegistry().get_block_processors():
-            block_processor = processor_class(block, sequenced_block, substrate=self.substrate)
-            block_processor.sequencing_hook(
+        for processor_class in self.processor_registry.get_block_processors('sequencing_hook'):
+            block_processor = processor_class(block, sequenced_block, substrate=self.substrate, harvester=self)
+            self.process_hook(
+                block_processor, 'sequencing_hook',
                 self.db_session,
                 parent_block_data,
                 parent_sequenced_block_data
             )
 
-        extrinsics = Extrinsic.query(self.db_session).filter_by(block_id=block.id).order_by('extrinsic_idx')
+        if extrinsics is None:
+            extrinsics = Extrinsic.query(self.db_session).filter_by(block_id=block.id).order_by('extrinsic_idx').all()
 
         for extrinsic in extrinsics:
             # Process extrinsic processors
-            for processor_class in ProcessorRegistry().get_extrinsic_processors(extrinsic.module_id, extrinsic.call_id):
+            for processor_class in self.processor_registry.get_extrinsic_processors(
+                    extrinsic.module_id, extrinsic.call_id, 'sequencing_hook'):
                 extrinsic_processor = processor_class(block, extrinsic, substrate=self.substrate)
-                extrinsic_processor.sequencing_hook(
+                self.process_hook(
+                    extrinsic_processor, 'sequencing_hook',
                     self.db_session,
                     parent_block_data,
                     parent_sequenced_block_data
                 )
 
-        events = Event.query(self.db_session).filter_by(block_id=block.id).order_by('event_idx')
+        if events is None:
+            events = Event.query(self.db_session).filter_by(block_id=block.id).order_by('event_idx').all()
 
         # Process event processors
         for event in events:
@@ -742,9 +967,11 @@ class PolkascanHarvesterService(BaseService):
                 except IndexError:
                     extrinsic = None
 
-            for processor_class in ProcessorRegistry().get_event_processors(event.module_id, event.event_id):
+            for processor_class in self.processor_registry.get_event_processors(
+                    event.module_id, event.event_id, 'sequencing_hook'):
                 event_processor = processor_class(block, event, extrinsic, substrate=self.substrate)
-                event_processor.sequencing_hook(
+                self.process_hook(
+                    event_processor, 'sequencing_hook',
                     self.db_session,
                     parent_block_data,
                     parent_sequenced_block_data
@@ -757,7 +984,7 @@ class PolkascanHarvesterService(BaseService):
     def integrity_checks(self):
 
         # 1. Check finalized head
-        substrate = SubstrateInterface(settings.SUBSTRATE_RPC_URL)
+        substrate = HarvesterSubstrateInterface(settings.SUBSTRATE_RPC_URL)
 
         if settings.FINALIZATION_BY_BLOCK_CONFIRMATIONS > 0:
             finalized_block_hash = substrate.get_chain_head()
@@ -782,60 +1009,107 @@ class PolkascanHarvesterService(BaseService):
 
         start_block_id = max(integrity_head.value - 1, 0)
         end_block_id = finalized_block_number
-        chunk_size = 1000
+        chunk_size = settings.INTEGRITY_CHUNK_SIZE
         parent_block = None
 
+        # Discontinuities found in this pass, the integrity head only advances up to the first one
+        discontinuities = []
+        orphan_blocks = []
+        parent_hash_mismatches = []
+
         if start_block_id < end_block_id:
-            # Continue integrity check
+            # Continue integrity check, blocks are scanned with keyset pagination on id. A pass is limited to
+            # INTEGRITY_MAX_CHUNKS chunks and stops at the chunk with the first discontinuity, so a known gap (e.g.
+            # during backfill) doesn't cause a rescan of all blocks beyond it on every run
+            next_block_id = start_block_id
+            chunk_count = 0
+
+            while next_block_id <= end_block_id and not discontinuities and chunk_count < settings.INTEGRITY_MAX_CHUNKS:
+                block_range = self.db_session.query(Block.id, Block.hash, Block.parent_hash).filter(
+                    Block.id >= next_block_id, Block.id <= end_block_id
+                ).order_by(Block.id).limit(chunk_size).all()
+
+                if not block_range:
+                    break
+
+                chunk_count += 1
+                node_block_hashes = {}
+                gap_found = False
 
-            # print('== Start integrity checks from {} to {} =='.format(start_block_id, end_block_id))
+                if settings.INTEGRITY_VERIFY_HASHES:
+                    responses = substrate.rpc_batch([('chain_getBlockHash', [block.id]) for block in block_range])
+
+                    # Only a hash returned by the node can mark a block as orphaned, never a failed request
+                    for block, response in zip(block_range, responses):
+                        if 'error' in response or not response.get('result'):
+                            raise SubstrateRequestException(
+                                response.get('error') or 'No block hash for #{} in node'.format(block.id)
+                            )
+
+                        node_block_hashes[block.id] = response['result']
 
-            for block_nr in range(start_block_id, end_block_id, chunk_size):
-                # TODO replace limit with filter_by block range
-                block_range = Block.query(self.db_session).order_by('id')[block_nr:block_nr + chunk_size]
                 for block in block_range:
                     if parent_block:
                         if block.id != parent_block.id + 1:
+                            discontinuities.append('Blocks #{}-#{} are missing'.format(parent_block.id + 1, block.id - 1))
+                            gap_found = True
+                        elif block.parent_hash != parent_block.hash:
+                            discontinuities.append('Block #{} parent hash mismatch'.format(block.id))
+                            parent_hash_mismatches.append((parent_block, block))
+                            gap_found = True
 
-                            # Save integrity head if block hash of parent matches with hash in node
-                            if parent_block.hash == substrate.get_block_hash(integrity_head.value):
-                                integrity_head.save(self.db_session)
-                                self.db_session.commit()
+                    # Blocks beyond a gap are verified in a later pass, once the gap is filled
+                    if node_block_hashes and not gap_found and node_block_hashes[block.id] != block.hash:
+                        discontinuities.append('Block #{} hash does not match node'.format(block.id))
+                        orphan_blocks.append((block, node_block_hashes[block.id]))
 
-                            raise BlockIntegrityError('Block #{} is missing.. stopping check '.format(parent_block.id + 1))
-                        elif block.parent_hash != parent_block.hash:
+                    if not discontinuities:
+                        integrity_head.value = block.id
 
-                            self.process_reorg_block(parent_block)
-                            self.process_reorg_block(block)
+                    parent_block = block
 
-                            self.remove_block(block.hash)
-                            self.remove_block(parent_block.hash)
-                            self.db_session.commit()
+                next_block_id = block_range[-1].id + 1
 
-                            self.add_block(substrate.get_block_hash(block.id))
-                            self.add_block(substrate.get_block_hash(parent_block.id))
-                            self.db_session.commit()
+            if orphan_blocks:
+                # Replace all blocks that are not in the canonical chain of the node
+                for block, node_block_hash in orphan_blocks:
+                    self.process_reorg_block(Block.query(self.db_session).get(block.id))
+                    self.remove_block(block.hash)
+                    self.add_block(node_block_hash)
+                    self.db_session.commit()
 
-                            integrity_head.value = parent_block.id - 1
+            elif parent_hash_mismatches:
+                # Without node hash verification it is unknown which block is orphaned, so re-add both
+                parent_block, block = parent_hash_mismatches[0]
 
-                            # Save integrity head if block hash of parent matches with hash in node
-                            #if parent_block.parent_hash == substrate.get_block_hash(integrity_head.value):
-                            integrity_head.save(self.db_session)
-                            self.db_session.commit()
+                self.process_reorg_block(Block.query(self.db_session).get(parent_block.id))
+                self.process_reorg_block(Block.query(self.db_session).get(block.id))
 
-                            raise BlockIntegrityError('Block #{} failed integrity checks, Re-adding #{}.. '.format(parent_block.id, block.id))
-                        else:
-                            integrity_head.value = block.id
+                self.remove_block(block.hash)
+                self.remove_block(parent_block.hash)
+                self.db_session.commit()
 
-                    parent_block = block
+                self.add_block(substrate.get_block_hash(block.id))
+                self.add_block(substrate.get_block_hash(parent_block.id))
+                self.db_session.commit()
 
-                    if block.id == end_block_id:
-                        break
+                integrity_head.value = min(integrity_head.value, parent_block.id - 1)
 
-            if parent_block:
-                if parent_block.hash == substrate.get_block_hash(int(integrity_head.value)):
-                    integrity_head.save(self.db_session)
-                    self.db_session.commit()
+            # Save integrity head if block hash matches with hash in node
+            head_block = Block.query(self.db_session).get(integrity_head.value)
+
+            if head_block and (settings.INTEGRITY_VERIFY_HASHES or
+                               head_block.hash == substrate.get_block_hash(integrity_head.value)):
+                integrity_head.save(self.db_session)
+                self.db_session.commit()
+
+            if discontinuities:
+                raise BlockIntegrityError('Integrity check stopped at #{}: {}{}'.format(
+                    integrity_head.value,
+                    ', '.join(discontinuities[:settings.INTEGRITY_MAX_REPORTED]),
+                    ' (and {} more)'.format(len(discontinuities) - settings.INTEGRITY_MAX_REPORTED)
+                    if len(discontinuities) > settings.INTEGRITY_MAX_REPORTED else ''
+                ))
 
         return {'integrity_head': integrity_head.value}
 
@@ -843,8 +1117,6 @@ class PolkascanHarvesterService(BaseService):
         integrity_status = self.integrity_checks()
         self.db_session.commit()
 
-        block_nr = None
-
         integrity_head = Status.get_status(self.db_session, 'INTEGRITY_HEAD')
 
         if not integrity_head.value:
@@ -858,57 +1130,97 @@ class PolkascanHarvesterService(BaseService):
 
         # Start sequencing process
 
-        sequencer_parent_block = BlockTotal.query(self.db_session).filter_by(id=sequencer_head).first()
-        parent_block = Block.query(self.db_session).filter_by(id=sequencer_head).first()
+        integrity_head = int(integrity_head.value)
+        parent_block_data = None
+        sequencer_parent_block_data = None
 
-        for block_nr in range(sequencer_head + 1, int(integrity_head.value) + 1):
+        if sequencer_head == -1:
+            if integrity_head < 0:
+                return {'result': 'Nothing to sequence'}
 
-            if block_nr == 0:
-                # No block ever sequenced, check if chain is at genesis state
-                assert (not sequencer_parent_block)
+            # No block ever sequenced, check if chain is at genesis state
+            block = Block.query(self.db_session).order_by('id').first()
 
-                block = Block.query(self.db_session).order_by('id').first()
+            if not block:
+                self.db_session.commit()
+                return {'error': 'Chain not at genesis'}
 
-                if not block:
-                    self.db_session.commit()
-                    return {'error': 'Chain not at genesis'}
+            if block.id == 1:
+                # Add genesis block
+                block = self.add_block(block.parent_hash)
 
-                if block.id == 1:
-                    # Add genesis block
-                    block = self.add_block(block.parent_hash)
+            if block.id != 0:
+                self.db_session.commit()
+                return {'error': 'Chain not at genesis'}
 
-                if block.id != 0:
-                    self.db_session.commit()
-                    return {'error': 'Chain not at genesis'}
+            self.process_genesis(block)
 
-                self.process_genesis(block)
+            sequenced_block = self.sequence_block(block)
 
-                sequencer_parent_block_data = None
-                parent_block_data = None
-            else:
-                block_id = sequencer_parent_block.id + 1
+            parent_block_data = block.asdict()
+            sequencer_parent_block_data = sequenced_block.asdict()
 
-                assert (block_id == block_nr)
+            self.db_session.commit()
 
-                block = Block.query(self.db_session).get(block_nr)
+            sequencer_head = 0
 
-                if not block:
-                    self.db_session.commit()
-                    return {'result': 'Finished at #{}'.format(sequencer_parent_block.id)}
+        elif sequencer_head < integrity_head:
+            parent_block_data = Block.query(self.db_session).get(sequencer_head).asdict()
+            sequencer_parent_block_data = BlockTotal.query(self.db_session).get(sequencer_head).asdict()
+
+        else:
+            return {'result': 'Nothing to sequence'}
+
+        # Sequence in windows of blocks: blocks, extrinsics and events are retrieved per window and running totals
+        # of the parent are kept in memory, every window is committed at once
+        while sequencer_head < integrity_head:
+            window_end = min(sequencer_head + settings.SEQUENCER_BATCH_SIZE, integrity_head)
+
+            blocks = Block.query(self.db_session).filter(
+                Block.id.between(sequencer_head + 1, window_end)
+            ).order_by('id').all()
+
+            extrinsics = {block_id: list(items) for block_id, items in groupby(
+                Extrinsic.query(self.db_session).filter(
+                    Extrinsic.block_id.between(sequencer_head + 1, window_end)
+                ).order_by('block_id', 'extrinsic_idx'),
+                key=lambda extrinsic: extrinsic.block_id
+            )}
+
+            events = {block_id: list(items) for block_id, items in groupby(
+                Event.query(self.db_session).filter(
+                    Event.block_id.between(sequencer_head + 1, window_end)
+                ).order_by('block_id', 'event_idx'),
+                key=lambda event: event.block_id
+            )}
+
+            for block in blocks:
+                if block.id != sequencer_head + 1:
+                    break
+
+                with self.profiler.timer('harvester_block_seconds', 'phase="sequencing"'), \
+                        self.statement_monitor.scope('sequencing', block.id):
+                    sequenced_block = self.sequence_block(
+                        block,
+                        parent_block_data,
+                        sequencer_parent_block_data,
+                        extrinsics=extrinsics.get(block.id, []),
+                        events=events.get(block.id, [])
+                    )
 
-                sequencer_parent_block_data = sequencer_parent_block.asdict()
-                parent_block_data = parent_block.asdict()
+                # Keep parent data before commit expires the instances
+                parent_block_data = block.asdict()
+                sequencer_parent_block_data = sequenced_block.asdict()
+
+                sequencer_head = block.id
 
-            sequenced_block = self.sequence_block(block, parent_block_data, sequencer_parent_block_data)
             self.db_session.commit()
 
-            parent_block = block
-            sequencer_parent_block = sequenced_block
+            if sequencer_head < window_end:
+                # Next block not (yet) available
+                break
 
-        if block_nr:
-            return {'result': 'Finished at #{}'.format(block_nr)}
-        else:
-            return {'result': 'Nothing to sequence'}
+        return {'result': 'Finished at #{}'.format(sequencer_head)}
 
     def process_reorg_block(self, block):
 
@@ -930,49 +1242,123 @@ class PolkascanHarvesterService(BaseService):
                 model = ReorgLog(block_hash=block.hash, **log.asdict())
                 model.save(self.db_session)
 
-    def rebuild_search_index(self):
+    def get_search_index_ranges(self):
+        """
+        Block ranges in which the search index is rebuilt, aligned to the partitions of the search index table so
+        each range is cleared with a cheap partition truncate
+        :return: list of tuples (block_start, block_end)
+        """
+        block_id_max = self.db_session.query(func.max(Block.id)).one()[0]
+
+        if block_id_max is None:
+            return []
+
+        partitions = BlockRangePartitions(self.db_session, SearchIndex.__tablename__).get_partitions()
+
+        return [
+            (block_start, block_id_max if block_end is None else min(block_end, block_id_max))
+            for partition_name, block_start, block_end in partitions if block_start <= block_id_max
+        ] or [
+            (block_start, min(block_start + settings.PARTITION_BLOCK_RANGE - 1, block_id_max))
+            for block_start in range(0, block_id_max + 1, settings.PARTITION_BLOCK_RANGE)
+        ]
+
+    def rebuild_search_index(self, index_type_id=None):
+
+        for block_start, block_end in self.get_search_index_ranges():
+            self.rebuild_search_index_range(block_start, block_end, index_type_id)
+
+    def rebuild_search_index_range(self, block_start, block_end, index_type_id=None):
+        """
+        Rebuilds the search index of given block range in chunks of SEARCH_INDEX_REBUILD_CHUNK_SIZE blocks
+        :param block_start:
+        :param block_end:
+        :param index_type_id: only rebuild rows of this index type, other rows are left in place
+        :return:
+        """
+        if index_type_id is None:
+            BlockRangePartitions(self.db_session, SearchIndex.__tablename__).truncate(block_start, block_end)
+        else:
+            SearchIndex.query(self.db_session).filter(
+                SearchIndex.index_type_id == index_type_id,
+                SearchIndex.block_id.between(block_start, block_end)
+            ).delete(synchronize_session=False)
 
-        self.db_session.execute('truncate table {}'.format(SearchIndex.__tablename__))
+        self.db_session.commit()
 
-        for block in Block.query(self.db_session).order_by('id').yield_per(1000):
+        for chunk_start in range(block_start, block_end + 1, settings.SEARCH_INDEX_REBUILD_CHUNK_SIZE):
+            chunk_end = min(chunk_start + settings.SEARCH_INDEX_REBUILD_CHUNK_SIZE - 1, block_end)
 
-            extrinsic_lookup = {}
-            block._accounts_new = []
-            block._accounts_reaped = []
+            self.rebuild_search_index_chunk(chunk_start, chunk_end, index_type_id)
+            self.db_session.commit()
 
-            for extrinsic in Extrinsic.query(self.db_session).filter_by(block_id=block.id).order_by('extrinsic_idx'):
-                extrinsic_lookup[extrinsic.extrinsic_idx] = extrinsic
+    def rebuild_search_index_chunk(self, block_start, block_end, index_type_id=None):
+        # Extrinsics and events of all blocks in the chunk are retrieved at once instead of per block
+        block_extrinsics = defaultdict(list)
+        block_events = defaultdict(list)
 
-                # Add search index for signed extrinsics
-                if extrinsic.address:
-                    search_index = SearchIndex(
-                        index_type_id=settings.SEARCH_INDEX_SIGNED_EXTRINSIC,
-                        block_id=block.id,
-                        extrinsic_idx=extrinsic.extrinsic_idx,
-                        account_id=extrinsic.address
-                    )
-                    search_index.save(self.db_session)
+        for extrinsic in Extrinsic.query(self.db_session).filter(
+                Extrinsic.block_id.between(block_start, block_end)).order_by('block_id', 'extrinsic_idx'):
+            block_extrinsics[extrinsic.block_id].append(extrinsic)
 
-                # Process extrinsic processors
-                for processor_class in ProcessorRegistry().get_extrinsic_processors(extrinsic.module_id, extrinsic.call_id):
-                    extrinsic_processor = processor_class(block=block, extrinsic=extrinsic, substrate=self.substrate)
-                    extrinsic_processor.process_search_index(self.db_session)
+        for event in Event.query(self.db_session).filter(
+                Event.block_id.between(block_start, block_end)).order_by('block_id', 'event_idx'):
+            block_events[event.block_id].append(event)
 
-            for event in Event.query(self.db_session).filter_by(block_id=block.id).order_by('event_idx'):
-                extrinsic = None
-                if event.extrinsic_idx is not None:
-                    try:
-                        extrinsic = extrinsic_lookup[event.extrinsic_idx]
-                    except (IndexError, KeyError):
-                        extrinsic = None
+        # Index rows of the whole chunk are written per table, when rebuilding one index type other rows are dropped
+        with BulkInsertBuffer(self.db_session, accept=None if index_type_id is None else (
+                lambda obj: not isinstance(obj, SearchIndex) or obj.index_type_id == index_type_id)):
+            for block in Block.query(self.db_session).filter(
+                    Block.id.between(block_start, block_end)).order_by('id'):
 
-                for processor_class in ProcessorRegistry().get_event_processors(event.module_id, event.event_id):
-                    event_processor = processor_class(block, event, extrinsic,
-                                                      metadata=self.metadata_store.get(block.spec_version_id),
-                                                      substrate=self.substrate)
-                    event_processor.process_search_index(self.db_session)
+                with self.statement_monitor.scope('search_index', block.id):
+                    self.rebuild_block_search_index(block, block_extrinsics[block.id], block_events[block.id])
 
-            self.db_session.commit()
+    def rebuild_block_search_index(self, block, extrinsics=None, events=None):
+
+        if extrinsics is None:
+            extrinsics = Extrinsic.query(self.db_session).filter_by(block_id=block.id).order_by('extrinsic_idx')
+
+        if events is None:
+            events = Event.query(self.db_session).filter_by(block_id=block.id).order_by('event_idx')
+
+        extrinsic_lookup = {}
+        block._accounts_new = []
+        block._accounts_reaped = []
+
+        for extrinsic in extrinsics:
+            extrinsic_lookup[extrinsic.extrinsic_idx] = extrinsic
+
+            # Add search index for signed extrinsics
+            if extrinsic.address:
+                search_index = SearchIndex(
+                    index_type_id=settings.SEARCH_INDEX_SIGNED_EXTRINSIC,
+                    block_id=block.id,
+                    extrinsic_idx=extrinsic.extrinsic_idx,
+                    account_id=extrinsic.address
+                )
+                search_index.save(self.db_session)
+
+            # Process extrinsic processors
+            for processor_class in self.processor_registry.get_extrinsic_processors(
+                    extrinsic.module_id, extrinsic.call_id, 'process_search_index'):
+                extrinsic_processor = processor_class(block=block, extrinsic=extrinsic, substrate=self.substrate)
+                self.process_hook(extrinsic_processor, 'process_search_index', self.db_session)
+
+        for event in events:
+            extrinsic = None
+            if event.extrinsic_idx is not None:
+                try:
+                    extrinsic = extrinsic_lookup[event.extrinsic_idx]
+                except (IndexError, KeyError):
+                    extrinsic = None
+
+            for processor_class in self.processor_registry.get_event_processors(
+                    event.module_id, event.event_id, 'process_search_index'):
+                event_processor = processor_class(block, event, extrinsic,
+                                                  metadata=self.metadata_store.get(block.spec_version_id),
+                                                  substrate=self.substrate)
+                self.process_hook(event_processor, 'process_search_index', self.db_session)
 
     def create_full_balance_snaphot(self, block_id):
 
@@ -986,28 +1372,94 @@ class PolkascanHarvesterService(BaseService):
         )
 
         if storage_method:
+            self.init_runtime(block_hash)
+
+            metadata_module, storage_item = self.substrate.get_storage_item('System', 'Account')
+            return_scale_type = storage_item.type['MapType']['value']
+
             if storage_method.get("type_hasher_key1") == "Blake2_128Concat":
 
-                # get balances storage prefix
-                storage_key_prefix = self.substrate.generate_storage_hash(
-                    storage_module='System',
-                    storage_function='Account',
-                    metadata_version=settings.SUBSTRATE_METADATA_VERSION
-                )
+                # Page through all storage keys, accounts are extracted from storage key
+                storage_key_prefix = self.substrate.generate_storage_prefix('System', 'Account')
 
-                rpc_result = self.substrate.rpc_request(
-                    'state_getKeys',
-                    [storage_key_prefix, block_hash]
-                ).get('result')
-                # Extract accounts from storage key
-                accounts = [storage_key[-64:] for storage_key in rpc_result if len(storage_key) == 162]
+                for storage_keys in self.substrate.iter_storage_keys(storage_key_prefix, block_hash):
+                    storage_keys = {
+                        storage_key: storage_key[-64:] for storage_key in storage_keys if len(storage_key) == 162
+                    }
+
+                    self.create_balance_snapshots(block_id, block_hash, storage_keys, return_scale_type)
             else:
                 # Retrieve accounts from database for legacy blocks
                 accounts = [account[0] for account in self.db_session.query(distinct(Account.id))]
 
-            for account_id in accounts:
+                for offset in range(0, len(accounts), settings.RPC_STORAGE_PAGE_SIZE):
+                    storage_keys = {
+                        self.substrate.generate_runtime_storage_key(
+                            'System', 'Account', ['0x{}'.format(account_id)]
+                        )[0]: account_id for account_id in accounts[offset:offset + settings.RPC_STORAGE_PAGE_SIZE]
+                    }
+
+                    self.create_balance_snapshots(block_id, block_hash, storage_keys, return_scale_type)
+
+    def create_balance_snapshots(self, block_id, block_hash, storage_keys, return_scale_type):
+        """
+        Retrieves AccountInfo of multiple accounts in batched storage queries and stores them as snapshot
+        :param block_id:
+        :param block_hash:
+        :param storage_keys: dict of storage key and account id
+        :param return_scale_type: value type of System.Account
+        :return:
+        """
+        storage_values = self.substrate.query_storage_at(list(storage_keys.keys()), block_hash)
+
+        self.store_balance_snapshots(block_id, [
+            (account_id, self.substrate.decode_storage_value(return_scale_type, storage_values.get(storage_key)))
+            for storage_key, account_id in storage_keys.items()
+        ])
+
+    def store_balance_snapshots(self, block_id, account_infos):
+        """
+        Stores AccountInfo snapshots with multi-row upserts, replacing existing snapshots of the same block
+        :param block_id:
+        :param account_infos: list of tuples (account_id, decoded AccountInfo or None)
+        :return:
+        """
+        rows = []
+
+        for account_id, account_info_data in account_infos:
+            if account_info_data:
+                rows.append({
+                    'block_id': block_id,
+                    'account_id': account_id,
+                    'account_info': account_info_data,
+                    'balance_free': account_info_data["data"]["free"],
+                    'balance_reserved': account_info_data["data"]["reserved"],
+                    'balance_total': account_info_data["data"]["free"] + account_info_data["data"]["reserved"],
+                    'nonce': account_info_data["nonce"]
+                })
+            else:
+                rows.append({
+                    'block_id': block_id,
+                    'account_id': account_id,
+                    'account_info': None,
+                    'balance_free': None,
+                    'balance_reserved': None,
+                    'balance_total': None,
+                    'nonce': None
+                })
+
+        for offset in range(0, len(rows), settings.RPC_STORAGE_PAGE_SIZE):
+            insert_stmt = mysql_insert(AccountInfoSnapshot.__table__).values(
+                rows[offset:offset + settings.RPC_STORAGE_PAGE_SIZE]
+            )
 
-                self.create_balance_snapshot(block_id=block_id, account_id=account_id, block_hash=block_hash)
+            self.db_session.execute(insert_stmt.on_duplicate_key_update(
+                account_info=insert_stmt.inserted.account_info,
+                balance_free=insert_stmt.inserted.balance_free,
+                balance_reserved=insert_stmt.inserted.balance_reserved,
+                balance_total=insert_stmt.inserted.balance_total,
+                nonce=insert_stmt.inserted.nonce
+            ))
 
     def create_balance_snapshot(self, block_id, account_id, block_hash=None):
 
@@ -1023,37 +1475,14 @@ class PolkascanHarvesterService(BaseService):
                 block_hash=block_hash
             ).get('result')
 
-            # Make sure no rows inserted before processing this record
-            AccountInfoSnapshot.query(self.db_session).filter_by(block_id=block_id, account_id=account_id).delete()
-
-            if account_info_data:
-                account_info_obj = AccountInfoSnapshot(
-                    block_id=block_id,
-                    account_id=account_id,
-                    account_info=account_info_data,
-                    balance_free=account_info_data["data"]["free"],
-                    balance_reserved=account_info_data["data"]["reserved"],
-                    balance_total=account_info_data["data"]["free"] + account_info_data["data"]["reserved"],
-                    nonce=account_info_data["nonce"]
-                )
-            else:
-                account_info_obj = AccountInfoSnapshot(
-                    block_id=block_id,
-                    account_id=account_id,
-                    account_info=None,
-                    balance_free=None,
-                    balance_reserved=None,
-                    balance_total=None,
-                    nonce=None
-                )
+            self.store_balance_snapshots(block_id, [(account_id, account_info_data)])
 
-            account_info_obj.save(self.db_session)
         except ValueError:
             pass
 
     def update_account_balances(self):
         # set balances according to most recent snapshot
-        account_info = self.db_session.execute("""
+        account_info = self.db_session.execute(text("""
                         select
                            a.account_id, 
                            a.balance_total,
@@ -1069,7 +1498,7 @@ class PolkascanHarvesterService(BaseService):
                         group by account_id
                     ) as b
                     on a.account_id = b.account_id and a.block_id = b.max_block_id
-                    """)
+                    """).columns(account_id=AccountInfoSnapshot.account_id.type))
 
         for account_id, balance_total, balance_free, balance_reserved, nonce in account_info:
             Account.query(self.db_session).filter_by(id=account_id).update(
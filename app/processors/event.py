@@ -43,23 +43,24 @@ class NewSessionEventProcessor(EventProcessor):
     def add_session(self, db_session, session_id):
 
         nominators = []
-
-        # Retrieve current era
-        current_era = self.substrate.get_runtime_state(
-            module="Staking",
-            storage_function="CurrentEra",
-            params=[],
-            block_hash=self.block.hash
-        ).get('result')
-
-        # Retrieve validators for new session from storage
-
-        validators = self.substrate.get_runtime_state(
-            module="Session",
-            storage_function="Validators",
-            params=[],
-            block_hash=self.block.hash
-        ).get('result', [])
+        session_rows = []
+
+        # Retrieve current era and validators for new session from storage
+        current_era, validators = self.substrate.get_runtime_state_batch([
+            ("Staking", "CurrentEra", []),
+            ("Session", "Validators", [])
+        ], block_hash=self.block.hash)
+
+        validators = validators or []
+
+        # Retrieve controller account, validator preferences and exposure of all validators in one batch
+        validator_storage = self.substrate.get_runtime_state_batch([
+            storage_call for validator_account in validators for storage_call in (
+                ("Staking", "Bonded", [validator_account]),
+                ("Staking", "ErasValidatorPrefs", [current_era, validator_account]),
+                ("Staking", "ErasStakers", [current_era, validator_account])
+            )
+        ], block_hash=self.block.hash)
 
         for rank_nr, validator_account in enumerate(validators):
             validator_ledger = {}
@@ -67,36 +68,14 @@ class NewSessionEventProcessor(EventProcessor):
 
             validator_stash = validator_account.replace('0x', '')
 
-            # Retrieve controller account
-            validator_controller = self.substrate.get_runtime_state(
-                module="Staking",
-                storage_function="Bonded",
-                params=[validator_account],
-                block_hash=self.block.hash
-            ).get('result')
+            validator_controller, validator_prefs, exposure = validator_storage[rank_nr * 3:rank_nr * 3 + 3]
 
             if validator_controller:
                 validator_controller = validator_controller.replace('0x', '')
 
-            # Retrieve validator preferences for stash account
-            validator_prefs = self.substrate.get_runtime_state(
-                module="Staking",
-                storage_function="ErasValidatorPrefs",
-                params=[current_era, validator_account],
-                block_hash=self.block.hash
-            ).get('result')
-
             if not validator_prefs:
                 validator_prefs = {'commission': None}
 
-            # Retrieve bonded
-            exposure = self.substrate.get_runtime_state(
-                module="Staking",
-                storage_function="ErasStakers",
-                params=[current_era, validator_account],
-                block_hash=self.block.hash
-            ).get('result')
-
             if not exposure:
                 exposure = {}
 
@@ -121,22 +100,33 @@ class NewSessionEventProcessor(EventProcessor):
                 commission=validator_prefs.get('commission')
             )
 
-            session_validator.save(db_session)
+            session_rows.append(session_validator)
 
-            # Store nominators
-            for rank_nominator, nominator_info in enumerate(exposure.get('others', [])):
-                nominator_stash = nominator_info.get('who').replace('0x', '')
-                nominators.append(nominator_stash)
+            exposures = [
+                [nominator_info.get('who').replace('0x', ''), nominator_info.get('value')]
+                for nominator_info in exposure.get('others', [])
+            ]
 
-                session_nominator = SessionNominator(
-                    session_id=session_id,
-                    rank_validator=rank_nr,
-                    rank_nominator=rank_nominator,
-                    nominator_stash=nominator_stash,
-                    bonded=nominator_info.get('value'),
-                )
+            nominators += [nominator_stash for nominator_stash, bonded in exposures]
 
-                session_nominator.save(db_session)
+            # Store nominators
+            if settings.SESSION_COMPACT_EXPOSURES:
+                session_validator.exposures = exposures
+            else:
+                session_rows += [
+                    SessionNominator(
+                        session_id=session_id,
+                        rank_validator=rank_nr,
+                        rank_nominator=rank_nominator,
+                        nominator_stash=nominator_stash,
+                        bonded=bonded,
+                    )
+                    for rank_nominator, (nominator_stash, bonded) in enumerate(exposures)
+                ]
+
+        # Written in one flush instead of per row
+        db_session.add_all(session_rows)
+        db_session.flush()
 
         # Store session
         session = Session(
@@ -168,33 +158,9 @@ class NewSessionEventProcessor(EventProcessor):
 
         session_total.save(db_session)
 
-        # Update validator flags
-        validator_ids = [v.replace('0x', '') for v in validators]
-
-        Account.query(db_session).filter(
-            Account.id.in_(validator_ids), Account.was_validator == False
-        ).update({Account.was_validator: True}, synchronize_session='fetch')
-
-        Account.query(db_session).filter(
-            Account.id.notin_(validator_ids), Account.is_validator == True
-        ).update({Account.is_validator: False}, synchronize_session='fetch')
-
-        Account.query(db_session).filter(
-            Account.id.in_(validator_ids), Account.is_validator == False
-        ).update({Account.is_validator: True}, synchronize_session='fetch')
-
-        # Update nominator flags
-        Account.query(db_session).filter(
-            Account.id.in_(nominators), Account.was_nominator == False
-        ).update({Account.was_nominator: True}, synchronize_session='fetch')
-
-        Account.query(db_session).filter(
-            Account.id.notin_(nominators), Account.is_nominator == True
-        ).update({Account.is_nominator: False}, synchronize_session='fetch')
-
-        Account.query(db_session).filter(
-            Account.id.in_(nominators), Account.is_nominator == False
-        ).update({Account.is_nominator: True}, synchronize_session='fetch')
+        # Update validator and nominator flags of accounts that joined or left the set
+        Account.update_flag_members(db_session, 'validator', [v.replace('0x', '') for v in validators])
+        Account.update_flag_members(db_session, 'nominator', nominators)
 
     def add_session_old(self, db_session, session_id):
         current_era = None
@@ -499,33 +465,9 @@ class NewSessionEventProcessor(EventProcessor):
 
         session_total.save(db_session)
 
-        # Update validator flags
-        validator_ids = [v.replace('0x', '') for v in validators]
-
-        Account.query(db_session).filter(
-            Account.id.in_(validator_ids), Account.was_validator == False
-        ).update({Account.was_validator: True}, synchronize_session='fetch')
-
-        Account.query(db_session).filter(
-            Account.id.notin_(validator_ids), Account.is_validator == True
-        ).update({Account.is_validator: False}, synchronize_session='fetch')
-        Account.query(db_session).filter(
-
-            Account.id.in_(validator_ids), Account.is_validator == False
-        ).update({Account.is_validator: True}, synchronize_session='fetch')
-
-        # Update nominator flags
-        Account.query(db_session).filter(
-            Account.id.in_(nominators), Account.was_nominator == False
-        ).update({Account.was_nominator: True}, synchronize_session='fetch')
-
-        Account.query(db_session).filter(
-            Account.id.notin_(nominators), Account.is_nominator == True
-        ).update({Account.is_nominator: False}, synchronize_session='fetch')
-
-        Account.query(db_session).filter(
-            Account.id.in_(nominators), Account.is_nominator == False
-        ).update({Account.is_nominator: True}, synchronize_session='fetch')
+        # Update validator and nominator flags of accounts that joined or left the set
+        Account.update_flag_members(db_session, 'validator', [v.replace('0x', '') for v in validators])
+        Account.update_flag_members(db_session, 'nominator', nominators)
 
     def accumulation_hook(self, db_session):
         self.block.count_sessions_new += 1
@@ -539,24 +481,37 @@ class NewSessionEventProcessor(EventProcessor):
             self.add_session_old(db_session, session_id)
 
     def process_search_index(self, db_session):
-        try:
-            validators = self.substrate.get_runtime_state(
-                module="Session",
-                storage_function="Validators",
-                params=[],
-                block_hash=self.block.hash
-            ).get('result', [])
-
-            # Add search indices for validators sessions
-            for account_id in validators:
-                search_index = self.add_search_index(
-                    index_type_id=settings.SEARCH_INDEX_STAKING_SESSION,
-                    account_id=account_id.replace('0x', '')
-                )
+        session_id = self.event.attributes[0]['value']
+
+        # Validators are stored when the session is sequenced, so rebuilds don't need the node
+        validators = [
+            validator_stash for validator_stash, in db_session.query(SessionValidator.validator_stash).filter_by(
+                session_id=session_id
+            ).order_by(SessionValidator.rank_validator)
+        ]
 
-                search_index.save(db_session)
-        except ValueError:
-            pass
+        if not validators:
+            # Session not sequenced yet
+            try:
+                validators = [
+                    account_id.replace('0x', '') for account_id in self.substrate.get_runtime_state(
+                        module="Session",
+                        storage_function="Validators",
+                        params=[],
+                        block_hash=self.block.hash
+                    ).get('result', [])
+                ]
+            except ValueError:
+                pass
+
+        # Add search indices for validators sessions
+        for account_id in validators:
+            search_index = self.add_search_index(
+                index_type_id=settings.SEARCH_INDEX_STAKING_SESSION,
+                account_id=account_id
+            )
+
+            search_index.save(db_session)
 
 
 class NewAccountEventProcessor(EventProcessor):
@@ -1185,17 +1140,7 @@ class CouncilNewTermEventProcessor(EventProcessor):
             member_struct['account'].replace('0x', '') for member_struct in self.event.attributes[0]['value']
         ]
 
-        Account.query(db_session).filter(
-            Account.id.in_(new_member_ids), Account.was_council_member == False
-        ).update({Account.was_council_member: True}, synchronize_session='fetch')
-
-        Account.query(db_session).filter(
-            Account.id.notin_(new_member_ids), Account.is_council_member == True
-        ).update({Account.is_council_member: False}, synchronize_session='fetch')
-
-        Account.query(db_session).filter(
-            Account.id.in_(new_member_ids), Account.is_council_member == False
-        ).update({Account.is_council_member: True}, synchronize_session='fetch')
+        Account.update_flag_members(db_session, 'council_member', new_member_ids)
 
     def process_search_index(self, db_session):
 
@@ -1285,17 +1230,7 @@ class RegistrarAddedEventProcessor(EventProcessor):
 
         registrar_ids = [registrar['account'].replace('0x', '') for registrar in registrars]
 
-        Account.query(db_session).filter(
-            Account.id.in_(registrar_ids), Account.was_registrar == False
-        ).update({Account.was_registrar: True}, synchronize_session='fetch')
-
-        Account.query(db_session).filter(
-            Account.id.notin_(registrar_ids), Account.is_registrar == True
-        ).update({Account.is_registrar: False}, synchronize_session='fetch')
-
-        Account.query(db_session).filter(
-            Account.id.in_(registrar_ids), Account.is_registrar == False
-        ).update({Account.is_registrar: True}, synchronize_session='fetch')
+        Account.update_flag_members(db_session, 'registrar', registrar_ids)
 
 
 class StakingBonded(EventProcessor):
@@ -0,0 +1,311 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  market.py
+
+""" Incremental OHLCV candle engine: trades of every sequenced block are applied to in-memory candles of all configured
+    intervals and only changed candles are written, so the cost per block depends on the amount of trades in the block
+    instead of the size of the current bucket. Candles of a newly configured interval are derived in batch by rolling
+    up candles of a lower interval.
+
+"""
+import datetime
+from collections import OrderedDict
+
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from app import settings
+from app.models.data import Trade, MarketCandle
+
+CANDLE_INTERVAL_UNITS = {
+    'm': datetime.timedelta(minutes=1),
+    'h': datetime.timedelta(hours=1),
+    'd': datetime.timedelta(days=1),
+    'w': datetime.timedelta(weeks=1)
+}
+
+# A Monday, so buckets of a week start on Monday
+BUCKET_EPOCH = datetime.datetime(1970, 1, 5)
+
+# Amount of candles read and written at once by a roll-up
+ROLLUP_BATCH_SIZE = 1000
+
+
+def parse_interval(interval):
+    """
+    :param interval: amount and unit, e.g. 15m, 4h, 1d or 1w
+    :return: timedelta
+    """
+    try:
+        amount = int(interval[:-1])
+        unit = CANDLE_INTERVAL_UNITS[interval[-1]]
+    except (ValueError, KeyError, IndexError):
+        raise ValueError('Invalid candle interval "{}"'.format(interval))
+
+    if amount <= 0:
+        raise ValueError('Invalid candle interval "{}"'.format(interval))
+
+    return amount * unit
+
+
+def get_candle_intervals(intervals=None):
+    """
+    :param intervals: list of interval names, defaults to MARKET_CANDLE_INTERVALS
+    :return: OrderedDict of interval name and length, shortest first
+    """
+    intervals = [interval.strip() for interval in (intervals or settings.MARKET_CANDLE_INTERVALS) if interval.strip()]
+
+    return OrderedDict(sorted(
+        ((interval, parse_interval(interval)) for interval in intervals), key=lambda item: item[1]
+    ))
+
+
+class Candle(object):
+
+    __slots__ = ('time', 'open', 'high', 'low', 'close', 'base_amount', 'quote_amount', 'has_trades')
+
+    def __init__(self, time, open, high, low, close, base_amount=0, quote_amount=0, has_trades=False):
+        self.time = time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.base_amount = base_amount
+        self.quote_amount = quote_amount
+        self.has_trades = has_trades
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(
+            time=record.time,
+            open=record.open,
+            high=record.high,
+            low=record.low,
+            close=record.close,
+            base_amount=record.base_amount,
+            quote_amount=record.quote_amount,
+            # Candles without volume are carried forward closes of the previous bucket
+            has_trades=bool(record.base_amount)
+        )
+
+    @classmethod
+    def carry_forward(cls, time, close):
+        return cls(time=time, open=close, high=close, low=close, close=close)
+
+    def update(self, open, high, low, close, base_amount, quote_amount):
+        if not self.has_trades:
+            # First trades replace the carried forward close
+            self.open, self.high, self.low, self.close = open, high, low, close
+            self.base_amount = base_amount
+            self.quote_amount = quote_amount
+            self.has_trades = True
+        else:
+            self.high = max(self.high, high)
+            self.low = min(self.low, low)
+            self.close = close
+            self.base_amount += base_amount
+            self.quote_amount += quote_amount
+
+    def add_trade(self, trade):
+        self.update(trade.price, trade.price, trade.price, trade.price, trade.base_amount, trade.quote_amount)
+
+    def add_candle(self, candle):
+        # A candle without trades doesn't change the candle it is rolled up in
+        if candle.has_trades:
+            self.update(candle.open, candle.high, candle.low, candle.close, candle.base_amount, candle.quote_amount)
+
+    def as_values(self):
+        return {
+            'time': self.time,
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'close': self.close,
+            'base_amount': self.base_amount,
+            'quote_amount': self.quote_amount
+        }
+
+
+class CandleEngine(object):
+    """
+    Keeps the candles of the current bucket of every interval in memory. Blocks have to be processed in order; when a
+    block starts a new bucket, candles of that bucket are loaded and pairs that had a candle in the previous bucket
+    get a candle at the previous close.
+    """
+
+    def __init__(self, intervals=None):
+        self.intervals = get_candle_intervals(intervals)
+        self.buckets = {}
+        self.candles = {}
+        self.changed_pairs = {}
+        self.last_block_id = None
+
+    @staticmethod
+    def get_bucket(block_datetime, interval_length):
+        if block_datetime.tzinfo:
+            block_datetime = block_datetime.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+        return BUCKET_EPOCH + ((block_datetime - BUCKET_EPOCH) // interval_length) * interval_length
+
+    def load_bucket(self, db_session, interval, bucket):
+        interval_length = self.intervals[interval]
+
+        candles = {}
+        previous_candles = {}
+
+        for record in MarketCandle.query(db_session).filter(
+                MarketCandle.interval == interval,
+                MarketCandle.time.in_([bucket, bucket - interval_length])
+        ):
+            record_time = record.time.replace(tzinfo=None) if record.time.tzinfo else record.time
+            bucket_candles = candles if record_time == bucket else previous_candles
+            bucket_candles[(record.base, record.quote)] = Candle.from_record(record)
+
+        self.changed_pairs[interval] = set()
+
+        for pair, previous_candle in previous_candles.items():
+            if pair not in candles:
+                candles[pair] = Candle.carry_forward(bucket, previous_candle.close)
+                self.changed_pairs[interval].add(pair)
+
+        self.buckets[interval] = bucket
+        self.candles[interval] = candles
+
+    def process_block(self, db_session, block):
+        trades = Trade.query(db_session).filter_by(block_id=block.id).order_by(Trade.event_idx).all()
+
+        # State is only valid for the direct successor of the last processed block
+        if self.last_block_id is None or block.id != self.last_block_id + 1:
+            self.buckets = {}
+
+        for interval, interval_length in self.intervals.items():
+            bucket = self.get_bucket(block.datetime, interval_length)
+
+            if self.buckets.get(interval) != bucket:
+                self.load_bucket(db_session, interval, bucket)
+
+            candles = self.candles[interval]
+            changed_pairs = self.changed_pairs[interval]
+
+            for trade in trades:
+                pair = (trade.base, trade.quote)
+
+                if pair not in candles:
+                    candles[pair] = Candle.carry_forward(bucket, trade.price)
+
+                candles[pair].add_trade(trade)
+                changed_pairs.add(pair)
+
+            self.store(db_session, interval, [(pair, candles[pair]) for pair in changed_pairs])
+            self.changed_pairs[interval] = set()
+
+        self.last_block_id = block.id
+
+    @staticmethod
+    def store(db_session, interval, candles):
+        """
+        Upserts candles of given interval in one statement
+        :param db_session:
+        :param interval:
+        :param candles: list of tuples ((base, quote), Candle)
+        :return:
+        """
+        if not candles:
+            return
+
+        insert_stmt = mysql_insert(MarketCandle.__table__).values([
+            dict(interval=interval, base=base, quote=quote, **candle.as_values()) for (base, quote), candle in candles
+        ])
+
+        db_session.execute(insert_stmt.on_duplicate_key_update(
+            open=insert_stmt.inserted.open,
+            high=insert_stmt.inserted.high,
+            low=insert_stmt.inserted.low,
+            close=insert_stmt.inserted.close,
+            base_amount=insert_stmt.inserted.base_amount,
+            quote_amount=insert_stmt.inserted.quote_amount
+        ))
+
+    def get_rollup_source(self, interval):
+        """
+        :return: the longest configured interval of which the length divides the length of given interval, or None
+        """
+        interval_length = self.intervals[interval]
+
+        for source_interval, source_length in reversed(self.intervals.items()):
+            if source_length < interval_length and interval_length % source_length == datetime.timedelta(0):
+                return source_interval
+
+    def rollup(self, db_session, interval, time_from=None):
+        """
+        Derives candles of given interval from candles of its roll-up source interval. The bucket of the latest source
+        candle is left to the sequencer, as it is still incomplete.
+        :param db_session:
+        :param interval:
+        :param time_from: only buckets from the bucket of this time are rolled up
+        :return: amount of stored candles
+        """
+        source_interval = self.get_rollup_source(interval)
+
+        if source_interval is None:
+            raise ValueError('No interval to roll up "{}" from'.format(interval))
+
+        interval_length = self.intervals[interval]
+
+        latest_source = MarketCandle.query(db_session).filter(
+            MarketCandle.interval == source_interval
+        ).order_by(MarketCandle.time.desc()).first()
+
+        if not latest_source:
+            return 0
+
+        query = MarketCandle.query(db_session).filter(
+            MarketCandle.interval == source_interval,
+            MarketCandle.time < self.get_bucket(latest_source.time, interval_length)
+        )
+
+        if time_from:
+            query = query.filter(MarketCandle.time >= self.get_bucket(time_from, interval_length))
+
+        candles = []
+        current_pair = current_candle = None
+        stored_count = 0
+
+        for record in query.order_by(MarketCandle.base, MarketCandle.quote, MarketCandle.time).yield_per(
+                ROLLUP_BATCH_SIZE):
+
+            pair = (record.base, record.quote)
+            bucket = self.get_bucket(record.time, interval_length)
+            source_candle = Candle.from_record(record)
+
+            if pair != current_pair or bucket != current_candle.time:
+                current_pair = pair
+                current_candle = Candle.carry_forward(bucket, source_candle.open)
+                candles.append((pair, current_candle))
+
+                # Last candle can still change
+                if len(candles) > ROLLUP_BATCH_SIZE:
+                    self.store(db_session, interval, candles[:-1])
+                    stored_count += len(candles) - 1
+                    candles = candles[-1:]
+
+            current_candle.add_candle(source_candle)
+
+        self.store(db_session, interval, candles)
+
+        return stored_count + len(candles)
@@ -0,0 +1,209 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  prefetch.py
+
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from app import settings
+from app.processors.runtime_index import RuntimeVersionIndex
+from app.utils.substrate import HarvesterSubstrateInterface
+from substrateinterface.constants import STORAGE_HASH_SYSTEM_EVENTS_V9
+
+
+class PrefetchedBlock(object):
+
+    def __init__(self, block_hash, json_block, runtime_version, parent_runtime_version=None, events_data=None):
+        self.block_hash = block_hash
+        self.json_block = json_block
+        self.runtime_version = runtime_version
+        self.parent_runtime_version = parent_runtime_version
+        self.events_data = events_data
+
+    @property
+    def block_id(self):
+        return int(self.json_block['block']['header']['number'], 16)
+
+    @property
+    def parent_hash(self):
+        return self.json_block['block']['header']['parentHash']
+
+
+class BlockPrefetcher(object):
+    """
+    Bounded prefetch stage of the accumulator. While the harvester decodes and persists the current block, the
+    header, extrinsics, runtime versions and raw events of the next `depth` blocks are retrieved concurrently.
+    """
+
+    def __init__(self, depth=None, workers=None, substrate=None):
+        self.depth = max(depth or settings.ACCUMULATE_PREFETCH_DEPTH, 1)
+        self.workers = max(workers or settings.ACCUMULATE_PREFETCH_WORKERS, 1)
+        self.substrate = substrate or HarvesterSubstrateInterface(settings.SUBSTRATE_RPC_URL)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._stop = threading.Event()
+        self._walker = None
+
+    @classmethod
+    def is_supported(cls, url=None):
+        # Websocket requests run on the asyncio loop of the main thread, so only HTTP can be requested concurrently
+        url = url or settings.SUBSTRATE_RPC_URL
+        return url[0:7] == 'http://' or url[0:8] == 'https://'
+
+    def rpc_result(self, method, params):
+        return self.substrate.rpc_request(method, params).get('result')
+
+    def get_runtime_version(self, block_id, block_hash):
+        runtime_version = None
+
+        # Only the in-memory index is used here, as this runs outside of the database session thread
+        if settings.ACCUMULATE_RUNTIME_INDEX:
+            runtime_version = RuntimeVersionIndex().get_runtime_version(block_id)
+
+        return runtime_version or self.rpc_result('chain_getRuntimeVersion', [block_hash])
+
+    def fetch_block(self, block_hash, parent_hash=None):
+
+        json_block = self.rpc_result('chain_getBlock', [block_hash])
+
+        if not json_block:
+            raise ValueError('Block {} not found'.format(block_hash))
+
+        if not parent_hash:
+            parent_hash = json_block['block']['header']['parentHash']
+
+        block_id = int(json_block['block']['header']['number'], 16)
+
+        runtime_version = self.get_runtime_version(block_id, block_hash)
+
+        if block_id > 0:
+            parent_runtime_version = self.get_runtime_version(block_id - 1, parent_hash)
+        else:
+            parent_runtime_version = runtime_version
+
+        # Raw events are decoded by the harvester once the metadata is known; pre-V9 storage falls back to a lookup
+        events_data = self.rpc_result('state_getStorageAt', [STORAGE_HASH_SYSTEM_EVENTS_V9, block_hash])
+
+        return PrefetchedBlock(
+            block_hash=block_hash,
+            json_block=json_block,
+            runtime_version=runtime_version,
+            parent_runtime_version=parent_runtime_version,
+            events_data=events_data
+        )
+
+    def fetch_block_by_number(self, block_id):
+        block_hash = self.rpc_result('chain_getBlockHash', [block_id])
+
+        if not block_hash:
+            raise ValueError('Block #{} not found'.format(block_id))
+
+        return self.fetch_block(block_hash)
+
+    def ancestors(self, block_hash, end_block_hash=None, count=None):
+        """
+        Yields given block and its ancestors in order until `end_block_hash`, genesis or `count` blocks are reached.
+        Parent hashes are followed with lightweight header requests so the full block retrieval of ancestors can
+        start before the current block is processed.
+        :param block_hash:
+        :param end_block_hash:
+        :param count:
+        :return: generator of PrefetchedBlock
+        """
+        futures = queue.Queue(maxsize=self.depth)
+
+        self._walker = threading.Thread(
+            target=self._walk_ancestors,
+            args=(futures, block_hash, end_block_hash, count),
+            daemon=True
+        )
+        self._walker.start()
+
+        while True:
+            future = futures.get()
+            if future is None:
+                break
+            yield future.result()
+
+    def _walk_ancestors(self, futures, block_hash, end_block_hash, count):
+        nr = 0
+        try:
+            while not self._stop.is_set() and (count is None or nr < count):
+                header = self.rpc_result('chain_getHeader', [block_hash])
+
+                if not header:
+                    raise ValueError('Block {} not found'.format(block_hash))
+
+                self._put(futures, self.executor.submit(self.fetch_block, block_hash, header['parentHash']))
+                nr += 1
+
+                if block_hash == end_block_hash or int(header['number'], 16) == 0:
+                    break
+
+                block_hash = header['parentHash']
+
+        except Exception as e:
+            failed = Future()
+            failed.set_exception(e)
+            self._put(futures, failed)
+
+        self._put(futures, None)
+
+    def _put(self, futures, item):
+        while not self._stop.is_set():
+            try:
+                futures.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def block_range(self, block_start, block_end, reverse=False):
+        """
+        Yields blocks for an explicit block number range (inclusive) with at most `depth` blocks in flight
+        :param block_start:
+        :param block_end:
+        :param reverse: process from block_end down to block_start
+        :return: generator of PrefetchedBlock
+        """
+        block_ids = range(block_start, block_end + 1)
+
+        if reverse:
+            block_ids = reversed(block_ids)
+
+        block_ids = iter(block_ids)
+        pending = deque()
+
+        for block_id in block_ids:
+            pending.append(self.executor.submit(self.fetch_block_by_number, block_id))
+            if len(pending) >= self.depth:
+                break
+
+        while pending:
+            prefetched_block = pending.popleft().result()
+
+            block_id = next(block_ids, None)
+            if block_id is not None:
+                pending.append(self.executor.submit(self.fetch_block_by_number, block_id))
+
+            yield prefetched_block
+
+    def close(self):
+        self._stop.set()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,147 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  runtime_index.py
+
+import time
+from bisect import bisect_right
+
+from app import settings
+from app.models.harvester import RuntimeVersionRange
+from app.processors.base import Singleton
+
+
+class RuntimeVersionIndex(metaclass=Singleton):
+    """
+    Index of block number ranges per spec version. Upgrade boundaries are located with a binary search over
+    `chain_getRuntimeVersion`, which relies on spec versions never decreasing on chain. Only finalized blocks
+    are indexed, lookups of blocks outside the index return None.
+    """
+
+    def __init__(self):
+        self.block_starts = []
+        self.block_ends = []
+        self.spec_versions = []
+        self.loaded_at = None
+
+    def load(self, db_session):
+        block_starts = []
+        block_ends = []
+        spec_versions = []
+
+        for runtime_range in RuntimeVersionRange.query(db_session).order_by('block_start'):
+            block_starts.append(runtime_range.block_start)
+            block_ends.append(runtime_range.block_end)
+            spec_versions.append(runtime_range.spec_version)
+
+        # Replace lists at once, as the index is read by prefetch threads
+        self.block_starts, self.block_ends, self.spec_versions = block_starts, block_ends, spec_versions
+        self.loaded_at = time.time()
+
+    def get_spec_version(self, block_id, db_session=None):
+        """
+        Lookup spec version of given block number in the index
+        :param block_id:
+        :param db_session: when provided the index is reloaded (at most every RUNTIME_INDEX_RELOAD_INTERVAL seconds)
+        if the block is beyond the loaded index
+        :return: spec version or None
+        """
+        block_starts, block_ends, spec_versions = self.block_starts, self.block_ends, self.spec_versions
+
+        if (not block_ends or block_id > block_ends[-1]) and db_session is not None and (
+                self.loaded_at is None or time.time() - self.loaded_at > settings.RUNTIME_INDEX_RELOAD_INTERVAL):
+            self.load(db_session)
+            block_starts, block_ends, spec_versions = self.block_starts, self.block_ends, self.spec_versions
+
+        idx = bisect_right(block_starts, block_id) - 1
+
+        if idx >= 0 and block_id <= block_ends[idx]:
+            return spec_versions[idx]
+
+    def get_runtime_version(self, block_id, db_session=None):
+        # Same format as the relevant part of `chain_getRuntimeVersion` result
+        spec_version = self.get_spec_version(block_id, db_session)
+
+        if spec_version is not None:
+            return {'specVersion': spec_version}
+
+    def update(self, db_session, substrate, block_end):
+        """
+        Extends the persisted index up to and including `block_end`
+        :param db_session:
+        :param substrate:
+        :param block_end: finalized block number
+        :return: list of new ranges
+        """
+        last_range = RuntimeVersionRange.query(db_session).order_by(RuntimeVersionRange.block_start.desc()).first()
+
+        if not last_range:
+            last_range = RuntimeVersionRange(
+                block_start=0,
+                block_end=0,
+                spec_version=self.request_spec_version(substrate, 0)
+            )
+
+        if block_end <= last_range.block_end:
+            return []
+
+        boundaries = self.find_boundaries(
+            substrate,
+            last_range.block_end, last_range.spec_version,
+            block_end, self.request_spec_version(substrate, block_end)
+        )
+
+        new_ranges = []
+
+        for block_start, spec_version in boundaries:
+            last_range.block_end = block_start - 1
+            last_range.save(db_session)
+
+            last_range = RuntimeVersionRange(
+                block_start=block_start,
+                block_end=block_start,
+                spec_version=spec_version
+            )
+            new_ranges.append(last_range)
+
+        last_range.block_end = block_end
+        last_range.save(db_session)
+
+        return new_ranges
+
+    def find_boundaries(self, substrate, block_lo, spec_version_lo, block_hi, spec_version_hi):
+        """
+        Binary search for spec version upgrades between two blocks of which the spec version is known
+        :return: list of tuples (first block number, spec version) of each upgrade after block_lo, in order
+        """
+        if spec_version_lo == spec_version_hi:
+            return []
+
+        if block_hi - block_lo == 1:
+            return [(block_hi, spec_version_hi)]
+
+        block_mid = (block_lo + block_hi) // 2
+        spec_version_mid = self.request_spec_version(substrate, block_mid)
+
+        return self.find_boundaries(substrate, block_lo, spec_version_lo, block_mid, spec_version_mid) + \
+            self.find_boundaries(substrate, block_mid, spec_version_mid, block_hi, spec_version_hi)
+
+    @staticmethod
+    def request_spec_version(substrate, block_id):
+        block_hash = substrate.get_block_hash(block_id)
+        return substrate.get_block_runtime_version(block_hash).get('specVersion')
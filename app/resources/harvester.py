@@ -30,13 +30,17 @@ from falcon.media.validators.jsonschema import validate
 from sqlalchemy import text, func
 
 from app import settings
-from app.models.data import Block, BlockTotal, MarketHistory_1m, MarketHistory_5m, MarketHistory_1h, MarketHistory_1d
-from app.models.harvester import Setting, Status
+from app.models.data import Block, BlockTotal, MarketCandle, SearchIndex
+from app.models.harvester import Setting, Status, Metric
 from app.resources.base import BaseResource
 from app.schemas import load_schema
 from app.processors.converters import PolkascanHarvesterService, BlockAlreadyAdded, BlockIntegrityError
+from app.processors.market import CandleEngine, get_candle_intervals
 from substrateinterface import SubstrateInterface
-from app.tasks import accumulate_block_recursive, start_harvester, rebuild_search_index, rebuild_account_info_snapshot
+from app.tasks import accumulate_block_recursive, start_harvester, rebuild_search_index, rebuild_account_info_snapshot, \
+    start_bulk_load_mode, stop_bulk_load_mode, calculate_market_history
+from app.utils.bulk_load import BulkLoadMode
+from app.utils.profiler import Profiler
 from app.settings import SUBSTRATE_RPC_URL, TYPE_REGISTRY
 
 
@@ -139,6 +143,7 @@ class PolkascanHarvesterStatusResource(BaseResource):
             'best_block_datetime': best_block_datetime,
             'best_block_nr': best_block_nr,
             'sequencer_task': sequencer_task.value,
+            'bulk_load_mode': BulkLoadMode.get_state(self.session),
             'sequencer_head': sequencer_head,
             'integrity_head': int(integrity_head.value),
             'chain_head_block_id': chain_head_block_id,
@@ -330,13 +335,16 @@ class StartIntegrityResource(BaseResource):
 class RebuildSearchIndexResource(BaseResource):
 
     def on_post(self, req, resp):
+        # Optionally only rebuild one index type
+        index_type_id = req.media.get('index_type_id') if req.media else None
+
         if settings.CELERY_RUNNING:
-            task = rebuild_search_index.delay()
+            task = rebuild_search_index.delay(index_type_id=index_type_id)
             data = {
                 'task_id': task.id
             }
         else:
-            data = rebuild_search_index()
+            data = rebuild_search_index(index_type_id=index_type_id)
 
         resp.status = falcon.HTTP_201
 
@@ -346,6 +354,122 @@ class RebuildSearchIndexResource(BaseResource):
         }
 
 
+class BulkLoadModeResource(BaseResource):
+
+    def on_get(self, req, resp):
+        resp.status = falcon.HTTP_200
+        resp.media = {
+            'status': 'success',
+            'data': {
+                'state': BulkLoadMode.get_state(self.session)
+            }
+        }
+
+    def on_post(self, req, resp):
+        # Enables bulk load mode (drops deferred indexes) or with {"enabled": false} rebuilds the indexes, which also
+        # happens automatically when the backfill is completed
+        if req.media and req.media.get('enabled') is False:
+            task = stop_bulk_load_mode
+        else:
+            task = start_bulk_load_mode
+
+        if settings.CELERY_RUNNING:
+            data = {
+                'task_id': task.delay().id
+            }
+        else:
+            data = task()
+
+        resp.status = falcon.HTTP_201
+
+        resp.media = {
+            'status': 'Bulk load mode task created',
+            'data': data
+        }
+
+
+class MetricsResource(BaseResource):
+
+    def on_get(self, req, resp):
+        # Prometheus text exposition format
+        resp.status = falcon.HTTP_200
+        resp.content_type = 'text/plain; version=0.0.4'
+        resp.body = Profiler.export_prometheus(self.session)
+
+    def on_delete(self, req, resp):
+        Metric.query(self.session).delete()
+        self.session.commit()
+
+        resp.status = falcon.HTTP_200
+        resp.media = {
+            'status': 'success',
+            'data': {
+                'message': 'Metrics reset'
+            }
+        }
+
+
+class MetricsJSONResource(BaseResource):
+
+    def on_get(self, req, resp):
+        histograms = Profiler.get_histograms(self.session)
+
+        # Largest total time first
+        resp.status = falcon.HTTP_200
+        resp.media = {
+            'status': 'success',
+            'data': [
+                {
+                    'name': name,
+                    'labels': labels,
+                    'count': histogram['count'],
+                    'sum': histogram['sum'],
+                    'avg': histogram['sum'] / histogram['count'] if histogram['count'] else None,
+                    'buckets': [{'le': le, 'count': count} for le, count in histogram['buckets']]
+                }
+                for (name, labels), histogram in sorted(
+                    histograms.items(), key=lambda item: item[1]['sum'], reverse=True
+                )
+            ]
+        }
+
+
+class AccountActivityResource(BaseResource):
+
+    max_page_size = 100
+
+    def on_get(self, req, resp, account_id):
+        # Cursor is the position of the last row of the previous page, formatted as "<block_id>-<id>"
+        try:
+            index_type_id = req.get_param_as_int('index_type_id')
+            page_size = req.get_param_as_int('page_size', min=1, max=self.max_page_size) or 25
+            cursor = req.get_param('cursor')
+            before = tuple(int(value) for value in cursor.split('-', 1)) if cursor else None
+        except (falcon.HTTPBadRequest, ValueError):
+            resp.status = falcon.HTTP_BAD_REQUEST
+            return
+
+        search_indexes = SearchIndex.get_account_activity(
+            self.session, account_id.replace('0x', ''), index_type_id=index_type_id, before=before, limit=page_size
+        )
+
+        data = []
+
+        for search_index in search_indexes:
+            item = search_index.serialize()
+            if isinstance(item['attributes']['sorting_value'], Decimal):
+                item['attributes']['sorting_value'] = int(item['attributes']['sorting_value'])
+            data.append(item)
+
+        if len(search_indexes) == page_size:
+            next_cursor = '{}-{}'.format(search_indexes[-1].block_id, search_indexes[-1].id)
+        else:
+            next_cursor = None
+
+        resp.status = falcon.HTTP_200
+        resp.media = self.get_jsonapi_response(data=data, meta={'next_cursor': next_cursor})
+
+
 class RebuildAccountInfoResource(BaseResource):
 
     def on_post(self, req, resp):
@@ -364,27 +488,61 @@ class RebuildAccountInfoResource(BaseResource):
             'data': data
         }
 
+class MarketHistoryRollupResource(BaseResource):
+
+    def on_post(self, req, resp):
+        intervals = req.media.get('intervals') if req.media else None
+        time_from = req.media.get('time_from') if req.media else None
+
+        if intervals and not set(intervals).issubset(get_candle_intervals()):
+            resp.status = falcon.HTTP_BAD_REQUEST
+            resp.media = {'errors': ['Unknown interval']}
+            return
+
+        if intervals and not all([CandleEngine().get_rollup_source(interval) for interval in intervals]):
+            resp.status = falcon.HTTP_BAD_REQUEST
+            resp.media = {'errors': ['Interval can not be derived from a lower interval']}
+            return
+
+        if time_from:
+            try:
+                datetime.datetime.strptime(time_from, '%Y-%m-%d %H:%M:%S')
+            except (TypeError, ValueError):
+                resp.status = falcon.HTTP_BAD_REQUEST
+                resp.media = {'errors': ['Invalid time_from, expected format YYYY-MM-DD HH:MM:SS']}
+                return
+
+        if settings.CELERY_RUNNING:
+            task = calculate_market_history.delay(intervals=intervals, time_from=time_from)
+            data = {
+                'task_id': task.id
+            }
+        else:
+            data = calculate_market_history(intervals=intervals, time_from=time_from)
+
+        resp.status = falcon.HTTP_201
+
+        resp.media = {
+            'status': 'Market history roll-up task created',
+            'data': data
+        }
+
+
 class MarketHistoryResource(BaseResource):
     def on_get(self, req, resp):
         if not req.params.get("interval") or not req.params.get("base") or not req.params.get("quote") or not req.params.get("time"):
             resp.status = falcon.HTTP_BAD_REQUEST
-        elif req.params.get("interval") in ["1m", "5m", "1h", "1d"]:
+        elif req.params.get("interval") in get_candle_intervals():
             limit = req.params.get("limit") if req.params.get("limit") else 200
             limit = min(200, int(limit))
 
-            result = []
-            if req.params.get("interval") == "1m":
-                result = MarketHistory_1m.query(
-                    self.session).filter(MarketHistory_1m.base == req.params.get("base"), MarketHistory_1m.quote == req.params.get("quote"), MarketHistory_1m.time <= req.params.get("time")).order_by(MarketHistory_1m.id.desc()).limit(limit).all()
-            elif req.params.get("interval") == "5m":
-                result = MarketHistory_5m.query(
-                    self.session).filter(MarketHistory_5m.base == req.params.get("base"), MarketHistory_5m.quote == req.params.get("quote"), MarketHistory_5m.time <= req.params.get("time")).order_by(MarketHistory_5m.id.desc()).limit(limit).all()
-            elif req.params.get("interval") == "1h":
-                result = MarketHistory_1h.query(
-                    self.session).filter(MarketHistory_1h.base == req.params.get("base"), MarketHistory_1h.quote == req.params.get("quote"), MarketHistory_1h.time <= req.params.get("time")).order_by(MarketHistory_1h.id.desc()).limit(limit).all()
-            elif req.params.get("interval") == "1d":
-                result = MarketHistory_1d.query(
-                    self.session).filter(MarketHistory_1d.base == req.params.get("base"), MarketHistory_1d.quote == req.params.get("quote"), MarketHistory_1d.time <= req.params.get("time")).order_by(MarketHistory_1d.id.desc()).limit(limit).all()
+            result = MarketCandle.query(self.session).filter(
+                MarketCandle.interval == req.params.get("interval"),
+                MarketCandle.base == req.params.get("base"),
+                MarketCandle.quote == req.params.get("quote"),
+                MarketCandle.time <= req.params.get("time")
+            ).order_by(MarketCandle.time.desc()).limit(limit).all()
+
             resp.media = self.seri(result)
         else:
             resp.status = falcon.HTTP_BAD_REQUEST
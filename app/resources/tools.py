@@ -156,10 +156,7 @@ class StorageValidatorResource(BaseResource):
 class ResetMarketResource(BaseResource):
     def on_post(self, req, resp):
         self.session.execute('''TRUNCATE TABLE data_block_total''')
-        self.session.execute('''TRUNCATE TABLE data_market_history_1m''')
-        self.session.execute('''TRUNCATE TABLE data_market_history_5m''')
-        self.session.execute('''TRUNCATE TABLE data_market_history_1h''')
-        self.session.execute('''TRUNCATE TABLE data_market_history_1d''')
+        self.session.execute('''TRUNCATE TABLE data_market_candle''')
 
         self.session.execute('''TRUNCATE TABLE data_session''')
         self.session.execute('''TRUNCATE TABLE data_session_total''')
@@ -55,6 +55,71 @@ DEBUG = bool(os.environ.get("DEBUG", False))
 BALANCE_FULL_SNAPSHOT_INTERVAL = 10000
 CELERY_RUNNING = True
 
+# Accumulation settings
+
+# Amount of blocks processed per accumulate task before the next task is scheduled
+ACCUMULATE_BLOCKS_PER_TASK = int(os.environ.get("ACCUMULATE_BLOCKS_PER_TASK", 10))
+# Amount of blocks committed in one transaction (1 commits every block)
+ACCUMULATE_COMMIT_BATCH_SIZE = int(os.environ.get("ACCUMULATE_COMMIT_BATCH_SIZE", 1))
+# Pipelined accumulation: amount of blocks retrieved ahead of the block being processed (0 disables prefetching)
+ACCUMULATE_PREFETCH_DEPTH = int(os.environ.get("ACCUMULATE_PREFETCH_DEPTH", 0))
+ACCUMULATE_PREFETCH_WORKERS = int(os.environ.get("ACCUMULATE_PREFETCH_WORKERS", 4))
+# Write events, extrinsics, logs and search index rows of a block with one multi-row INSERT per table
+ACCUMULATE_BULK_INSERT = int(os.environ.get("ACCUMULATE_BULK_INSERT", 1))
+
+# Maximum amount of calls in one JSON-RPC batch request
+RPC_BATCH_SIZE = int(os.environ.get("RPC_BATCH_SIZE", 100))
+# Amount of storage keys per paged key request or storage query
+RPC_STORAGE_PAGE_SIZE = int(os.environ.get("RPC_STORAGE_PAGE_SIZE", 1000))
+
+# Lookup runtime versions of finalized blocks in the runtime version index instead of requesting them per block
+ACCUMULATE_RUNTIME_INDEX = int(os.environ.get("ACCUMULATE_RUNTIME_INDEX", 1))
+# Minimum amount of seconds between reloads of the runtime version index from the database
+RUNTIME_INDEX_RELOAD_INTERVAL = int(os.environ.get("RUNTIME_INDEX_RELOAD_INTERVAL", 60))
+
+# Amount of blocks retrieved per query by the integrity check
+INTEGRITY_CHUNK_SIZE = int(os.environ.get("INTEGRITY_CHUNK_SIZE", 1000))
+# Verify hash of every checked block with the node (in batched requests)
+INTEGRITY_VERIFY_HASHES = int(os.environ.get("INTEGRITY_VERIFY_HASHES", 1))
+# Maximum amount of chunks checked per integrity check run
+INTEGRITY_MAX_CHUNKS = int(os.environ.get("INTEGRITY_MAX_CHUNKS", 10))
+# Maximum amount of discontinuities reported in the integrity check error
+INTEGRITY_MAX_REPORTED = int(os.environ.get("INTEGRITY_MAX_REPORTED", 10))
+
+# Amount of blocks the sequencer retrieves and commits at once
+SEQUENCER_BATCH_SIZE = int(os.environ.get("SEQUENCER_BATCH_SIZE", 100))
+
+# Backfill of the chain below the initial head is partitioned in block number ranges of this size
+BACKFILL_RANGE_SIZE = int(os.environ.get("BACKFILL_RANGE_SIZE", 10000))
+# Maximum amount of ranges processed simultaneously (0 means no limit, all ranges are queued)
+BACKFILL_MAX_ACTIVE_RANGES = int(os.environ.get("BACKFILL_MAX_ACTIVE_RANGES", 0))
+# Seconds without progress after which a range is considered abandoned and dispatched again
+BACKFILL_RANGE_TIMEOUT = int(os.environ.get("BACKFILL_RANGE_TIMEOUT", 600))
+
+# Amount of blocks of which extrinsics and events are retrieved at once when rebuilding the search index
+SEARCH_INDEX_REBUILD_CHUNK_SIZE = int(os.environ.get("SEARCH_INDEX_REBUILD_CHUNK_SIZE", 1000))
+
+# Size of new block_id range partitions of the event, extrinsic and search index tables
+PARTITION_BLOCK_RANGE = int(os.environ.get("PARTITION_BLOCK_RANGE", 100000))
+
+# Record latency histograms of processor hooks, RPC calls and database flushes (exposed at /metrics)
+PROFILER_ENABLED = int(os.environ.get("PROFILER_ENABLED", 0))
+
+# Log blocks of which a phase executes more SQL statements, or the same statement more often, than the thresholds
+SQL_MONITOR_ENABLED = int(os.environ.get("SQL_MONITOR_ENABLED", 0))
+SQL_MONITOR_MAX_STATEMENTS = int(os.environ.get("SQL_MONITOR_MAX_STATEMENTS", 500))
+SQL_MONITOR_MAX_REPEATS = int(os.environ.get("SQL_MONITOR_MAX_REPEATS", 20))
+
+# Store account ids and block hashes of high-volume tables as BINARY(32) instead of hex strings; has to match the
+# schema, see migration 8b2e5d9f4c16
+BINARY_ID_COLUMNS = int(os.environ.get("BINARY_ID_COLUMNS", 0))
+
+# Store nominator exposures of a session as a list in SessionValidator.exposures instead of SessionNominator rows
+SESSION_COMPACT_EXPOSURES = int(os.environ.get("SESSION_COMPACT_EXPOSURES", 0))
+
+# Comma separated candle intervals of market history, as amount and unit (m, h, d or w)
+MARKET_CANDLE_INTERVALS = os.environ.get("MARKET_CANDLE_INTERVALS", "1m,5m,15m,1h,4h,1d,1w").split(",")
+
 
 # Version compatibility switches
 
@@ -19,10 +19,12 @@
 #  tasks.py
 
 import os
+import datetime
 from time import sleep
 
 import celery
 from celery.result import AsyncResult
+from celery.utils import uuid
 
 from app import settings
 from scalecodec.base import ScaleDecoder, ScaleBytes
@@ -33,9 +35,16 @@ from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.sql import func
 
 from app.models.data import Extrinsic, Block, BlockTotal, Account, AccountInfoSnapshot, SearchIndex
-from app.models.harvester import Status
+from app.models.harvester import Status, BackfillRange, HarvestedBlockRange
 from app.processors.converters import PolkascanHarvesterService, HarvesterCouldNotAddBlock, BlockAlreadyAdded, \
-    BlockIntegrityError
+    BlockIntegrityError, BlockCommitBatch
+from app.processors.market import CandleEngine
+from app.processors.prefetch import BlockPrefetcher
+from app.processors.runtime_index import RuntimeVersionIndex
+from app.utils.bulk_load import BulkLoadMode
+from app.utils.partitions import BlockRangePartitions, PARTITIONED_TABLES
+from app.utils.profiler import Profiler
+from app.utils.substrate import HarvesterSubstrateInterface
 from scalecodec.exceptions import RemainingScaleBytesNotEmptyException
 from substrateinterface import SubstrateInterface, xxh128
 
@@ -72,6 +81,14 @@ class BaseTask(celery.Task):
         return super().__call__(*args, **kwargs)
 
     def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        if settings.PROFILER_ENABLED and hasattr(self, 'engine'):
+            # Separate transaction, the task session could contain uncommitted changes
+            try:
+                with self.engine.begin() as connection:
+                    Profiler().flush(connection)
+            except SQLAlchemyError as e:
+                print('Profiler: could not store metrics ({})'.format(e))
+
         if hasattr(self, 'session'):
             self.session.remove()
         if hasattr(self, 'engine'):
@@ -85,38 +102,36 @@ def accumulate_block_recursive(self, block_hash, end_block_hash=None):
         self.session, type_registry=TYPE_REGISTRY)
     harvester.metadata_store = self.metadata_store
 
-    # If metadata store isn't initialized yet, perform some tests
-    if not harvester.metadata_store:
-        print('Init: create entrypoints')
-        # Check if blocks exists
-        max_block_id = self.session.query(func.max(Block.id)).one()[0]
-
-        if not max_block_id:
-            # Speed up accumulating by creating several entry points
-            substrate = SubstrateInterface(SUBSTRATE_RPC_URL)
-            block_nr = substrate.get_block_number(block_hash)
-            if block_nr > 100:
-                for entry_point in range(0, block_nr, block_nr // 4)[1:-1]:
-                    entry_point_hash = substrate.get_block_hash(entry_point)
-                    accumulate_block_recursive.delay(entry_point_hash)
-
     block = None
     max_sequenced_block_id = False
 
     add_count = 0
 
+    prefetcher = None
+    prefetched_blocks = None
+
+    if settings.ACCUMULATE_PREFETCH_DEPTH > 0 and BlockPrefetcher.is_supported():
+        prefetcher = BlockPrefetcher()
+        prefetched_blocks = prefetcher.ancestors(
+            block_hash, end_block_hash, count=settings.ACCUMULATE_BLOCKS_PER_TASK
+        )
+
+    batch = BlockCommitBatch(harvester)
+
     try:
 
-        for nr in range(0, 10):
+        for nr in range(0, settings.ACCUMULATE_BLOCKS_PER_TASK):
             if not block or block.id > 0:
+                prefetched_block = next(prefetched_blocks) if prefetched_blocks else None
+
                 # Process block
-                block = harvester.add_block(block_hash)
+                block = batch.add_block(block_hash, prefetched_block=prefetched_block)
 
                 print('+ Added {} '.format(block_hash))
 
                 add_count += 1
 
-                self.session.commit()
+                batch.checkpoint()
 
                 # Break loop if targeted end block hash is reached
                 if block_hash == end_block_hash or block.id == 0:
@@ -125,6 +140,8 @@ def accumulate_block_recursive(self, block_hash, end_block_hash=None):
                 # Continue with parent block hash
                 block_hash = block.parent_hash
 
+        batch.commit()
+
         # Update persistent metadata store in Celery task
         self.metadata_store = harvester.metadata_store
 
@@ -132,27 +149,280 @@ def accumulate_block_recursive(self, block_hash, end_block_hash=None):
             accumulate_block_recursive.delay(block.parent_hash, end_block_hash)
 
     except BlockAlreadyAdded as e:
+        batch.commit()
         print('. Skipped {} '.format(block_hash))
     except IntegrityError as e:
+        # Retry the batch without the duplicate block
+        batch.rollback(block_hash)
+        batch.commit()
         print('. Skipped duplicate {} '.format(block_hash))
     except Exception as exc:
+        self.session.rollback()
         print('! ERROR adding {}'.format(block_hash))
         raise HarvesterCouldNotAddBlock(block_hash) from exc
+    finally:
+        if prefetcher:
+            prefetcher.close()
 
     return {
         'result': '{} blocks added'.format(add_count),
         'lastAddedBlockHash': block_hash,
-        'sequencerStartedFrom': max_sequenced_block_id
+        'sequencerStartedFrom': max_sequenced_block_id,
+        'commitLatency': batch.commit_latency()
+    }
+
+
+def add_block_range(task, harvester, block_start, block_end, backfill_range=None):
+    """
+    Adds blocks `block_start` up to and including `block_end` in ascending order, blocks already present are skipped.
+    When a backfill range is provided its cursor is advanced in the same transaction as each block.
+    :param task: BaseTask providing the session and metadata store
+    :param harvester:
+    :param block_start:
+    :param block_end:
+    :param backfill_range: optional BackfillRange
+    :return: tuple of added and skipped block count
+    """
+    add_count = 0
+    skip_count = 0
+
+    prefetcher = None
+
+    if settings.ACCUMULATE_PREFETCH_DEPTH > 0 and BlockPrefetcher.is_supported():
+        prefetcher = BlockPrefetcher()
+        prefetched_blocks = prefetcher.block_range(block_start, block_end)
+    else:
+        prefetched_blocks = (None for block_id in range(block_start, block_end + 1))
+
+    block_id = block_start
+    block_hash = None
+
+    batch = BlockCommitBatch(harvester)
+
+    try:
+        for block_id, prefetched_block in enumerate(prefetched_blocks, start=block_start):
+
+            if prefetched_block:
+                block_hash = prefetched_block.block_hash
+            else:
+                block_hash = harvester.substrate.get_block_hash(block_id)
+
+            try:
+                batch.add_block(block_hash, prefetched_block=prefetched_block)
+                add_count += 1
+            except BlockAlreadyAdded:
+                skip_count += 1
+            except IntegrityError:
+                # Retry the batch without the duplicate block
+                add_count -= len(batch.rollback(block_hash)) - 1
+                skip_count += 1
+
+            if backfill_range:
+                backfill_range.block_cursor = block_id + 1
+                backfill_range.last_modified = datetime.datetime.utcnow()
+                backfill_range.save(task.session)
+
+            batch.checkpoint()
+
+        batch.commit()
+
+        task.metadata_store = harvester.metadata_store
+
+    except Exception as exc:
+        task.session.rollback()
+        print('! ERROR adding #{} {}'.format(block_id, block_hash))
+        raise HarvesterCouldNotAddBlock(block_hash) from exc
+    finally:
+        if prefetcher:
+            prefetcher.close()
+
+    print('Commit latency: {}'.format(batch.commit_latency()))
+
+    return add_count, skip_count
+
+
+@app.task(base=BaseTask, bind=True)
+def accumulate_block_range(self, block_start, block_end):
+
+    harvester = PolkascanHarvesterService(self.session, type_registry=TYPE_REGISTRY)
+    harvester.metadata_store = self.metadata_store
+
+    add_count, skip_count = add_block_range(self, harvester, block_start, block_end)
+
+    return {
+        'result': '{} blocks added, {} skipped'.format(add_count, skip_count),
+        'blockStart': block_start,
+        'blockEnd': block_end
     }
 
 
 @app.task(base=BaseTask, bind=True)
-def calculate_market_history(self):
-    pass
+def accumulate_backfill_range(self, backfill_range_id):
+
+    backfill_range = BackfillRange.query(self.session).get(backfill_range_id)
+
+    if not backfill_range or backfill_range.complete:
+        return {'result': 'Backfill range already completed'}
+
+    # Range was dispatched again while this task was waiting in the queue
+    if backfill_range.task_id and self.request.id and backfill_range.task_id != self.request.id:
+        return {'result': 'Backfill range dispatched to another task'}
+
+    backfill_range.last_modified = datetime.datetime.utcnow()
+    backfill_range.save(self.session)
+    self.session.commit()
+
+    harvester = PolkascanHarvesterService(self.session, type_registry=TYPE_REGISTRY)
+    harvester.metadata_store = self.metadata_store
+
+    block_start = backfill_range.block_cursor
+    block_end = min(block_start + settings.ACCUMULATE_BLOCKS_PER_TASK - 1, backfill_range.block_end)
+
+    add_count, skip_count = add_block_range(self, harvester, block_start, block_end, backfill_range=backfill_range)
+
+    if backfill_range.block_cursor > backfill_range.block_end:
+        backfill_range.complete = True
+        backfill_range.task_id = None
+        backfill_range.last_modified = datetime.datetime.utcnow()
+        backfill_range.save(self.session)
+        self.session.commit()
+    else:
+        # Continue with next part of the range
+        dispatch_backfill_ranges(self.session, [backfill_range])
+
+    return {
+        'result': '{} blocks added, {} skipped'.format(add_count, skip_count),
+        'backfillRangeId': backfill_range.id,
+        'blockStart': block_start,
+        'blockEnd': block_end,
+        'complete': backfill_range.complete
+    }
+
+
+def dispatch_backfill_ranges(session, backfill_ranges):
+    """
+    Dispatches a task per backfill range. Task ids are stored before the tasks are sent, so a started task can always
+    determine whether it is the current task of its range
+    """
+    task_ids = []
+
+    for backfill_range in backfill_ranges:
+        backfill_range.task_id = uuid()
+        backfill_range.last_modified = datetime.datetime.utcnow()
+        backfill_range.save(session)
+        task_ids.append(backfill_range.task_id)
+
+    session.commit()
+
+    for backfill_range, task_id in zip(backfill_ranges, task_ids):
+        accumulate_backfill_range.apply_async(args=[backfill_range.id], task_id=task_id)
+
+
+@app.task(base=BaseTask, bind=True)
+def start_backfill(self, block_end=None):
+    """
+    Partitions blocks 0 to `block_end` in ranges of BACKFILL_RANGE_SIZE (only once, when no ranges exist yet) and
+    dispatches every incomplete range that is not actively processed; ranges interrupted by a crashed worker are
+    resumed from their cursor.
+    :param block_end: last block number of the backfill, defaults to the block before the lowest harvested block
+    :return:
+    """
+    if BackfillRange.query(self.session).count() == 0:
+
+        if block_end is None:
+            min_block_id = self.session.query(func.min(Block.id)).one()[0]
+            block_end = (min_block_id or 0) - 1
+
+        if block_end >= 0:
+            BackfillRange.create_ranges(self.session, 0, block_end, settings.BACKFILL_RANGE_SIZE)
+            self.session.commit()
+
+    # Lost tasks remain pending, so without progress for a while a range is dispatched again. A task of the range
+    # that was still queued skips the range when it starts, as it is no longer the dispatched task
+    timeout = datetime.datetime.utcnow() - datetime.timedelta(seconds=settings.BACKFILL_RANGE_TIMEOUT)
+
+    active_count = 0
+    idle_ranges = []
+
+    for backfill_range in BackfillRange.query(self.session).filter_by(complete=False).order_by('block_start'):
+
+        if backfill_range.task_id and not AsyncResult(backfill_range.task_id).ready() and \
+                backfill_range.last_modified and backfill_range.last_modified.replace(tzinfo=None) > timeout:
+            active_count += 1
+        else:
+            idle_ranges.append(backfill_range)
+
+    if settings.BACKFILL_MAX_ACTIVE_RANGES > 0:
+        idle_ranges = idle_ranges[:max(settings.BACKFILL_MAX_ACTIVE_RANGES - active_count, 0)]
+
+    dispatch_backfill_ranges(self.session, idle_ranges)
+
+    # Rebuild deferred indexes once the whole backfill is completed
+    if not active_count and not idle_ranges and BulkLoadMode.get_state(self.session) == BulkLoadMode.STATE_ENABLED \
+            and BackfillRange.query(self.session).count() > 0:
+        # Mark as rebuilding right away so following runs don't dispatch the rebuild again
+        BulkLoadMode(self.session).set_state(BulkLoadMode.STATE_REBUILDING)
+        stop_bulk_load_mode.delay()
+
+    return {
+        'result': 'Backfill ranges dispatched',
+        'activeRanges': active_count,
+        'dispatchedRanges': [backfill_range.id for backfill_range in idle_ranges]
+    }
+
+
+@app.task(base=BaseTask, bind=True)
+def start_bulk_load_mode(self):
+    dropped_indexes = BulkLoadMode(self.session).enable()
+
+    return {
+        'result': 'Bulk load mode enabled',
+        'droppedIndexes': dropped_indexes
+    }
+
+
+@app.task(base=BaseTask, bind=True)
+def stop_bulk_load_mode(self):
+    created_indexes = BulkLoadMode(self.session).disable()
+
+    return {
+        'result': 'Bulk load mode disabled',
+        'createdIndexes': created_indexes
+    }
+
+
+@app.task(base=BaseTask, bind=True)
+def calculate_market_history(self, intervals=None, time_from=None):
+    """
+    Rolls up candles of given intervals (defaults to all intervals that can be derived from a lower interval) from
+    lower intervals, shortest first so derived intervals can be sources themselves
+    """
+    candle_engine = CandleEngine()
+
+    if time_from:
+        time_from = datetime.datetime.strptime(time_from, '%Y-%m-%d %H:%M:%S')
+
+    if intervals is None:
+        intervals = [interval for interval in candle_engine.intervals if candle_engine.get_rollup_source(interval)]
+
+    stored_candles = {}
+
+    for interval in candle_engine.intervals:
+        if interval in intervals:
+            stored_candles[interval] = candle_engine.rollup(self.session, interval, time_from=time_from)
+            self.session.commit()
+
+    return {
+        'result': 'Market history rolled up',
+        'storedCandles': stored_candles
+    }
 
 
 @app.task(base=BaseTask, bind=True)
 def start_sequencer(self):
+    if BulkLoadMode.is_enabled(self.session):
+        return {'result': 'Sequencer paused during bulk load mode'}
+
     sequencer_task = Status.get_status(self.session, 'SEQUENCER_TASK_ID')
     if sequencer_task.value:
         task_result = AsyncResult(sequencer_task.value)
@@ -187,15 +457,49 @@ def start_sequencer(self):
 
 @app.task(base=BaseTask, bind=True)
 def rebuilding_search_index(self, search_index_id, truncate=False):
-    if truncate:
-        # Clear search index table
-        self.session.execute('delete from analytics_search_index where index_type_id={}'.format(search_index_id))
+    # Rows of the index type are always replaced per block range, `truncate` is kept for compatibility
+    return dispatch_search_index_rebuild(self.session, index_type_id=search_index_id)
+
+
+@app.task(base=BaseTask, bind=True)
+def update_runtime_version_index(self):
+
+    substrate = HarvesterSubstrateInterface(SUBSTRATE_RPC_URL)
+
+    block_end = substrate.get_block_number(substrate.get_chain_finalised_head())
+
+    runtime_index = RuntimeVersionIndex()
+
+    try:
+        new_ranges = runtime_index.update(self.session, substrate, block_end)
         self.session.commit()
+    except IntegrityError:
+        # Index is already updated by another task
+        self.session.rollback()
+        new_ranges = []
 
-    harvester = PolkascanHarvesterService(self.session, type_registry=TYPE_REGISTRY)
-    harvester.rebuild_search_index(search_index_id)
+    runtime_index.load(self.session)
+
+    return {
+        'result': 'Runtime version index updated',
+        'blockEnd': block_end,
+        'newSpecVersions': [runtime_range.spec_version for runtime_range in new_ranges]
+    }
 
-    return {'result': 'index rebuilt'}
+
+def ensure_block_partitions(session, block_id):
+    # Partitions are checked once per partition range instead of every run
+    partitions_status = Status.get_status(session, 'PARTITIONS_BLOCK_END')
+
+    if partitions_status.value and int(partitions_status.value) > block_id + settings.PARTITION_BLOCK_RANGE:
+        return
+
+    for table_name in PARTITIONED_TABLES:
+        BlockRangePartitions(session, table_name).ensure_partitions(block_id)
+
+    partitions_status.value = (block_id // settings.PARTITION_BLOCK_RANGE + 2) * settings.PARTITION_BLOCK_RANGE
+    partitions_status.save(session)
+    session.commit()
 
 
 @app.task(base=BaseTask, bind=True)
@@ -207,6 +511,9 @@ def start_harvester(self, check_gaps=False):
 
     if check_gaps:
         # Check for gaps between already harvested blocks and try to fill them first
+        HarvestedBlockRange.compact(self.session)
+        self.session.commit()
+
         remaining_sets_result = Block.get_missing_block_ids(self.session)
 
         for block_set in remaining_sets_result:
@@ -228,6 +535,9 @@ def start_harvester(self, check_gaps=False):
     # Start sequencer
     sequencer_task = start_sequencer.delay()
 
+    if settings.ACCUMULATE_RUNTIME_INDEX:
+        update_runtime_version_index.delay()
+
     # Continue from current (finalised) head
     if FINALIZATION_ONLY == 1:
         start_block_hash = substrate.get_chain_finalised_head()
@@ -236,6 +546,18 @@ def start_harvester(self, check_gaps=False):
 
     end_block_hash = None
 
+    block_id_max = self.session.query(func.max(Block.id)).one()[0]
+
+    if block_id_max:
+        ensure_block_partitions(self.session, block_id_max)
+
+    if not block_id_max and BackfillRange.query(self.session).count() == 0:
+        # Empty database: only add head block here, all blocks below are backfilled in ranges by multiple workers
+        end_block_hash = start_block_hash
+        backfill_task = start_backfill.delay(substrate.get_block_number(start_block_hash) - 1)
+    else:
+        backfill_task = start_backfill.delay()
+
     accumulate_block_recursive.delay(start_block_hash, end_block_hash)
 
     block_sets.append({
@@ -246,7 +568,8 @@ def start_harvester(self, check_gaps=False):
     return {
         'result': 'Harvester job started',
         'block_sets': block_sets,
-        'sequencer_task_id': sequencer_task.task_id
+        'sequencer_task_id': sequencer_task.task_id,
+        'backfill_task_id': backfill_task.task_id
     }
 
 
@@ -257,12 +580,46 @@ def start_generate_analytics(self):
     return {'status': 'OK'}
 
 
+def dispatch_search_index_rebuild(session, index_type_id=None):
+    """
+    Rebuilds the search index in block ranges, which are dispatched as separate tasks when Celery is running so
+    ranges are rebuilt in parallel by all workers
+    """
+    harvester = PolkascanHarvesterService(session, type_registry=TYPE_REGISTRY)
+
+    block_ranges = harvester.get_search_index_ranges()
+
+    if settings.CELERY_RUNNING:
+        task_ids = [
+            rebuild_search_index_range.delay(block_start, block_end, index_type_id).id
+            for block_start, block_end in block_ranges
+        ]
+
+        return {'result': 'Search index rebuild tasks created', 'taskIds': task_ids}
+
+    for block_start, block_end in block_ranges:
+        harvester.rebuild_search_index_range(block_start, block_end, index_type_id)
+
+    return {'result': 'search index rebuilt'}
+
+
+@app.task(base=BaseTask, bind=True)
+def rebuild_search_index(self, index_type_id=None):
+    return dispatch_search_index_rebuild(self.session, index_type_id=index_type_id)
+
+
 @app.task(base=BaseTask, bind=True)
-def rebuild_search_index(self):
+def rebuild_search_index_range(self, block_start, block_end, index_type_id=None):
     harvester = PolkascanHarvesterService(self.session, type_registry=TYPE_REGISTRY)
-    harvester.rebuild_search_index()
+    harvester.metadata_store = self.metadata_store
+    harvester.rebuild_search_index_range(block_start, block_end, index_type_id)
 
-    return {'result': 'search index rebuilt'}
+    return {
+        'result': 'Search index of block range rebuilt',
+        'blockStart': block_start,
+        'blockEnd': block_end,
+        'indexTypeId': index_type_id
+    }
 
 
 @app.task(base=BaseTask, bind=True)
@@ -288,7 +645,7 @@ def rebuild_account_info_snapshot(self):
             self.session.commit()
 
     # set balances according to most recent snapshot
-    account_info = self.session.execute("""
+    account_info = self.session.execute(text("""
             select
                a.account_id, 
                a.balance_total,
@@ -304,7 +661,7 @@ def rebuild_account_info_snapshot(self):
             group by account_id
         ) as b
         on a.account_id = b.account_id and a.block_id = b.max_block_id
-        """)
+        """).columns(account_id=AccountInfoSnapshot.account_id.type))
 
     for account_id, balance_total, balance_free, balance_reserved, nonce in account_info:
         Account.query(self.session).filter_by(id=account_id).update(
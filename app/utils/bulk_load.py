@@ -0,0 +1,150 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  bulk_load.py
+
+""" Bulk-load mode for the initial sync: secondary indexes that are not used by accumulation queries are dropped
+    and rebuilt afterwards with one ALTER TABLE per table. While enabled the sequencer is paused, as its queries and
+    those of the API rely on the dropped indexes.
+
+    Note that MySQL implicitly commits the current transaction on each ALTER TABLE statement.
+
+"""
+import datetime
+
+from sqlalchemy import text
+
+from app.models.data import Event, Extrinsic, Log, Account, AccountInfoSnapshot, SearchIndex
+from app.models.harvester import Status
+
+# Indexed columns per model that are not needed while accumulating blocks; indexes used by accumulation (for example
+# Account.is_validator, Account.parent_identity and SearchIndex.block_id) are kept. Composite indexes are deferred when
+# their leading column is listed
+DEFERRED_INDEX_COLUMNS = {
+    Event: ['block_id', 'event_idx', 'extrinsic_idx', 'type', 'module_id', 'event_id', 'system', 'module'],
+    Extrinsic: [
+        'block_id', 'extrinsic_idx', 'extrinsic_hash', 'signed', 'unsigned', 'address', 'account_index',
+        'account_idx', 'module_id', 'call_id'
+    ],
+    Log: ['type_id'],
+    Account: [
+        'index_address', 'was_validator', 'was_nominator', 'is_council_member', 'was_council_member',
+        'is_tech_comm_member', 'was_tech_comm_member', 'is_registrar', 'was_registrar', 'is_sudo', 'was_sudo',
+        'is_treasury', 'is_contract', 'hash_blake2b', 'balance_total', 'balance_free', 'balance_reserved',
+        'has_identity', 'has_subidentity', 'identity_display'
+    ],
+    AccountInfoSnapshot: ['balance_total', 'balance_free', 'balance_reserved'],
+    SearchIndex: ['extrinsic_idx', 'event_idx', 'account_id', 'index_type_id', 'sorting_value'],
+}
+
+
+class BulkLoadMode(object):
+
+    STATUS_KEY = 'BULK_LOAD_MODE'
+
+    STATE_ENABLED = 'enabled'
+    STATE_REBUILDING = 'rebuilding'
+
+    def __init__(self, session):
+        self.session = session
+
+    @classmethod
+    def get_state(cls, session):
+        return Status.get_status(session, cls.STATUS_KEY).value
+
+    @classmethod
+    def is_enabled(cls, session):
+        # Also during rebuild of the indexes, until all are available again
+        return cls.get_state(session) in (cls.STATE_ENABLED, cls.STATE_REBUILDING)
+
+    @staticmethod
+    def get_deferred_indexes():
+        """
+        :return: dict of table name and list of deferred sa.Index objects, as defined in the models
+        """
+        deferred_indexes = {}
+
+        for model, columns in DEFERRED_INDEX_COLUMNS.items():
+            deferred_indexes[model.__tablename__] = [
+                index for index in model.__table__.indexes
+                if not index.unique and list(index.columns)[0].name in columns
+            ]
+
+        return deferred_indexes
+
+    def get_existing_index_names(self, table_name):
+        return {row[0] for row in self.session.execute(text("""
+            SELECT DISTINCT INDEX_NAME
+            FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name
+        """), {'table_name': table_name})}
+
+    def set_state(self, state):
+        status = Status.get_status(self.session, self.STATUS_KEY)
+        status.value = state
+        status.last_modified = datetime.datetime.utcnow()
+        status.save(self.session)
+        self.session.commit()
+
+    def enable(self):
+        """
+        Drops deferred indexes that exist, per table in one statement
+        :return: dict of table name and list of dropped index names
+        """
+        # Set status first, so the sequencer is paused before indexes are missing
+        self.set_state(self.STATE_ENABLED)
+
+        dropped_indexes = {}
+
+        for table_name, indexes in self.get_deferred_indexes().items():
+            existing_index_names = self.get_existing_index_names(table_name)
+            index_names = [index.name for index in indexes if index.name in existing_index_names]
+
+            if index_names:
+                self.session.execute('ALTER TABLE {} {}'.format(
+                    table_name, ', '.join(['DROP INDEX {}'.format(index_name) for index_name in index_names])
+                ))
+                dropped_indexes[table_name] = index_names
+
+        return dropped_indexes
+
+    def disable(self):
+        """
+        Rebuilds missing deferred indexes, per table in one statement so the table is scanned only once
+        :return: dict of table name and list of created index names
+        """
+        self.set_state(self.STATE_REBUILDING)
+
+        created_indexes = {}
+
+        for table_name, indexes in self.get_deferred_indexes().items():
+            existing_index_names = self.get_existing_index_names(table_name)
+            missing_indexes = [index for index in indexes if index.name not in existing_index_names]
+
+            if missing_indexes:
+                self.session.execute('ALTER TABLE {} {}'.format(
+                    table_name, ', '.join([
+                        'ADD INDEX {} ({})'.format(index.name, ', '.join([column.name for column in index.columns]))
+                        for index in missing_indexes
+                    ])
+                ))
+                created_indexes[table_name] = [index.name for index in missing_indexes]
+
+        self.set_state(None)
+
+        return created_indexes
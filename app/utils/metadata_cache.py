@@ -0,0 +1,54 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  metadata_cache.py
+
+""" Cache of decoded runtime metadata (MetadataDecoder) keyed by spec version, shared by all harvesters in a process.
+
+"""
+from app import settings
+
+
+class MetadataCache(object):
+
+    # Shared by all instances within a process
+    memory_store = {}
+
+    def __init__(self, namespace=None):
+        self.namespace = namespace or settings.TYPE_REGISTRY
+
+    def get(self, spec_version):
+        """
+        Retrieves decoded metadata of given spec version decoded earlier in this process
+        :param spec_version:
+        :return: MetadataDecoder or None
+        """
+        return self.memory_store.get((self.namespace, spec_version))
+
+    def put(self, spec_version, metadata_decoder):
+        """
+        Stores decoded metadata of given spec version for all harvesters in this process
+        :param spec_version:
+        :param metadata_decoder:
+        :return:
+        """
+        self.memory_store[(self.namespace, spec_version)] = metadata_decoder
+
+    def clear(self):
+        for key in [key for key in self.memory_store if key[0] == self.namespace]:
+            del self.memory_store[key]
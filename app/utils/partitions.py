@@ -0,0 +1,138 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  partitions.py
+
+""" Management of RANGE partitions on `block_id` of the large per-block tables (see migration 9e4b7d2a6c31). Tables
+    that are not partitioned are handled with regular DELETE statements, so these helpers are safe to use on
+    databases that are not migrated (yet).
+
+    Note that MySQL implicitly commits the current transaction on each partition DDL statement.
+
+"""
+from sqlalchemy import text
+
+from app import settings
+
+PARTITIONED_TABLES = ('data_event', 'data_extrinsic', 'data_account_search_index')
+
+MAXVALUE_PARTITION = 'pmax'
+
+
+class BlockRangePartitions(object):
+
+    def __init__(self, session, table_name, partition_size=None):
+        self.session = session
+        self.table_name = table_name
+        self.partition_size = partition_size or settings.PARTITION_BLOCK_RANGE
+
+    @staticmethod
+    def get_partition_name(block_start, partition_size):
+        # Same bucketing as the range columns of Block, e.g. p12 holds blocks 1200000 - 1299999 for size 100000
+        return 'p{}'.format(block_start // partition_size)
+
+    def get_partitions(self):
+        """
+        :return: list of tuples (partition name, first block number, last block number or None for MAXVALUE)
+        """
+        rows = self.session.execute(text("""
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+            FROM INFORMATION_SCHEMA.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """), {'table_name': self.table_name})
+
+        partitions = []
+        block_start = 0
+
+        for partition_name, less_than in rows:
+            if less_than == 'MAXVALUE':
+                partitions.append((partition_name, block_start, None))
+            else:
+                partitions.append((partition_name, block_start, int(less_than) - 1))
+                block_start = int(less_than)
+
+        return partitions
+
+    def get_partition(self, block_id):
+        for partition in self.get_partitions():
+            if partition[1] <= block_id and (partition[2] is None or block_id <= partition[2]):
+                return partition
+
+    def ensure_partitions(self, block_id):
+        """
+        Splits new partitions off the MAXVALUE partition until there is a dedicated partition for the range after
+        the one of `block_id`, so the MAXVALUE partition stays empty and splitting it doesn't copy any rows
+        :param block_id: current head
+        :return: list of names of created partitions
+        """
+        partitions = self.get_partitions()
+
+        if not partitions or partitions[-1][2] is not None:
+            # Not partitioned or no MAXVALUE partition to split
+            return []
+
+        block_start = partitions[-1][1]
+        block_end = (block_id // self.partition_size + 2) * self.partition_size
+
+        partition_definitions = []
+
+        while block_start < block_end:
+            partition_definitions.append('PARTITION {} VALUES LESS THAN ({})'.format(
+                self.get_partition_name(block_start, self.partition_size), block_start + self.partition_size
+            ))
+            block_start += self.partition_size
+
+        if not partition_definitions:
+            return []
+
+        self.session.execute('ALTER TABLE {} REORGANIZE PARTITION {} INTO ({}, PARTITION {} VALUES LESS THAN MAXVALUE)'.format(
+            self.table_name,
+            partitions[-1][0],
+            ', '.join(partition_definitions),
+            MAXVALUE_PARTITION
+        ))
+
+        return [definition.split(' ')[1] for definition in partition_definitions]
+
+    def truncate(self, block_start, block_end):
+        """
+        Removes all rows of given block range, partitions that are fully covered are truncated, remaining rows
+        are deleted
+        :param block_start:
+        :param block_end:
+        :return:
+        """
+        delete_ranges = [(block_start, block_end)]
+
+        for partition_name, partition_start, partition_end in self.get_partitions():
+            if partition_end is not None and block_start <= partition_start and partition_end <= block_end:
+                self.session.execute('ALTER TABLE {} TRUNCATE PARTITION {}'.format(self.table_name, partition_name))
+
+                # Fully covered partitions are consecutive, only rows before and after them need to be deleted
+                delete_ranges = [
+                    (delete_ranges[0][0], min(delete_ranges[0][1], partition_start - 1)),
+                    (partition_end + 1, block_end)
+                ]
+
+        for delete_start, delete_end in delete_ranges:
+            if delete_start <= delete_end:
+                self.session.execute(
+                    text('DELETE FROM {} WHERE block_id BETWEEN :block_start AND :block_end'.format(self.table_name)),
+                    {'block_start': delete_start, 'block_end': delete_end}
+                )
@@ -0,0 +1,177 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  profiler.py
+
+""" Latency histograms of processor hooks, RPC calls and database flushes. Observations are aggregated in memory per
+    process and added to the `harvester_metric` table at the end of every task, so histograms of all workers are
+    combined.
+
+"""
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from app import settings
+from app.models.harvester import Metric
+
+# Upper bounds in seconds
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_bound(bound):
+    return '{:g}'.format(bound)
+
+
+class Profiler(object):
+
+    # Shared by all instances within a process
+    histograms = {}
+
+    def __init__(self):
+        self.enabled = bool(settings.PROFILER_ENABLED)
+
+    def observe(self, name, labels, duration):
+        """
+        :param name: metric name, e.g. harvester_rpc_seconds
+        :param labels: label string in Prometheus format, e.g. method="chain_getBlock"
+        :param duration: seconds
+        :return:
+        """
+        histogram = self.histograms.get((name, labels))
+
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = {'buckets': [0] * (len(HISTOGRAM_BUCKETS) + 1), 'sum': 0}
+
+        for idx, bound in enumerate(HISTOGRAM_BUCKETS):
+            if duration <= bound:
+                break
+        else:
+            idx = len(HISTOGRAM_BUCKETS)
+
+        histogram['buckets'][idx] += 1
+        histogram['sum'] += duration
+
+    @contextmanager
+    def timer(self, name, labels=''):
+        if not self.enabled:
+            yield
+            return
+
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, labels, time.perf_counter() - start_time)
+
+    def flush(self, connection):
+        """
+        Adds the observations since the last flush to the stored histograms
+        :param connection: connection or session
+        :return:
+        """
+        histograms = dict(self.histograms)
+        self.histograms.clear()
+
+        rows = []
+
+        for (name, labels), histogram in histograms.items():
+            for idx, count in enumerate(histogram['buckets']):
+                if count:
+                    le = format_bound(HISTOGRAM_BUCKETS[idx]) if idx < len(HISTOGRAM_BUCKETS) else '+Inf'
+                    rows.append({'name': name, 'labels': labels, 'le': le, 'value': count})
+
+            rows.append({'name': name, 'labels': labels, 'le': 'sum', 'value': histogram['sum']})
+
+        if rows:
+            insert_stmt = mysql_insert(Metric.__table__).values(rows)
+            connection.execute(insert_stmt.on_duplicate_key_update(
+                value=Metric.__table__.c.value + insert_stmt.inserted.value
+            ))
+
+    @staticmethod
+    def get_histograms(session):
+        """
+        :return: dict of (name, labels) and dict with cumulative `buckets` (list of tuples (le, count)), `count` and
+        `sum`
+        """
+        histograms = {}
+
+        for metric in Metric.query(session):
+            histogram = histograms.setdefault((metric.name, metric.labels), {'counts': {}, 'sum': 0})
+
+            if metric.le == 'sum':
+                histogram['sum'] = metric.value
+            else:
+                histogram['counts'][metric.le] = int(metric.value)
+
+        for histogram in histograms.values():
+            counts = histogram.pop('counts')
+            cumulative_count = 0
+            histogram['buckets'] = []
+
+            for le in [format_bound(bound) for bound in HISTOGRAM_BUCKETS] + ['+Inf']:
+                cumulative_count += counts.get(le, 0)
+                histogram['buckets'].append((le, cumulative_count))
+
+            histogram['count'] = cumulative_count
+
+        return histograms
+
+    @classmethod
+    def export_prometheus(cls, session):
+        lines = []
+        names = []
+
+        histograms = cls.get_histograms(session)
+
+        for name, labels in sorted(histograms.keys()):
+            histogram = histograms[(name, labels)]
+
+            if name not in names:
+                names.append(name)
+                lines.append('# TYPE {} histogram'.format(name))
+
+            separator = ',' if labels else ''
+
+            for le, count in histogram['buckets']:
+                lines.append('{}_bucket{{{}{}le="{}"}} {}'.format(name, labels, separator, le, count))
+
+            lines.append('{}_sum{} {}'.format(name, '{{{}}}'.format(labels) if labels else '', histogram['sum']))
+            lines.append('{}_count{} {}'.format(name, '{{{}}}'.format(labels) if labels else '', histogram['count']))
+
+        return '\n'.join(lines) + '\n'
+
+
+def before_flush(session, flush_context, instances):
+    session.info['profiler_flush_start'] = time.perf_counter()
+
+
+def after_flush_postexec(session, flush_context):
+    start_time = session.info.pop('profiler_flush_start', None)
+
+    if start_time is not None:
+        Profiler().observe('harvester_db_flush_seconds', '', time.perf_counter() - start_time)
+
+
+if settings.PROFILER_ENABLED:
+    event.listen(Session, 'before_flush', before_flush)
+    event.listen(Session, 'after_flush_postexec', after_flush_postexec)
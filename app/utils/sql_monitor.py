@@ -0,0 +1,135 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  sql_monitor.py
+
+""" Counts SQL statements, their total time and repeated statement shapes per block and harvester phase, and logs
+    blocks that exceed SQL_MONITOR_MAX_STATEMENTS or execute the same statement more than SQL_MONITOR_MAX_REPEATS
+    times (typically a query per row in a loop, N+1).
+
+"""
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import settings
+
+# Lists of parameters (IN clauses, multi-row inserts) of any length have the same shape
+PARAMETER_LIST_REGEX = re.compile(r'\((?:%s|\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:%s|\?|%\(\w+\)s|:\w+))*\)(?:\s*,\s*\(.*?\))*')
+
+
+class StatementStats(object):
+
+    def __init__(self, phase, label):
+        self.phase = phase
+        self.label = label
+        self.count = 0
+        self.duration = 0
+        self.shapes = Counter()
+
+    @staticmethod
+    def get_shape(statement):
+        return PARAMETER_LIST_REGEX.sub('(...)', ' '.join(statement.split()))
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[self.get_shape(statement)] += 1
+
+    def get_repeated_shapes(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+class StatementMonitor(object):
+
+    # Stack of active scopes per thread
+    local = threading.local()
+
+    def __init__(self):
+        self.enabled = bool(settings.SQL_MONITOR_ENABLED)
+
+    @classmethod
+    def get_stack(cls):
+        if not hasattr(cls.local, 'stack'):
+            cls.local.stack = []
+        return cls.local.stack
+
+    @classmethod
+    def get_current_stats(cls):
+        stack = cls.get_stack()
+        if stack:
+            return stack[-1]
+
+    @contextmanager
+    def scope(self, phase, label):
+        """
+        Statements executed in this thread within the scope are counted for given phase and label, nested scopes
+        count their own statements
+        :param phase: e.g. accumulation, sequencing, search_index
+        :param label: e.g. block number or hash
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        stats = StatementStats(phase, label)
+        stack = self.get_stack()
+        stack.append(stats)
+
+        try:
+            yield stats
+        finally:
+            stack.pop()
+            self.check_thresholds(stats)
+
+    @staticmethod
+    def check_thresholds(stats):
+        repeated_shapes = stats.get_repeated_shapes(settings.SQL_MONITOR_MAX_REPEATS)
+
+        if stats.count <= settings.SQL_MONITOR_MAX_STATEMENTS and not repeated_shapes:
+            return
+
+        print('SQL monitor: {} of {}: {} statements in {:.3f}s'.format(
+            stats.phase, stats.label, stats.count, stats.duration
+        ))
+
+        for shape, count in repeated_shapes[:5]:
+            print('SQL monitor:   {}x {}'.format(count, shape[:200]))
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.sql_monitor_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = StatementMonitor.get_current_stats()
+
+    if stats is not None:
+        start_time = getattr(context, 'sql_monitor_start', None)
+        stats.add(statement, time.perf_counter() - start_time if start_time is not None else 0)
+
+
+if settings.SQL_MONITOR_ENABLED:
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
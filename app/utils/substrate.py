@@ -0,0 +1,305 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  substrate.py
+
+""" SubstrateInterface extended with a pooled keep-alive HTTP connection and JSON-RPC 2.0 batch requests
+
+"""
+import json
+from hashlib import blake2b
+
+import requests
+import xxhash
+
+from app import settings
+from app.utils.profiler import Profiler
+from scalecodec.base import ScaleBytes, ScaleDecoder
+from substrateinterface import SubstrateInterface, SubstrateRequestException
+
+
+def xxh64_hash(data, seeds):
+    storage_key = bytes()
+
+    for seed in seeds:
+        storage_key += xxhash.xxh64(data, seed=seed).intdigest().to_bytes(8, 'little')
+
+    return storage_key
+
+
+STORAGE_HASHERS = {
+    'Blake2_128': lambda data: blake2b(data, digest_size=16).digest(),
+    'Blake2_256': lambda data: blake2b(data, digest_size=32).digest(),
+    'Blake2_128Concat': lambda data: blake2b(data, digest_size=16).digest() + data,
+    'Twox128': lambda data: xxh64_hash(data, range(0, 2)),
+    'Twox256': lambda data: xxh64_hash(data, range(0, 4)),
+    'Twox64Concat': lambda data: xxh64_hash(data, range(0, 1)) + data,
+    'Identity': lambda data: data
+}
+
+
+class HarvesterSubstrateInterface(SubstrateInterface):
+
+    def __init__(self, url, *args, **kwargs):
+        super().__init__(url, *args, **kwargs)
+        self.http_session = None
+        self.profiler = Profiler()
+
+        if self.url[0:7] == 'http://' or self.url[0:8] == 'https://':
+            self.http_session = requests.Session()
+            self.http_session.headers.update(self.default_headers)
+
+    def http_request(self, payload):
+        response = self.http_session.post(self.url, data=json.dumps(payload))
+
+        if response.status_code != 200:
+            raise SubstrateRequestException(
+                "RPC request failed with HTTP status code {}".format(response.status_code)
+            )
+
+        return response.json()
+
+    def rpc_request(self, method, params):
+        with self.profiler.timer('harvester_rpc_seconds', 'method="{}"'.format(method)):
+            return self.process_rpc_request(method, params)
+
+    def process_rpc_request(self, method, params):
+        if not self.http_session:
+            return super().rpc_request(method, params)
+
+        payload = {
+            "jsonrpc": "2.0",
+            "method": method,
+            "params": params,
+            "id": self.request_id
+        }
+
+        self.debug_message('RPC request "{}"'.format(method))
+
+        return self.http_request(payload)
+
+    def rpc_batch(self, calls, batch_size=None):
+        """
+        Performs JSON-RPC requests in batches of `batch_size` (defaults to RPC_BATCH_SIZE)
+        :param calls: list of tuples (method, params)
+        :return: list of responses in order of provided calls
+        """
+        if not self.http_session:
+            return [self.rpc_request(method, params) for method, params in calls]
+
+        batch_size = batch_size or settings.RPC_BATCH_SIZE
+        results = []
+
+        for offset in range(0, len(calls), batch_size):
+            payload = [
+                {"jsonrpc": "2.0", "method": method, "params": params, "id": idx}
+                for idx, (method, params) in enumerate(calls[offset:offset + batch_size])
+            ]
+
+            self.debug_message('RPC batch request of {} calls'.format(len(payload)))
+
+            with self.profiler.timer('harvester_rpc_seconds', 'method="batch"'):
+                json_body = self.http_request(payload)
+
+            if type(json_body) is not list:
+                # Batch rejected as a whole
+                raise SubstrateRequestException(json_body.get('error', 'RPC batch request failed'))
+
+            responses = {response.get('id'): response for response in json_body}
+
+            missing_ids = [idx for idx in range(0, len(payload)) if idx not in responses]
+
+            if missing_ids:
+                # A missing response is not the same as an empty value
+                raise SubstrateRequestException('RPC batch response incomplete, no response for {} of {} calls'.format(
+                    len(missing_ids), len(payload)
+                ))
+
+            results += [responses[idx] for idx in range(0, len(payload))]
+
+        return results
+
+    def get_storage_item(self, module, storage_function):
+        for metadata_module in self.metadata_decoder.metadata.modules:
+            if metadata_module.name == module and metadata_module.storage:
+
+                # Storage backwards compt check
+                if isinstance(metadata_module.storage, list):
+                    storage_functions = metadata_module.storage
+                else:
+                    storage_functions = metadata_module.storage.items
+
+                for storage_item in storage_functions:
+                    if storage_item.name == storage_function:
+                        return metadata_module, storage_item
+
+        raise ValueError('Storage function "{}.{}" not found in metadata'.format(module, storage_function))
+
+    def encode_storage_param(self, scale_type, value):
+        param_obj = ScaleDecoder.get_decoder_class(scale_type)
+        return param_obj.encode(self.convert_storage_parameter(scale_type, value)).data
+
+    def generate_runtime_storage_key(self, module, storage_function, params=None):
+        """
+        Storage key of given storage function in current runtime (MetadataV10 and up); with its value type
+        :param module: e.g. Staking
+        :param storage_function: e.g. ErasStakers
+        :param params: list of params in decoded format
+        :return: tuple of hex storage key and value type string
+        """
+        metadata_module, storage_item = self.get_storage_item(module, storage_function)
+
+        params = params or []
+
+        storage_key = STORAGE_HASHERS['Twox128'](metadata_module.prefix.encode()) + \
+            STORAGE_HASHERS['Twox128'](storage_item.name.encode())
+
+        if 'PlainType' in storage_item.type:
+            if params:
+                raise ValueError('Storage call of type "PlainType" doesn\'t accept params')
+
+            return_scale_type = storage_item.type.get('PlainType')
+
+        elif 'MapType' in storage_item.type:
+            map_type = storage_item.type.get('MapType')
+
+            if len(params) != 1:
+                raise ValueError('Storage call of type "MapType" requires 1 parameter')
+
+            storage_key += STORAGE_HASHERS[map_type.get('hasher')](self.encode_storage_param(map_type['key'], params[0]))
+            return_scale_type = map_type.get('value')
+
+        elif 'DoubleMapType' in storage_item.type:
+            map_type = storage_item.type.get('DoubleMapType')
+
+            if len(params) != 2:
+                raise ValueError('Storage call of type "DoubleMapType" requires 2 parameters')
+
+            storage_key += STORAGE_HASHERS[map_type.get('hasher')](self.encode_storage_param(map_type['key1'], params[0]))
+            storage_key += STORAGE_HASHERS[map_type.get('key2Hasher')](
+                self.encode_storage_param(map_type['key2'], params[1])
+            )
+            return_scale_type = map_type.get('value')
+
+        else:
+            raise NotImplementedError("Storage type not implemented")
+
+        return '0x{}'.format(storage_key.hex()), return_scale_type
+
+    def generate_storage_prefix(self, module, storage_function):
+        metadata_module, storage_item = self.get_storage_item(module, storage_function)
+
+        return '0x{}'.format((
+            STORAGE_HASHERS['Twox128'](metadata_module.prefix.encode()) +
+            STORAGE_HASHERS['Twox128'](storage_item.name.encode())
+        ).hex())
+
+    def iter_storage_keys(self, prefix, block_hash, page_size=None):
+        """
+        Pages through all storage keys with given prefix using `state_getKeysPaged`
+        :param prefix: hex storage key prefix
+        :param block_hash:
+        :param page_size: defaults to RPC_STORAGE_PAGE_SIZE
+        :return: generator of lists of storage keys
+        """
+        page_size = page_size or settings.RPC_STORAGE_PAGE_SIZE
+        start_key = None
+
+        while True:
+            response = self.rpc_request('state_getKeysPaged', [prefix, page_size, start_key, block_hash])
+
+            if 'error' in response:
+                raise SubstrateRequestException(response['error'])
+
+            storage_keys = response.get('result') or []
+
+            if storage_keys:
+                yield storage_keys
+
+            if len(storage_keys) < page_size:
+                break
+
+            start_key = storage_keys[-1]
+
+    def query_storage_at(self, storage_keys, block_hash):
+        """
+        Retrieves raw values of given storage keys at given block with `state_queryStorageAt`, in batches of
+        RPC_STORAGE_PAGE_SIZE keys. Falls back to batched `state_getStorageAt` for nodes without this method
+        :param storage_keys: list of hex storage keys
+        :param block_hash:
+        :return: dict of storage key and hex value (None if not set)
+        """
+        page_size = settings.RPC_STORAGE_PAGE_SIZE
+        storage_keys = list(storage_keys)
+        values = {storage_key: None for storage_key in storage_keys}
+
+        responses = self.rpc_batch([
+            ('state_queryStorageAt', [storage_keys[offset:offset + page_size], block_hash])
+            for offset in range(0, len(storage_keys), page_size)
+        ])
+
+        if any('error' in response for response in responses):
+            responses = self.rpc_batch([('state_getStorageAt', [storage_key, block_hash]) for storage_key in storage_keys])
+
+            for storage_key, response in zip(storage_keys, responses):
+                if 'error' in response:
+                    raise SubstrateRequestException(response['error'])
+                values[storage_key] = response.get('result')
+
+            return values
+
+        for response in responses:
+            for change_set in response.get('result') or []:
+                for storage_key, value in change_set.get('changes', []):
+                    values[storage_key] = value
+
+        return values
+
+    def decode_storage_value(self, return_scale_type, value):
+        if not value:
+            return None
+
+        obj = ScaleDecoder.get_decoder_class(return_scale_type, ScaleBytes(value), metadata=self.metadata_decoder)
+        return obj.decode()
+
+    def get_runtime_state_batch(self, storage_calls, block_hash):
+        """
+        Retrieves multiple storage entries at given block in batched requests
+        :param storage_calls: list of tuples (module, storage_function, params)
+        :param block_hash:
+        :return: list of decoded values (None if not set) in order of provided storage calls
+        """
+        if self.block_hash != block_hash or not self.metadata_decoder:
+            self.init_runtime(block_hash=block_hash)
+
+        storage_keys = [
+            self.generate_runtime_storage_key(module, storage_function, params)
+            for module, storage_function, params in storage_calls
+        ]
+
+        responses = self.rpc_batch([('state_getStorageAt', [storage_key, block_hash]) for storage_key, _ in storage_keys])
+
+        results = []
+
+        for (storage_key, return_scale_type), response in zip(storage_keys, responses):
+            if 'error' in response:
+                raise SubstrateRequestException(response['error'])
+
+            results.append(self.decode_storage_value(return_scale_type, response.get('result')))
+
+        return results
@@ -0,0 +1,142 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  test_block_commit_batch.py
+
+import unittest
+
+from sqlalchemy.exc import IntegrityError
+
+from app.processors.converters import BlockCommitBatch, BlockAlreadyAdded
+
+
+class TransactionStub(object):
+    """ Session that keeps the blocks added in the current transaction apart from the committed blocks """
+
+    def __init__(self):
+        self.pending = []
+        self.committed = []
+        self.commit_count = 0
+        self.rollback_count = 0
+
+    def commit(self):
+        self.committed += self.pending
+        self.pending = []
+        self.commit_count += 1
+
+    def rollback(self):
+        self.pending = []
+        self.rollback_count += 1
+
+
+class HarvesterStub(object):
+
+    def __init__(self):
+        self.db_session = TransactionStub()
+        self.metadata_store = {'spec_version': 'metadata'}
+        # Block hashes of which the insert violates a constraint
+        self.conflicting = set()
+
+    def add_block(self, block_hash, prefetched_block=None):
+        if block_hash in self.db_session.committed or block_hash in self.db_session.pending:
+            raise BlockAlreadyAdded(block_hash)
+
+        if block_hash in self.conflicting:
+            raise IntegrityError('INSERT', {}, Exception('Duplicate entry'))
+
+        self.db_session.pending.append(block_hash)
+
+        return block_hash
+
+
+class BlockCommitBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.harvester = HarvesterStub()
+        self.batch = BlockCommitBatch(self.harvester, batch_size=3)
+
+    def add_blocks(self, *block_hashes):
+        for block_hash in block_hashes:
+            self.batch.add_block(block_hash)
+            self.batch.checkpoint()
+
+    def test_checkpoint_commits_full_batch(self):
+        self.add_blocks('0x01', '0x02')
+
+        self.assertEqual(self.harvester.db_session.commit_count, 0)
+        self.assertEqual(self.batch.block_hashes, ['0x01', '0x02'])
+
+        self.add_blocks('0x03', '0x04')
+
+        self.assertEqual(self.harvester.db_session.commit_count, 1)
+        self.assertEqual(self.harvester.db_session.committed, ['0x01', '0x02', '0x03'])
+        self.assertEqual(self.batch.block_hashes, ['0x04'])
+
+    def test_batch_size_at_least_one(self):
+        batch = BlockCommitBatch(self.harvester, batch_size=-1)
+
+        batch.add_block('0x01')
+        batch.checkpoint()
+
+        self.assertEqual(self.harvester.db_session.committed, ['0x01'])
+
+    def test_rollback_adds_other_blocks_again(self):
+        self.add_blocks('0x01', '0x02')
+
+        skipped = self.batch.rollback(failed_block_hash='0x02')
+
+        self.assertEqual(skipped, ['0x02'])
+        self.assertEqual(self.harvester.db_session.rollback_count, 1)
+        self.assertEqual(self.harvester.db_session.pending, ['0x01'])
+        self.assertEqual(self.batch.block_hashes, ['0x01'])
+        self.assertEqual(self.harvester.metadata_store, {})
+
+    def test_rollback_leaves_out_blocks_failing_on_retry(self):
+        self.add_blocks('0x01', '0x02')
+        self.harvester.conflicting.add('0x01')
+
+        skipped = self.batch.rollback()
+
+        self.assertEqual(skipped, ['0x01'])
+        self.assertEqual(self.harvester.db_session.rollback_count, 2)
+        self.assertEqual(self.harvester.db_session.pending, ['0x02'])
+        self.assertEqual(self.batch.block_hashes, ['0x02'])
+
+    def test_rollback_leaves_out_blocks_added_meanwhile(self):
+        self.add_blocks('0x01', '0x02')
+        self.harvester.db_session.committed.append('0x01')
+
+        skipped = self.batch.rollback(failed_block_hash='0x03')
+
+        self.assertEqual(skipped, ['0x03', '0x01'])
+        self.assertEqual(self.harvester.db_session.pending, ['0x02'])
+
+    def test_commit_latency(self):
+        self.assertEqual(self.batch.commit_latency(), {'commits': 0, 'avg': 0, 'max': 0})
+
+        self.add_blocks('0x01', '0x02', '0x03')
+        self.batch.commit()
+
+        commit_latency = self.batch.commit_latency()
+
+        self.assertEqual(commit_latency['commits'], 2)
+        self.assertGreaterEqual(commit_latency['max'], commit_latency['avg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  test_harvested_block_range.py
+
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.harvester import HarvestedBlockRange
+
+
+class HarvestedBlockRangeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        HarvestedBlockRange.__table__.create(engine)
+        self.session = sessionmaker(bind=engine)()
+
+    def tearDown(self):
+        self.session.close()
+
+    def get_ranges(self):
+        self.session.expire_all()
+        return [
+            (block_range.block_start, block_range.block_end)
+            for block_range in HarvestedBlockRange.query(self.session).order_by(HarvestedBlockRange.block_start)
+        ]
+
+    def add_ranges(self, *ranges):
+        for block_start, block_end in ranges:
+            self.session.add(HarvestedBlockRange(block_start=block_start, block_end=block_end))
+        self.session.flush()
+
+    def test_add_block_id_creates_range(self):
+        HarvestedBlockRange.add_block_id(self.session, 10)
+
+        self.assertEqual(self.get_ranges(), [(10, 10)])
+
+    def test_add_block_id_extends_range_downwards(self):
+        self.add_ranges((10, 20))
+
+        HarvestedBlockRange.add_block_id(self.session, 9)
+
+        self.assertEqual(self.get_ranges(), [(9, 20)])
+
+    def test_add_block_id_extends_range_upwards(self):
+        self.add_ranges((10, 20))
+
+        HarvestedBlockRange.add_block_id(self.session, 21)
+
+        self.assertEqual(self.get_ranges(), [(10, 21)])
+
+    def test_add_block_id_between_ranges_extends_one_range(self):
+        self.add_ranges((1, 9), (11, 20))
+
+        HarvestedBlockRange.add_block_id(self.session, 10)
+
+        # Ranges are merged by compact
+        self.assertEqual(self.get_ranges(), [(1, 9), (10, 20)])
+
+    def test_remove_only_block_id_of_range(self):
+        self.add_ranges((10, 10), (20, 30))
+
+        HarvestedBlockRange.remove_block_id(self.session, 10)
+
+        self.assertEqual(self.get_ranges(), [(20, 30)])
+
+    def test_remove_first_block_id_of_range(self):
+        self.add_ranges((10, 20))
+
+        HarvestedBlockRange.remove_block_id(self.session, 10)
+
+        self.assertEqual(self.get_ranges(), [(11, 20)])
+
+    def test_remove_last_block_id_of_range(self):
+        self.add_ranges((10, 20))
+
+        HarvestedBlockRange.remove_block_id(self.session, 20)
+
+        self.assertEqual(self.get_ranges(), [(10, 19)])
+
+    def test_remove_block_id_splits_range(self):
+        self.add_ranges((10, 20))
+
+        HarvestedBlockRange.remove_block_id(self.session, 15)
+
+        self.assertEqual(self.get_ranges(), [(10, 14), (16, 20)])
+
+    def test_remove_block_id_outside_ranges(self):
+        self.add_ranges((10, 20))
+
+        HarvestedBlockRange.remove_block_id(self.session, 25)
+
+        self.assertEqual(self.get_ranges(), [(10, 20)])
+
+    def test_compact_merges_adjacent_and_overlapping_ranges(self):
+        self.add_ranges((1, 9), (10, 20), (15, 25), (30, 40), (41, 41))
+
+        merged = HarvestedBlockRange.compact(self.session)
+
+        self.assertEqual(merged, 3)
+        self.assertEqual(self.get_ranges(), [(1, 25), (30, 41)])
+
+    def test_compact_keeps_separate_ranges(self):
+        self.add_ranges((1, 9), (11, 20))
+
+        self.assertEqual(HarvestedBlockRange.compact(self.session), 0)
+        self.assertEqual(self.get_ranges(), [(1, 9), (11, 20)])
+
+    def test_get_missing_ranges(self):
+        self.add_ranges((5, 9), (11, 20), (15, 25), (30, 40))
+
+        self.assertEqual(HarvestedBlockRange.get_missing_ranges(self.session), [
+            {'block_from': 26, 'block_to': 29},
+            {'block_from': 10, 'block_to': 10},
+            {'block_from': 1, 'block_to': 4}
+        ])
+
+    def test_add_and_remove_block_ids_match_harvested_blocks(self):
+        harvested = set()
+
+        for block_id in [50, 49, 48, 10, 11, 12, 30, 47, 13, 29, 31]:
+            HarvestedBlockRange.add_block_id(self.session, block_id)
+            harvested.add(block_id)
+
+        for block_id in [49, 12, 30]:
+            HarvestedBlockRange.remove_block_id(self.session, block_id)
+            harvested.remove(block_id)
+
+        HarvestedBlockRange.compact(self.session)
+
+        covered = set()
+        for block_start, block_end in self.get_ranges():
+            covered.update(range(block_start, block_end + 1))
+
+        self.assertEqual(covered, harvested)
+        self.assertEqual(self.get_ranges(), [(10, 11), (13, 13), (29, 29), (31, 31), (47, 48), (50, 50)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  test_market.py
+
+import datetime
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.data import MarketCandle, Trade
+from app.processors import market
+from app.processors.market import CandleEngine, get_candle_intervals, parse_interval
+
+BlockStub = namedtuple('BlockStub', ['id', 'datetime'])
+
+
+class SQLiteCandleEngine(CandleEngine):
+    """ Stores candles with the ORM, as the MySQL upsert of CandleEngine.store is not supported by SQLite """
+
+    @staticmethod
+    def store(db_session, interval, candles):
+        for (base, quote), candle in candles:
+            db_session.merge(MarketCandle(interval=interval, base=base, quote=quote, **candle.as_values()))
+        db_session.flush()
+
+
+class CandleIntervalTestCase(unittest.TestCase):
+
+    def test_parse_interval(self):
+        self.assertEqual(parse_interval('15m'), datetime.timedelta(minutes=15))
+        self.assertEqual(parse_interval('4h'), datetime.timedelta(hours=4))
+        self.assertEqual(parse_interval('1d'), datetime.timedelta(days=1))
+        self.assertEqual(parse_interval('1w'), datetime.timedelta(weeks=1))
+
+    def test_parse_invalid_interval(self):
+        for interval in ['', 'm', '0m', '-5m', '5s', 'xh']:
+            with self.assertRaises(ValueError):
+                parse_interval(interval)
+
+    def test_get_candle_intervals_shortest_first(self):
+        self.assertEqual(list(get_candle_intervals(['1d', ' 5m', '1h', '', '1m'])), ['1m', '5m', '1h', '1d'])
+
+    def test_get_bucket(self):
+        interval_length = parse_interval('15m')
+
+        self.assertEqual(
+            CandleEngine.get_bucket(datetime.datetime(2020, 5, 1, 12, 44, 59), interval_length),
+            datetime.datetime(2020, 5, 1, 12, 30)
+        )
+        self.assertEqual(
+            CandleEngine.get_bucket(
+                datetime.datetime(2020, 5, 1, 14, 44, tzinfo=datetime.timezone(datetime.timedelta(hours=2))),
+                interval_length
+            ),
+            datetime.datetime(2020, 5, 1, 12, 30)
+        )
+
+    def test_get_bucket_week_starts_on_monday(self):
+        # Friday 1 May 2020 is in the week of Monday 27 April 2020
+        self.assertEqual(
+            CandleEngine.get_bucket(datetime.datetime(2020, 5, 1, 12), parse_interval('1w')),
+            datetime.datetime(2020, 4, 27)
+        )
+
+    def test_get_rollup_source(self):
+        candle_engine = CandleEngine(['1m', '5m', '15m', '1h', '4h', '1d', '1w'])
+
+        self.assertIsNone(candle_engine.get_rollup_source('1m'))
+        self.assertEqual(candle_engine.get_rollup_source('5m'), '1m')
+        self.assertEqual(candle_engine.get_rollup_source('1h'), '15m')
+        self.assertEqual(candle_engine.get_rollup_source('1w'), '1d')
+
+    def test_get_rollup_source_divides_interval(self):
+        candle_engine = CandleEngine(['2m', '3m', '5m', '6m'])
+
+        self.assertEqual(candle_engine.get_rollup_source('6m'), '3m')
+        self.assertIsNone(candle_engine.get_rollup_source('5m'))
+
+
+class CandleEngineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        MarketCandle.__table__.create(engine)
+        Trade.__table__.create(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.addCleanup(self.session.close)
+
+        self.candle_engine = SQLiteCandleEngine(['5m', '15m', '1h'])
+
+    def add_candle(self, interval, time, open, high, low, close, base_amount, quote='USD'):
+        self.session.add(MarketCandle(
+            interval=interval, base='DOT', quote=quote, time=time, open=open, high=high, low=low, close=close,
+            base_amount=base_amount, quote_amount=base_amount * close
+        ))
+        self.session.flush()
+
+    def add_trade(self, block_id, event_idx, price, base_amount, quote='USD'):
+        self.session.add(Trade(
+            trade_hash='0x{:02x}{:02x}'.format(block_id, event_idx), block_id=block_id, extrinsic_idx=1,
+            event_idx=event_idx, base='DOT', quote=quote, buyer='01', seller='02', maker='01', taker='02',
+            otype=0, price=price, base_amount=base_amount, quote_amount=price * base_amount
+        ))
+        self.session.flush()
+
+    def get_candles(self, interval, quote='USD'):
+        return [
+            (candle.time, candle.open, candle.high, candle.low, candle.close, candle.base_amount)
+            for candle in MarketCandle.query(self.session).filter_by(
+                interval=interval, base='DOT', quote=quote
+            ).order_by(MarketCandle.time)
+        ]
+
+    def test_process_block(self):
+        self.add_trade(1, 1, price=10, base_amount=1)
+        self.add_trade(1, 2, price=12, base_amount=2)
+        self.add_trade(2, 1, price=8, base_amount=1)
+        self.add_trade(3, 1, price=9, base_amount=3)
+
+        self.candle_engine.process_block(self.session, BlockStub(1, datetime.datetime(2020, 5, 1, 12, 1)))
+        self.candle_engine.process_block(self.session, BlockStub(2, datetime.datetime(2020, 5, 1, 12, 4)))
+        self.candle_engine.process_block(self.session, BlockStub(3, datetime.datetime(2020, 5, 1, 12, 7)))
+
+        self.assertEqual(self.get_candles('5m'), [
+            (datetime.datetime(2020, 5, 1, 12, 0), 10, 12, 8, 8, 4),
+            (datetime.datetime(2020, 5, 1, 12, 5), 9, 9, 9, 9, 3)
+        ])
+        self.assertEqual(self.get_candles('1h'), [(datetime.datetime(2020, 5, 1, 12, 0), 10, 12, 8, 9, 7)])
+
+    def test_process_block_carries_forward_close(self):
+        self.add_trade(1, 1, price=10, base_amount=1)
+
+        self.candle_engine.process_block(self.session, BlockStub(1, datetime.datetime(2020, 5, 1, 12, 4)))
+        self.candle_engine.process_block(self.session, BlockStub(2, datetime.datetime(2020, 5, 1, 12, 6)))
+
+        self.assertEqual(self.get_candles('5m'), [
+            (datetime.datetime(2020, 5, 1, 12, 0), 10, 10, 10, 10, 1),
+            (datetime.datetime(2020, 5, 1, 12, 5), 10, 10, 10, 10, 0)
+        ])
+
+    def test_process_block_after_restart_continues_bucket(self):
+        self.add_trade(1, 1, price=10, base_amount=1)
+        self.add_trade(2, 1, price=11, base_amount=1)
+
+        self.candle_engine.process_block(self.session, BlockStub(1, datetime.datetime(2020, 5, 1, 12, 1)))
+
+        # New engine without in-memory state, as after a restart of the sequencer
+        candle_engine = SQLiteCandleEngine(['5m', '15m', '1h'])
+        candle_engine.process_block(self.session, BlockStub(2, datetime.datetime(2020, 5, 1, 12, 2)))
+
+        self.assertEqual(self.get_candles('5m'), [(datetime.datetime(2020, 5, 1, 12, 0), 10, 11, 10, 11, 2)])
+
+    def test_rollup(self):
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 0), 10, 12, 9, 11, 2)
+        # Carried forward close without trades doesn't change the roll-up
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 5), 11, 11, 11, 11, 0)
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 10), 11, 15, 7, 8, 3)
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 15), 8, 8, 6, 6, 1)
+        # Latest bucket is still incomplete and left to the sequencer
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 30), 6, 20, 6, 20, 1)
+
+        stored_count = self.candle_engine.rollup(self.session, '15m')
+
+        self.assertEqual(stored_count, 2)
+        self.assertEqual(self.get_candles('15m'), [
+            (datetime.datetime(2020, 5, 1, 12, 0), 10, 15, 7, 8, 5),
+            (datetime.datetime(2020, 5, 1, 12, 15), 8, 8, 6, 6, 1)
+        ])
+
+    def test_rollup_pairs_separately(self):
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 0), 10, 10, 10, 10, 1)
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 0), 20, 20, 20, 20, 1, quote='EUR')
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 5), 30, 30, 30, 30, 1, quote='EUR')
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 15), 10, 10, 10, 10, 1)
+
+        self.candle_engine.rollup(self.session, '15m')
+
+        self.assertEqual(self.get_candles('15m'), [(datetime.datetime(2020, 5, 1, 12, 0), 10, 10, 10, 10, 1)])
+        self.assertEqual(self.get_candles('15m', quote='EUR'), [(datetime.datetime(2020, 5, 1, 12, 0), 20, 30, 20, 30, 2)])
+
+    def test_rollup_time_from(self):
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 0), 10, 10, 10, 10, 1)
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 20), 11, 11, 11, 11, 1)
+        self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, 30), 12, 12, 12, 12, 1)
+
+        self.candle_engine.rollup(self.session, '15m', time_from=datetime.datetime(2020, 5, 1, 12, 25))
+
+        self.assertEqual(self.get_candles('15m'), [(datetime.datetime(2020, 5, 1, 12, 15), 11, 11, 11, 11, 1)])
+
+    def test_rollup_in_batches(self):
+        for minute in range(0, 60, 5):
+            self.add_candle('5m', datetime.datetime(2020, 5, 1, 12, minute), minute, minute, minute, minute, 1)
+
+        with mock.patch.object(market, 'ROLLUP_BATCH_SIZE', 2):
+            stored_count = self.candle_engine.rollup(self.session, '15m')
+
+        self.assertEqual(stored_count, 3)
+        self.assertEqual(self.get_candles('15m'), [
+            (datetime.datetime(2020, 5, 1, 12, 0), 0, 10, 0, 10, 3),
+            (datetime.datetime(2020, 5, 1, 12, 15), 15, 25, 15, 25, 3),
+            (datetime.datetime(2020, 5, 1, 12, 30), 30, 40, 30, 40, 3)
+        ])
+
+    def test_rollup_without_source_candles(self):
+        self.assertEqual(self.candle_engine.rollup(self.session, '15m'), 0)
+
+    def test_rollup_without_source_interval(self):
+        with self.assertRaises(ValueError):
+            self.candle_engine.rollup(self.session, '5m')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#  Polkascan PRE Harvester
+#
+#  Copyright 2018-2020 openAware BV (NL).
+#  This file is part of Polkascan.
+#
+#  Polkascan is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Polkascan is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Polkascan. If not, see <http://www.gnu.org/licenses/>.
+#
+#  test_prefetch.py
+
+import threading
+import time
+import unittest
+
+from app.processors.prefetch import BlockPrefetcher
+
+
+class NodeStub(object):
+    """ Serves blocks #0-#99 of a linear chain; requests of a block can be delayed to complete out of order """
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.lock = threading.Lock()
+        self.requested_block_ids = []
+
+    @staticmethod
+    def get_block_hash(block_id):
+        return '0x{:064x}'.format(block_id + 1)
+
+    def rpc_request(self, method, params):
+        if method == 'chain_getBlockHash':
+            block_id = params[0]
+
+            with self.lock:
+                self.requested_block_ids.append(block_id)
+
+            time.sleep(self.delays.get(block_id, 0))
+
+            return {'result': self.get_block_hash(block_id) if block_id < 100 else None}
+
+        if method == 'chain_getBlock':
+            block_id = int(params[0], 16) - 1
+
+            return {'result': {'block': {'header': {
+                'number': hex(block_id),
+                'parentHash': self.get_block_hash(block_id - 1) if block_id > 0 else '0x{:064x}'.format(0)
+            }}}}
+
+        if method == 'chain_getRuntimeVersion':
+            return {'result': {'specVersion': 1}}
+
+        if method == 'state_getStorageAt':
+            return {'result': '0x00'}
+
+        raise ValueError('Unexpected method {}'.format(method))
+
+
+class BlockPrefetcherTestCase(unittest.TestCase):
+
+    def get_prefetcher(self, node, depth):
+        prefetcher = BlockPrefetcher(depth=depth, workers=4, substrate=node)
+        self.addCleanup(prefetcher.close)
+        return prefetcher
+
+    def test_block_range_order(self):
+        # Earlier blocks complete later
+        node = NodeStub(delays={block_id: (20 - block_id) * 0.005 for block_id in range(10, 21)})
+        prefetcher = self.get_prefetcher(node, depth=4)
+
+        block_ids = [prefetched_block.block_id for prefetched_block in prefetcher.block_range(10, 20)]
+
+        self.assertEqual(block_ids, list(range(10, 21)))
+
+    def test_block_range_reverse_order(self):
+        node = NodeStub(delays={block_id: (block_id - 10) * 0.005 for block_id in range(10, 21)})
+        prefetcher = self.get_prefetcher(node, depth=4)
+
+        block_ids = [prefetched_block.block_id for prefetched_block in prefetcher.block_range(10, 20, reverse=True)]
+
+        self.assertEqual(block_ids, list(range(20, 9, -1)))
+
+    def test_block_range_content(self):
+        node = NodeStub()
+        prefetcher = self.get_prefetcher(node, depth=2)
+
+        prefetched_block = next(prefetcher.block_range(5, 5))
+
+        self.assertEqual(prefetched_block.block_hash, node.get_block_hash(5))
+        self.assertEqual(prefetched_block.parent_hash, node.get_block_hash(4))
+        self.assertEqual(prefetched_block.runtime_version, {'specVersion': 1})
+        self.assertEqual(prefetched_block.parent_runtime_version, {'specVersion': 1})
+        self.assertEqual(prefetched_block.events_data, '0x00')
+
+    def test_block_range_depth(self):
+        depth = 3
+        node = NodeStub()
+        prefetcher = self.get_prefetcher(node, depth=depth)
+
+        consumed = 0
+
+        for _ in prefetcher.block_range(0, 19):
+            consumed += 1
+
+            # Wait until the prefetch workers ran ahead as far as they are allowed to
+            deadline = time.time() + 5
+            while len(node.requested_block_ids) < min(consumed + depth, 20) and time.time() < deadline:
+                time.sleep(0.001)
+
+            with node.lock:
+                requested = len(node.requested_block_ids)
+
+            self.assertEqual(requested, min(consumed + depth, 20))
+
+        self.assertEqual(consumed, 20)
+        self.assertEqual(sorted(node.requested_block_ids), list(range(0, 20)))
+
+    def test_block_range_depth_at_least_one(self):
+        node = NodeStub()
+        prefetcher = self.get_prefetcher(node, depth=-1)
+
+        self.assertEqual(prefetcher.depth, 1)
+        self.assertEqual([prefetched_block.block_id for prefetched_block in prefetcher.block_range(0, 2)], [0, 1, 2])
+
+    def test_block_range_missing_block(self):
+        node = NodeStub()
+        prefetcher = self.get_prefetcher(node, depth=2)
+
+        with self.assertRaises(ValueError):
+            list(prefetcher.block_range(98, 101))
+
+
+if __name__ == '__main__':
+    unittest.main()